@@ -9,22 +9,54 @@ import os
 import sys
 import json
 import time
+import asyncio
+import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, List
 
 # 添加项目根目录到Python路径
 project_root = "/opt/RAG_Evidence4Organ"
 sys.path.insert(0, project_root)
 
-from Question_Distillation_v2.extractors.llm_extractor import LLMExtractor
+from Diag_Distillation.extractors.llm_extractor import LLMExtractor, create_http_client, create_async_http_client
 from Diag_Distillation.prompts.medical_prompts import DiagnosticExtractionPrompts
-from Diag_Distillation.process_worker import process_report_with_diagnostic_steps
+from Diag_Distillation.process_worker import (
+    aprocess_report_with_diagnostic_steps, parse_integrated_response, summarize_normalized, STEP_CONCURRENCY
+)
+from Diag_Distillation.processors.result_writer import write_json, write_files, write_file_atomic, dumps_json
+from Diag_Distillation.processors.batch_logger import get_batch_logger, flush_batch_logs
 from configs.system_config import MULTI_API_CONFIG
 
+logger = get_batch_logger("batch")
+
+def format_log_entries(entries) -> str:
+    """将 (时间戳, 级别, 消息) 日志条目格式化为文本，仅在写入日志文件时调用"""
+    return "\n".join(
+        f"[{datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')}] [{level}] {message}"
+        for ts, level, message in entries
+    )
+
+@lru_cache(maxsize=1024)
+def _read_report_file(report_path: str) -> str:
+    """读取报告文件内容 (按路径缓存，重试时不再重复打开文件)"""
+    with open(report_path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
 class BatchReportProcessor:
-    def __init__(self, api_key_name: str = "api_16"):
+    def __init__(self, api_key_name: str = "api_16", clean: bool = False, force: bool = False):
+        """
+        Args:
+            api_key_name: API密钥名称
+            clean: 启动时清空输出目录
+            force: 重新处理已完成的报告
+        """
         self.api_key_name = api_key_name
+        self.clean = clean
+        self.force = force
         self.setup_api()
         self.setup_output_dir()
         self.prompts = DiagnosticExtractionPrompts()
@@ -35,10 +67,21 @@ class BatchReportProcessor:
         if not api_config:
             raise ValueError(f"未找到API配置: {self.api_key_name}")
         
+        # 复用同一个HTTP客户端，保持TCP/TLS连接
+        self.http = create_http_client(pool_size=50)
+        
         self.extractor = LLMExtractor(
             model=api_config["model"],
             api_key=api_config["api_key"],
-            base_url=api_config["base_url"]
+            base_url=api_config["base_url"],
+            http_client=self.http,
+            config={
+                "cache_control": api_config.get("cache_control", False),
+                "json_mode": api_config.get("json_mode", True),
+            },
+            # 每次API调用都按该密钥的RPM/TPM上限限流，只在真正触及上限时等待
+            rpm=api_config.get("rpm", 500),
+            tpm=api_config.get("tpm")
         )
         print(f"✅ API初始化成功: {api_config['model']}")
     
@@ -46,8 +89,8 @@ class BatchReportProcessor:
         """设置输出目录"""
         self.output_dir = "/opt/RAG_Evidence4Organ/Diag_Distillation/output_test"
         
-        # 清理旧的输出目录
-        if os.path.exists(self.output_dir):
+        # 仅在显式要求时清理旧的输出目录，默认保留已完成的结果以便断点续跑
+        if self.clean and os.path.exists(self.output_dir):
             import shutil
             shutil.rmtree(self.output_dir)
             print(f"🗑️ 清理旧的输出目录: {self.output_dir}")
@@ -63,9 +106,7 @@ class BatchReportProcessor:
         """加载指定编号的报告"""
         report_path = f"/opt/RAG_Evidence4Organ/dataset/report_{report_num}.txt"
         try:
-            with open(report_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-            return content
+            return _read_report_file(report_path)
         except FileNotFoundError:
             print(f"❌ 报告文件不存在: {report_path}")
             return ""
@@ -73,24 +114,52 @@ class BatchReportProcessor:
             print(f"❌ 读取报告失败 {report_path}: {e}")
             return ""
     
-    def process_single_report(self, report_num: int) -> Dict[str, Any]:
-        """处理单个报告"""
+    def is_report_completed(self, report_num: int) -> bool:
+        """判断报告是否已成功处理过 (normalized文件存在且raw中没有失败标记；两者原子写入，raw最后写入)"""
+        normalized_file = os.path.join(self.output_dir, "normalized", f"report_{report_num}_normalized.json")
+        raw_file = os.path.join(self.output_dir, "raw", f"report_{report_num}_raw.json")
+        if not os.path.exists(normalized_file) or not os.path.exists(raw_file):
+            return False
+        try:
+            with open(raw_file, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except Exception:
+            return False
+        return not (isinstance(raw, dict) and raw.get("success") is False)
+    
+    def pending_reports(self, report_nums: List[int]) -> List[int]:
+        """跳过已完成的报告 (断点续跑)，force时全部保留"""
+        if self.force:
+            return report_nums
+        done = {n for n in report_nums if self.is_report_completed(n)}
+        if done:
+            print(f"⏭️ 跳过 {len(done)} 个已完成的报告")
+        return [n for n in report_nums if n not in done]
+    
+    async def process_single_report_async(self, report_num: int, api_semaphore: asyncio.Semaphore,
+                                          client=None) -> Dict[str, Any]:
+        """
+        异步处理单个报告 (在当前事件循环中直接await三步法流水线)
+        
+        Args:
+            api_semaphore: 所有报告共享的API并发请求上限
+            client: 所有报告共享的httpx.AsyncClient
+        """
         print(f"\n{'='*20} 处理报告 {report_num} {'='*20}")
         
         # 记录处理日志
-        log_entries = []
+        log_entries = deque(maxlen=10000)
         start_time = time.time()
         
         def log(message: str, level: str = "INFO"):
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            log_entry = f"[{timestamp}] [{level}] {message}"
-            log_entries.append(log_entry)
-            print(log_entry)
+            log_entries.append((time.time(), level, message))
+            logger.log(getattr(logging, level, logging.INFO), message)
         
         log(f"开始处理报告: report_{report_num}")
         
-        # 加载报告
-        report_content = self.load_report(report_num)
+        # 加载报告 (在线程池中读取文件，不阻塞其他报告的API请求)
+        loop = asyncio.get_running_loop()
+        report_content = await loop.run_in_executor(None, self.load_report, report_num)
         if not report_content:
             log(f"报告加载失败", "ERROR")
             return {
@@ -105,12 +174,14 @@ class BatchReportProcessor:
             # 处理报告
             log("开始诊断蒸馏处理...")
             
-            result = process_report_with_diagnostic_steps(
+            result = await aprocess_report_with_diagnostic_steps(
                 extractor=self.extractor,
                 report_data={"text": report_content},
                 report_num=f"report_{report_num}",
                 prompts=self.prompts,
-                api_key_name=self.api_key_name
+                api_key_name=self.api_key_name,
+                semaphore=api_semaphore,
+                client=client
             )
             
             processing_time = time.time() - start_time
@@ -123,21 +194,12 @@ class BatchReportProcessor:
                 log(f"处理成功完成 (耗时: {processing_time:.1f}秒)")
                 
                 # 安全检查: 确保normalized是列表类型
+                total_units, unique_organs = 0, set()
                 if isinstance(normalized, list):
                     log(f"标准化结果: {len(normalized)} 个条目")
                     
                     if normalized:
-                        total_units = sum(len(item.get('U_unit_set', [])) for item in normalized if isinstance(item, dict))
-                        unique_organs = set()
-                        for item in normalized:
-                            if isinstance(item, dict):
-                                for unit_wrapper in item.get('U_unit_set', []):
-                                    if isinstance(unit_wrapper, dict):
-                                        u_unit = unit_wrapper.get('u_unit', {})
-                                        if isinstance(u_unit, dict):
-                                            organ_name = u_unit.get('o_organ', {}).get('organName')
-                                            if organ_name:
-                                                unique_organs.add(organ_name)
+                        total_units, unique_organs = summarize_normalized(normalized)
                         
                         log(f"诊断单元总数: {total_units}")
                         log(f"涉及器官数: {len(unique_organs)}")
@@ -147,9 +209,7 @@ class BatchReportProcessor:
                     log(f"警告: 标准化结果类型异常: {type(normalized)}")
                     log(f"标准化结果内容: {normalized}")
                 
-                # 保存结果文件
-                self.save_results(report_num, result)
-                
+                # 结果文件由process_batch统一保存
                 return {
                     "success": True,
                     "report_num": report_num,
@@ -159,8 +219,8 @@ class BatchReportProcessor:
                     "log_entries": log_entries,
                     "statistics": {
                         "total_findings": len(normalized),
-                        "total_units": sum(len(item.get('U_unit_set', [])) for item in normalized),
-                        "unique_organs": len(unique_organs) if 'unique_organs' in locals() else 0
+                        "total_units": total_units,
+                        "unique_organs": len(unique_organs)
                     }
                 }
             else:
@@ -194,64 +254,151 @@ class BatchReportProcessor:
         
         try:
             if result["success"]:
-                # 保存raw结果
-                with open(raw_file, 'w', encoding='utf-8') as f:
-                    json.dump(result["raw"], f, ensure_ascii=False, indent=2)
-                
-                # 保存normalized结果
-                with open(normalized_file, 'w', encoding='utf-8') as f:
-                    json.dump(result["normalized"], f, ensure_ascii=False, indent=2)
-                
-                print(f"💾 结果已保存:")
-                print(f"   Raw: {raw_file}")
-                print(f"   Normalized: {normalized_file}")
+                raw, normalized = result["raw"], result["normalized"]
             else:
                 # 保存错误信息
-                error_info = {
+                raw = {
                     "success": False,
                     "error": result.get("error", "未知错误"),
                     "timestamp": datetime.now().isoformat()
                 }
-                
-                with open(raw_file, 'w', encoding='utf-8') as f:
-                    json.dump(error_info, f, ensure_ascii=False, indent=2)
-                
-                with open(normalized_file, 'w', encoding='utf-8') as f:
-                    json.dump([], f, ensure_ascii=False, indent=2)
-                
-                print(f"❌ 错误信息已保存:")
-                print(f"   Raw: {raw_file}")
-                print(f"   Normalized: {normalized_file}")
+                normalized = []
             
-            # 保存日志
-            with open(log_file, 'w', encoding='utf-8') as f:
-                f.write("\n".join(result["log_entries"]))
+            # normalized和raw原子写入，raw最后写入作为完成标记：中途被终止时不会留下
+            # "raw完整而normalized截断"的报告被断点续跑误判为已完成 (raw供程序读取，使用紧凑格式)
+            write_file_atomic(normalized_file, dumps_json(normalized))
+            write_file_atomic(raw_file, dumps_json(raw, indent=False))
+            write_files([(log_file, format_log_entries(result["log_entries"]).encode("utf-8"))])
             
+            if result["success"]:
+                print(f"💾 结果已保存:")
+            else:
+                print(f"❌ 错误信息已保存:")
+            print(f"   Raw: {raw_file}")
+            print(f"   Normalized: {normalized_file}")
             print(f"   Log: {log_file}")
             
         except Exception as e:
             print(f"❌ 保存结果失败: {e}")
     
-    def process_batch(self, start_num: int, end_num: int):
-        """批量处理报告"""
+    def submit_batch_api(self, report_nums: List[int], poll_interval: int = 60) -> Dict[str, Any]:
+        """
+        通过Batch API离线处理整批报告 (24h完成窗口，无需逐个实时调用)
+        
+        三步法的步骤之间存在依赖，无法放入同一批次，因此每个报告使用整合提示词单次调用。
+        请求体由提取器构建，模型参数和cache_control等设置与实时调用一致。
+        批次以任何终止状态结束时都处理已有的输出；执行失败或没有输出的报告保存为失败结果。
+        
+        Args:
+            report_nums: 报告编号列表 (已完成的报告除非force否则跳过)
+            poll_interval: 轮询批次状态的间隔(秒)
+            
+        Returns:
+            批次处理统计
+        """
+        report_nums = self.pending_reports(report_nums)
+        if not report_nums:
+            print("✅ 所有报告均已完成，无需处理")
+            return {"submitted": 0, "successful": 0, "failed": 0}
+        
+        # 并发预读所有报告，文件读取彼此重叠而不是逐个阻塞
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            report_contents = list(pool.map(self.load_report, report_nums))
+        
+        # 每个报告一个请求；整合提示词返回JSON数组，与实时路径一样不使用JSON模式
+        requests_list = []
+        failed = 0
+        for report_num, report_content in zip(report_nums, report_contents):
+            if not report_content:
+                failed += 1
+                self.save_results(report_num, {
+                    "success": False,
+                    "error": "报告加载失败",
+                    "log_entries": [(time.time(), "ERROR", "报告加载失败")]
+                })
+                continue
+            system_prompt, user_prompt = self.prompts.get_integrated_prompt_parts(report_content)
+            requests_list.append((f"report_{report_num}", user_prompt, system_prompt, None))
+        
+        if not requests_list:
+            return {"submitted": 0, "successful": 0, "failed": failed}
+        
+        batch_file = os.path.join(self.output_dir, "batch_input.jsonl")
+        batch_id = self.extractor.submit_batch(requests_list, jsonl_path=batch_file)
+        print(f"📝 批次请求文件已生成: {batch_file} ({len(requests_list)} 个报告)")
+        print(f"🚀 批次已提交: {batch_id}")
+        
+        batch = self.extractor.wait_for_batch(batch_id, poll_interval=poll_interval)
+        status = batch.get("status")
+        if status != "completed":
+            print(f"⚠️ 批次状态: {status}，处理已有的部分输出")
+        results = self.extractor.fetch_batch_results(batch)
+        
+        # 分发到各报告：错误文件中的请求和没有输出的请求都记为失败
+        successful = 0
+        for custom_id, _, _, _ in requests_list:
+            report_num = int(custom_id.split("_")[-1])
+            log_entries = [(time.time(), "INFO", f"Batch API结果: {batch_id} ({status})")]
+            result = results.get(custom_id) or {"success": False, "error": f"批次结束时没有该请求的输出: {status}"}
+            normalized = None
+            if result["success"]:
+                # 与process_worker的整合提示词路径使用同一解析：数组原样保留，单个对象按需包装为 s -> U 格式
+                normalized = parse_integrated_response(result["response"], f"整合提示词-{custom_id}")
+            
+            if not normalized:
+                failed += 1
+                error = result.get("error") or "整合提示词解析失败"
+                log_entries.append((time.time(), "ERROR", error))
+                self.save_results(report_num, {
+                    "success": False,
+                    "error": error,
+                    "log_entries": log_entries
+                })
+                continue
+            
+            successful += 1
+            self.save_results(report_num, {
+                "success": True,
+                "raw": {"source": "batch_api", "batch_id": batch_id, "response": result["response"]},
+                "normalized": normalized,
+                "log_entries": log_entries
+            })
+        
+        print(f"📊 批次处理完成: 成功 {successful}, 失败 {failed}")
+        return {"submitted": len(requests_list), "successful": successful, "failed": failed}
+    
+    def process_batch(self, start_num: int, end_num: int, max_in_flight: int = 4):
+        """批量处理报告 (asyncio并发，最多同时处理max_in_flight个报告，API请求共享同一个异步客户端和并发上限)"""
         print(f"🚀 开始批量处理报告")
         print(f"📊 处理范围: report_{start_num} - report_{end_num}")
         print(f"📁 输出目录: {self.output_dir}")
         print(f"🔑 API配置: {self.api_key_name}")
+        print(f"🧵 最大并发数: {max_in_flight}")
         print()
         
-        total_reports = end_num - start_num + 1
+        report_nums = self.pending_reports(list(range(start_num, end_num + 1)))
+        if not report_nums:
+            print("✅ 所有报告均已完成，无需处理")
+            return
+        total_reports = len(report_nums)
         successful = 0
         failed = 0
+        completed = 0
         batch_start_time = time.time()
         
-        for report_num in range(start_num, end_num + 1):
+        async def _run_one(report_num: int, report_semaphore: asyncio.Semaphore, api_semaphore: asyncio.Semaphore,
+                           client):
+            nonlocal successful, failed, completed
             try:
                 # 处理报告
-                result = self.process_single_report(report_num)
+                async with report_semaphore:
+                    result = await self.process_single_report_async(report_num, api_semaphore, client)
                 
-                # 保存结果
-                self.save_results(report_num, result)
+                # 保存结果 (在线程池中写盘，不阻塞其他报告的API请求)
+                await asyncio.get_running_loop().run_in_executor(None, self.save_results, report_num, result)
+                # 已落盘的大字段不再需要，尽早释放
+                result.pop("raw", None)
+                result.pop("normalized", None)
                 
                 if result["success"]:
                     successful += 1
@@ -260,13 +407,6 @@ class BatchReportProcessor:
                     failed += 1
                     print(f"❌ report_{report_num}: 处理失败 - {result.get('error', '未知错误')}")
                 
-                # 进度显示
-                progress = ((report_num - start_num + 1) / total_reports) * 100
-                print(f"📈 进度: {progress:.1f}% ({report_num - start_num + 1}/{total_reports})")
-                
-                # 简短休息避免API限制
-                time.sleep(1)
-                
             except Exception as e:
                 failed += 1
                 print(f"❌ report_{report_num}: 严重错误 - {e}")
@@ -275,9 +415,26 @@ class BatchReportProcessor:
                 error_result = {
                     "success": False,
                     "error": str(e),
-                    "log_entries": [f"[{datetime.now()}] [ERROR] 严重错误: {e}"]
+                    "log_entries": [(time.time(), "ERROR", f"严重错误: {e}")]
                 }
                 self.save_results(report_num, error_result)
+            
+            # 进度显示
+            completed += 1
+            progress = (completed / total_reports) * 100
+            print(f"📈 进度: {progress:.1f}% ({completed}/{total_reports})")
+        
+        async def _gather():
+            report_semaphore = asyncio.Semaphore(max_in_flight)
+            # 同一API密钥的请求数上限由所有报告共享，而不是每个报告各自一份
+            api_semaphore = asyncio.Semaphore(STEP_CONCURRENCY)
+            async with create_async_http_client(STEP_CONCURRENCY) as client:
+                tasks = [asyncio.create_task(_run_one(report_num, report_semaphore, api_semaphore, client))
+                         for report_num in report_nums]
+                await asyncio.gather(*tasks, return_exceptions=True)
+        
+        asyncio.run(_gather())
+        flush_batch_logs()
         
         # 批量处理总结
         total_time = time.time() - batch_start_time
@@ -312,22 +469,36 @@ class BatchReportProcessor:
         }
         
         summary_file = os.path.join(self.output_dir, "batch_summary.json")
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, ensure_ascii=False, indent=2)
+        write_json(summary_file, summary)
         
         print(f"📋 批量摘要已保存: {summary_file}")
 
 def main():
     """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='医学报告批量处理')
+    parser.add_argument('--start', type=int, default=10061, help='起始报告编号')
+    parser.add_argument('--end', type=int, default=10070, help='结束报告编号')
+    parser.add_argument('--api', type=str, default='api_16', help='API密钥')
+    parser.add_argument('--batch-api', action='store_true', help='通过Batch API离线提交 (24h完成窗口)')
+    parser.add_argument('--clean', action='store_true', help='清空输出目录后重新开始')
+    parser.add_argument('--force', action='store_true', help='重新处理已完成的报告')
+    
+    args = parser.parse_args()
+    
     print("🏥 医学报告批量处理系统")
     print("=" * 80)
     
     try:
         # 初始化处理器
-        processor = BatchReportProcessor(api_key_name="api_16")
+        processor = BatchReportProcessor(api_key_name=args.api, clean=args.clean, force=args.force)
         
-        # 批量处理报告10061-10070
-        processor.process_batch(start_num=10061, end_num=10070)
+        if args.batch_api:
+            processor.submit_batch_api(list(range(args.start, args.end + 1)))
+        else:
+            # 批量处理报告
+            processor.process_batch(start_num=args.start, end_num=args.end, max_in_flight=4)
         
     except Exception as e:
         print(f"❌ 系统初始化失败: {e}")
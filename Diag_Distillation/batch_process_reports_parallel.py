@@ -9,39 +9,72 @@ import os
 import sys
 import json
 import time
+import asyncio
+import itertools
+import logging
 import traceback
-import threading
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from queue import Queue
 
 # 添加项目根目录到Python路径
 project_root = "/opt/RAG_Evidence4Organ"
 sys.path.insert(0, project_root)
 
-from Question_Distillation_v2.extractors.llm_extractor import LLMExtractor
+from Diag_Distillation.extractors.llm_extractor import LLMExtractor, create_http_client, create_async_http_client
 from Diag_Distillation.prompts.medical_prompts import DiagnosticExtractionPrompts
-from Diag_Distillation.process_worker import process_report_with_diagnostic_steps
+from Diag_Distillation.process_worker import aprocess_report_with_diagnostic_steps, summarize_normalized, STEP_CONCURRENCY
+from Diag_Distillation.processors.result_writer import write_json, write_files, write_file_atomic, dumps_json
+from Diag_Distillation.processors.batch_logger import get_batch_logger, flush_batch_logs
 from configs.system_config import MULTI_API_CONFIG
 
+logger = get_batch_logger("batch.parallel")
+
+@lru_cache(maxsize=1024)
+def _load_report_text(report_num: int) -> str:
+    """加载报告数据 (按报告编号缓存，重试时不再重复读取文件)"""
+    dataset_dir = "/opt/RAG_Evidence4Organ/dataset"
+    
+    # 尝试加载txt文件
+    txt_file = os.path.join(dataset_dir, f"report_{report_num}.txt")
+    if os.path.exists(txt_file):
+        with open(txt_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    # 尝试加载json文件
+    json_file = os.path.join(dataset_dir, f"report_{report_num}.json")
+    if os.path.exists(json_file):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            return data.get('text', '') or data.get('medical_record_content', '')
+    
+    raise FileNotFoundError(f"报告 {report_num} 不存在 (txt或json)")
+
 class ParallelBatchReportProcessor:
-    def __init__(self, api_keys: List[str] = None):
+    def __init__(self, api_keys: List[str] = None, clean: bool = False, force: bool = False):
+        """
+        Args:
+            api_keys: 参与并行处理的API密钥列表
+            clean: 启动时清空输出目录
+            force: 重新处理已完成的报告
+        """
         if api_keys is None:
             api_keys = ["api_13", "api_14", "api_15", "api_16", "api_12"]
         
         self.api_keys = api_keys
+        self.clean = clean
+        self.force = force
         self.setup_apis()
         self.setup_output_dir()
         self.prompts = DiagnosticExtractionPrompts()
         
-        # 线程安全的结果存储
-        self.results_lock = threading.Lock()
-        self.processing_results = {}
-        
     def setup_apis(self):
         """初始化所有API"""
         self.extractors = {}
+        
+        # 所有API共享同一个HTTP客户端，跨报告和密钥复用TCP/TLS连接
+        self.http = create_http_client(pool_size=50)
+        
         for api_key in self.api_keys:
             try:
                 if api_key not in MULTI_API_CONFIG:
@@ -52,7 +85,15 @@ class ParallelBatchReportProcessor:
                 extractor = LLMExtractor(
                     model=api_config["model"],
                     api_key=api_config["api_key"],
-                    base_url=api_config["base_url"]
+                    base_url=api_config["base_url"],
+                    http_client=self.http,
+                    config={
+                        "cache_control": api_config.get("cache_control", False),
+                        "json_mode": api_config.get("json_mode", True),
+                    },
+                    # 每次API调用都按该密钥的RPM/TPM上限限流
+                    rpm=api_config.get("rpm", 500),
+                    tpm=api_config.get("tpm")
                 )
                 
                 self.extractors[api_key] = extractor
@@ -70,8 +111,8 @@ class ParallelBatchReportProcessor:
         """设置输出目录"""
         self.output_dir = "/opt/RAG_Evidence4Organ/Diag_Distillation/output_test"
         
-        # 清理旧的输出目录
-        if os.path.exists(self.output_dir):
+        # 仅在显式要求时清理旧的输出目录，默认保留已完成的结果以便断点续跑
+        if self.clean and os.path.exists(self.output_dir):
             import shutil
             shutil.rmtree(self.output_dir)
             print(f"🗑️ 清理旧的输出目录: {self.output_dir}")
@@ -84,38 +125,40 @@ class ParallelBatchReportProcessor:
         
     def load_report(self, report_num: int) -> str:
         """加载报告数据"""
-        dataset_dir = "/opt/RAG_Evidence4Organ/dataset"
-        
-        # 尝试加载txt文件
-        txt_file = os.path.join(dataset_dir, f"report_{report_num}.txt")
-        if os.path.exists(txt_file):
-            with open(txt_file, 'r', encoding='utf-8') as f:
-                return f.read()
-        
-        # 尝试加载json文件
-        json_file = os.path.join(dataset_dir, f"report_{report_num}.json")
-        if os.path.exists(json_file):
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('text', '') or data.get('medical_record_content', '')
-        
-        raise FileNotFoundError(f"报告 {report_num} 不存在 (txt或json)")
+        return _load_report_text(report_num)
     
-    def process_single_report(self, report_num: int, api_key: str) -> Dict[str, Any]:
-        """处理单个报告"""
+    def is_report_completed(self, report_num: int) -> bool:
+        """判断报告是否已成功处理过 (normalized文件存在且raw中没有失败标记；两者原子写入，raw最后写入)"""
+        normalized_file = os.path.join(self.output_dir, "normalized", f"report_{report_num}_normalized.json")
+        raw_file = os.path.join(self.output_dir, "raw", f"report_{report_num}_raw.json")
+        if not os.path.exists(normalized_file) or not os.path.exists(raw_file):
+            return False
+        try:
+            with open(raw_file, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except Exception:
+            return False
+        return not (isinstance(raw, dict) and raw.get("success") is False)
+    
+    async def process_single_report_async(self, report_num: int, api_key: str, client=None) -> Dict[str, Any]:
+        """
+        异步处理单个报告 (在当前事件循环中直接await三步法流水线)
+        
+        Args:
+            api_key: 处理该报告的API密钥，请求数受该密钥共享的并发上限约束
+            client: 所有报告共享的httpx.AsyncClient
+        """
+        loop = asyncio.get_running_loop()
         
-        def log(message: str):
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_message = f"[{timestamp}] [INFO] {message}"
-            print(f"[{api_key}] {log_message}")
-            return log_message
+        def log(message: str, level: str = "INFO"):
+            logger.log(getattr(logging, level, logging.INFO), f"[{api_key}] {message}")
         
         try:
             start_time = time.time()
             log(f"开始处理报告: report_{report_num}")
             
-            # 加载报告
-            report_text = self.load_report(report_num)
+            # 加载报告 (在线程池中读取文件，不阻塞其他报告的API请求)
+            report_text = await loop.run_in_executor(None, self.load_report, report_num)
             log(f"报告加载成功: {len(report_text)} 字符")
             
             # 准备报告数据
@@ -129,8 +172,9 @@ class ParallelBatchReportProcessor:
             
             # 处理报告
             extractor = self.extractors[api_key]
-            result = process_report_with_diagnostic_steps(
-                extractor, report_data, report_num, self.prompts, api_key
+            result = await aprocess_report_with_diagnostic_steps(
+                extractor, report_data, report_num, self.prompts, api_key,
+                semaphore=self.api_sems[api_key], client=client
             )
             
             if not result:
@@ -145,21 +189,12 @@ class ParallelBatchReportProcessor:
             log(f"处理成功完成 (耗时: {processing_time:.1f}秒)")
             
             # 安全检查: 确保normalized是列表类型
+            total_units, unique_organs = 0, set()
             if isinstance(normalized, list):
                 log(f"标准化结果: {len(normalized)} 个条目")
                 
                 if normalized:
-                    total_units = sum(len(item.get('U_unit_set', [])) for item in normalized if isinstance(item, dict))
-                    unique_organs = set()
-                    for item in normalized:
-                        if isinstance(item, dict):
-                            for unit_wrapper in item.get('U_unit_set', []):
-                                if isinstance(unit_wrapper, dict):
-                                    u_unit = unit_wrapper.get('u_unit', {})
-                                    if isinstance(u_unit, dict):
-                                        organ_name = u_unit.get('o_organ', {}).get('organName')
-                                        if organ_name:
-                                            unique_organs.add(organ_name)
+                    total_units, unique_organs = summarize_normalized(normalized)
                     
                     log(f"诊断单元总数: {total_units}")
                     log(f"涉及器官数: {len(unique_organs)}")
@@ -170,22 +205,22 @@ class ParallelBatchReportProcessor:
                 log(f"标准化结果内容: {normalized}")
             
             # 保存结果文件
-            self.save_results(report_num, result, api_key)
+            await loop.run_in_executor(None, self.save_results, report_num, result, api_key)
             
             return {
                 "success": True,
                 "report_num": report_num,
                 "api_key": api_key,
                 "processing_time": processing_time,
-                "total_units": sum(len(item.get('U_unit_set', [])) for item in normalized if isinstance(item, dict) and isinstance(normalized, list)),
-                "unique_organs": list(unique_organs) if isinstance(normalized, list) else [],
+                "total_units": total_units,
+                "unique_organs": list(unique_organs),
                 "log_messages": []
             }
             
         except Exception as e:
             error_msg = f"处理过程出错: {str(e)}"
-            log(f"ERROR] {error_msg}")
-            log(f"ERROR] 错误详情: {traceback.format_exc()}")
+            log(error_msg, "ERROR")
+            log(f"错误详情: {traceback.format_exc()}", "ERROR")
             
             # 保存错误信息
             error_result = {
@@ -193,7 +228,8 @@ class ParallelBatchReportProcessor:
                 "error": error_msg,
                 "timestamp": datetime.now().isoformat()
             }
-            self.save_results(report_num, {"raw": error_result, "normalized": []}, api_key)
+            await loop.run_in_executor(None, self.save_results, report_num, {"raw": error_result, "normalized": []},
+                                       api_key)
             
             return {
                 "success": False,
@@ -206,27 +242,27 @@ class ParallelBatchReportProcessor:
     def save_results(self, report_num: int, result: Dict[str, Any], api_key: str):
         """保存处理结果"""
         try:
-            # 保存原始结果
             raw_file = f"{self.output_dir}/raw/report_{report_num}_raw.json"
-            with open(raw_file, 'w', encoding='utf-8') as f:
-                json.dump(result.get("raw", {}), f, ensure_ascii=False, indent=2)
-            
-            # 保存标准化结果
             normalized_file = f"{self.output_dir}/normalized/report_{report_num}_normalized.json"
-            with open(normalized_file, 'w', encoding='utf-8') as f:
-                json.dump(result.get("normalized", []), f, ensure_ascii=False, indent=2)
-            
-            # 创建简单的日志文件
             log_file = f"{self.output_dir}/logs/report_{report_num}_log.txt"
-            with open(log_file, 'w', encoding='utf-8') as f:
-                f.write(f"Report: {report_num}\n")
-                f.write(f"API: {api_key}\n")
-                f.write(f"Timestamp: {datetime.now().isoformat()}\n")
-                if result.get("raw", {}).get("success", True):
-                    f.write("Status: Success\n")
-                else:
-                    f.write("Status: Failed\n")
-                    f.write(f"Error: {result.get('raw', {}).get('error', 'Unknown')}\n")
+            
+            # 创建简单的日志内容
+            log_lines = [
+                f"Report: {report_num}",
+                f"API: {api_key}",
+                f"Timestamp: {datetime.now().isoformat()}"
+            ]
+            if result.get("raw", {}).get("success", True):
+                log_lines.append("Status: Success")
+            else:
+                log_lines.append("Status: Failed")
+                log_lines.append(f"Error: {result.get('raw', {}).get('error', 'Unknown')}")
+            
+            # normalized和raw原子写入，raw最后写入作为完成标记：中途被终止时不会留下
+            # "raw完整而normalized截断"的报告被断点续跑误判为已完成 (raw供程序读取，使用紧凑格式)
+            write_file_atomic(normalized_file, dumps_json(result.get("normalized", [])))
+            write_file_atomic(raw_file, dumps_json(result.get("raw", {}), indent=False))
+            write_files([(log_file, ("\n".join(log_lines) + "\n").encode("utf-8"))])
             
             print(f"[{api_key}] 💾 结果已保存:")
             print(f"[{api_key}]    Raw: {raw_file}")
@@ -241,71 +277,79 @@ class ParallelBatchReportProcessor:
         if max_workers is None:
             max_workers = len(self.extractors)
         
+        # 总并发由max_workers个名额限制；每个API密钥的上限向上取整，名额总能分配到有空闲槽位的密钥
+        per_key_concurrency = -(-max_workers // len(self.extractors))
+        
         print("🚀 开始并行批量处理报告")
         print("=" * 80)
         print(f"📊 处理范围: report_{start_num} - report_{end_num}")
         print(f"📁 输出目录: {self.output_dir}")
         print(f"🔗 可用API: {list(self.extractors.keys())}")
-        print(f"🧵 最大并发数: {max_workers}")
+        print(f"🧵 最大并发数: {max_workers} (每个API {per_key_concurrency})")
         print()
         
         # 准备报告任务
         report_nums = list(range(start_num, end_num + 1))
-        api_queue = Queue()
         
-        # 将API密钥放入队列，实现负载均衡
-        for api_key in self.extractors.keys():
-            api_queue.put(api_key)
+        # 跳过已完成的报告 (断点续跑)
+        if not self.force:
+            done = {n for n in report_nums if self.is_report_completed(n)}
+            if done:
+                print(f"⏭️ 跳过 {len(done)} 个已完成的报告")
+                report_nums = [n for n in report_nums if n not in done]
+        if not report_nums:
+            print("✅ 所有报告均已完成，无需处理")
+            return
         
         start_time = time.time()
         completed_count = 0
         success_count = 0
         failed_count = 0
         
-        # 使用线程池执行并行处理
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 创建任务映射
-            future_to_report = {}
-            
-            for report_num in report_nums:
-                # 从队列中获取API密钥
-                if not api_queue.empty():
-                    api_key = api_queue.get()
-                else:
-                    # 如果队列为空，使用第一个API
-                    api_key = list(self.extractors.keys())[0]
-                
-                future = executor.submit(self.process_single_report, report_num, api_key)
-                future_to_report[future] = (report_num, api_key)
+        async def worker(report_num: int, slots: asyncio.Semaphore, client):
+            nonlocal completed_count, success_count, failed_count
             
-            # 处理完成的任务
-            for future in as_completed(future_to_report):
-                report_num, api_key = future_to_report[future]
+            async with slots:
+                # 拿到总并发名额后，至少有一个API有空闲槽位；按轮询顺序选择第一个空闲的API
+                for _ in range(len(self.key_sems)):
+                    api_key = next(self._key_iter)
+                    if not self.key_sems[api_key].locked():
+                        break
                 
-                try:
-                    result = future.result()
-                    completed_count += 1
-                    
-                    if result["success"]:
-                        success_count += 1
-                        print(f"✅ [{api_key}] report_{report_num}: 处理成功")
-                    else:
+                async with self.key_sems[api_key]:
+                    try:
+                        result = await self.process_single_report_async(report_num, api_key, client)
+                        completed_count += 1
+                        
+                        if result["success"]:
+                            success_count += 1
+                            print(f"✅ [{api_key}] report_{report_num}: 处理成功")
+                        else:
+                            failed_count += 1
+                            print(f"❌ [{api_key}] report_{report_num}: 处理失败 - {result.get('error', 'Unknown')}")
+                        
+                        # 显示进度
+                        progress = (completed_count / len(report_nums)) * 100
+                        print(f"📈 进度: {progress:.1f}% ({completed_count}/{len(report_nums)})")
+                        print()
+                        
+                    except Exception as e:
                         failed_count += 1
-                        print(f"❌ [{api_key}] report_{report_num}: 处理失败 - {result.get('error', 'Unknown')}")
-                    
-                    # 将API密钥放回队列
-                    api_queue.put(api_key)
-                    
-                    # 显示进度
-                    progress = (completed_count / len(report_nums)) * 100
-                    print(f"📈 进度: {progress:.1f}% ({completed_count}/{len(report_nums)})")
-                    print()
-                    
-                except Exception as e:
-                    failed_count += 1
-                    print(f"❌ [{api_key}] report_{report_num}: 执行异常 - {e}")
-                    # 将API密钥放回队列
-                    api_queue.put(api_key)
+                        print(f"❌ [{api_key}] report_{report_num}: 执行异常 - {e}")
+        
+        async def _gather():
+            self.key_sems = {k: asyncio.Semaphore(per_key_concurrency) for k in self.extractors}
+            # 同一API密钥的请求数上限由该密钥处理的所有报告共享
+            self.api_sems = {k: asyncio.Semaphore(STEP_CONCURRENCY) for k in self.extractors}
+            self._key_iter = itertools.cycle(self.key_sems)
+            slots = asyncio.Semaphore(max_workers)
+            async with create_async_http_client(STEP_CONCURRENCY * len(self.extractors)) as client:
+                tasks = [asyncio.create_task(worker(report_num, slots, client)) for report_num in report_nums]
+                await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # 使用asyncio并发执行，文件读写在线程池中运行
+        asyncio.run(_gather())
+        flush_batch_logs()
         
         # 生成最终总结
         total_time = time.time() - start_time
@@ -344,8 +388,7 @@ class ParallelBatchReportProcessor:
         }
         
         summary_file = f"{self.output_dir}/batch_summary.json"
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, ensure_ascii=False, indent=2)
+        write_json(summary_file, summary)
         
         print(f"📋 批量摘要已保存: {summary_file}")
 
@@ -5,13 +5,92 @@ LLM提取器
 用于调用大语言模型进行医学信息提取
 """
 
+import re
 import json
 import time
+import copy
+import asyncio
+import hashlib
+import contextlib
+import itertools
+import functools
+import threading
 import requests
 import os
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple, Iterator, AsyncIterator
 from loguru import logger
 
+try:
+    import httpx
+    try:
+        import h2  # noqa: F401  httpx的HTTP/2支持依赖h2
+        _HTTP2 = True
+    except ImportError:
+        _HTTP2 = False
+except ImportError:
+    httpx = None
+    _HTTP2 = False
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+try:
+    import orjson
+    _json_loads = orjson.loads  # 直接解析bytes；orjson.JSONDecodeError继承自json.JSONDecodeError
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# 非JSON响应的字段提取：一次扫描全文，中文字段名映射到标准字段
+_FIELD_RE = re.compile(
+    r'["\']?(?P<field>disease_symptom|specific_part|organ|confidence|evidence|症状|疾病|器官|部位|置信度|证据)["\']?'
+    r'\s*[:：]\s*(?P<val>[^\n]+)',
+    re.IGNORECASE
+)
+_FIELD_ALIASES = {
+    "症状": "disease_symptom",
+    "疾病": "disease_symptom",
+    "器官": "organ",
+    "部位": "specific_part",
+    "置信度": "confidence",
+    "证据": "evidence",
+}
+
+# 多病例合并请求：追加在专科system提示词之后的输出格式说明，以及单次请求的病例数/字符数上限
+PACKED_RESPONSE_INSTRUCTION = (
+    "\n\nThe user message contains several cases, each introduced by a CASE_<n>: header. "
+    "Extract each case independently and return ONLY one JSON object that maps every case label "
+    "to its JSON array of extractions, e.g. {\"CASE_1\": [...], \"CASE_2\": [...]}. "
+    "Use an empty array for a case without findings."
+)
+PACK_SIZE = 8
+MAX_PACK_CHARS = 12000
+
+# TPM限流时按请求体字节数估算token数 (约4字节/token，无需调用分词器)
+BYTES_PER_TOKEN = 4
+
+# JSON模式：要求服务端只返回一个合法的JSON对象 (仅用于期望单个JSON对象的提示词，JSON数组不适用)
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+# Batch API：请求文件中每行的目标路径、完成时限、轮询间隔和终止状态
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INTERVAL = 60
+BATCH_TERMINAL_STATUSES = frozenset(("completed", "failed", "expired", "cancelled"))
+
+# 提取结果缓存：内存LRU容量与磁盘缓存过期时间
+MEMORY_CACHE_SIZE = 1024
+DISK_CACHE_EXPIRE = 7 * 86400
+# 提示词版本：计入所有缓存键，修改提示词或解析逻辑后递增即可使旧缓存整体失效
+PROMPT_VERSION = "1"
+
 
 
 # 导入提示词系统
@@ -19,11 +98,35 @@ import sys
 project_root = "/opt/RAG_Evidence4Organ"
 sys.path.insert(0, project_root)
 from Question_Distillation_v2.prompts.medical_prompts import MedicalExtractionPrompts, get_prompt_by_specialty
+from Diag_Distillation.extractors.rate_limiter import TokenBucket, decorrelated_jitter, parse_retry_after
+from configs.model_config import ALLOWED_ORGANS, is_allowed_organ
+
+# 器官白名单集合，O(1)成员判断；不在集合中的名称再交给is_allowed_organ判断 (可能包含别名等规则)
+_ALLOWED_ORGAN_SET = frozenset(ALLOWED_ORGANS)
+_REQUIRED_FIELDS = ("disease_symptom", "organ", "specific_part")
+
+# 各专科的system提示词只构建一次
+_specialty_system_prompt = functools.lru_cache(maxsize=None)(get_prompt_by_specialty)
+
+
+def cached_prompt_tokens(usage: Dict[str, Any]) -> int:
+    """
+    从usage中读取命中服务端前缀缓存的输入token数
+    (OpenAI: prompt_tokens_details.cached_tokens; DeepSeek: prompt_cache_hit_tokens; Anthropic: cache_read_input_tokens)
+    """
+    if not usage:
+        return 0
+    details = usage.get("prompt_tokens_details") or {}
+    return (details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens")
+            or usage.get("cache_read_input_tokens") or 0)
+
 
 class LLMExtractor:
     """LLM提取器类"""
     
-    def __init__(self, model: str, api_key: str, base_url: str, config: Dict[str, Any] = None):
+    def __init__(self, model: str, api_key: str, base_url: str, config: Dict[str, Any] = None, http_client=None,
+                 endpoints: List[Dict[str, Any]] = None, prewarm: bool = True,
+                 rpm: float = None, tpm: float = None):
         """
         初始化LLM提取器
         
@@ -31,18 +134,95 @@ class LLMExtractor:
             model: 要使用的模型名称 (e.g., "deepseek-chat")
             api_key: API密钥
             base_url: API的基础URL
-            config: 其他配置参数
+            config: 其他配置参数 (与默认配置合并，只需提供要覆盖的项)
+            http_client: 共享的HTTP客户端 (create_http_client创建的httpx.Client或requests.Session)，
+                         多个提取器复用同一连接池；未提供时创建独立的客户端
+            endpoints: 可选的多端点列表，每项包含api_key、base_url和可选的rpm/tpm；
+                       请求在端点间轮询，单个密钥触及限流时自动切换到其他端点
+            prewarm: 是否在后台预先建立到各端点的HTTPS连接 (首个请求无需等待TCP/TLS握手)
+            rpm: 未提供endpoints时，该密钥每分钟请求数上限
+            tpm: 未提供endpoints时，该密钥每分钟token数上限
         """
         self.model_name = model # 直接使用传入的model名
         self.api_key = api_key
         self.base_url = base_url
-        self.config = config or self._get_default_config()
+        self.config = {**self._get_default_config(), **(config or {})}
+        self._owns_http = http_client is None
+        self.http = http_client if http_client is not None else create_http_client()
+        self._http_is_httpx = httpx is not None and isinstance(self.http, httpx.Client)
+        # 请求头在实例生命周期内不变，只构建一次
+        self._headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # 端点轮询：每个端点独立令牌桶限流，返回429的端点在冷却期内跳过
+        if not endpoints:
+            endpoints = [{"api_key": api_key, "base_url": base_url, "rpm": rpm, "tpm": tpm}]
+        self._endpoints = [self._make_endpoint(ep) for ep in endpoints]
+        self._endpoint_cycle = itertools.cycle(self._endpoints)
+        self._endpoint_lock = threading.Lock()
+        
+        # 预先获得的API响应 (如Batch API结果)，按响应缓存键查询，不受LRU容量限制
+        self._preloaded_responses = {}
+        
+        # 两级结果缓存：内存LRU + 磁盘 (需安装diskcache)
+        self._memory_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._disk_cache = None
+        # 磁盘缓存跨运行保留，需设置环境变量 LLM_CACHE=1 显式开启
+        # (默认关闭：修改提示词或解析逻辑而未更新PROMPT_VERSION时，不会重放旧的响应)
+        if diskcache is not None and os.environ.get("LLM_CACHE") == "1":
+            cache_dir = os.environ.get("DIAG_CACHE_DIR", "/tmp/diag_cache")
+            try:
+                self._disk_cache = diskcache.Cache(cache_dir, size_limit=10 << 30)
+            except Exception as e:
+                logger.warning(f"磁盘缓存初始化失败，仅使用内存缓存: {e}")
         
         if not self.api_key:
             logger.warning(f"未提供 API 密钥")
         if not self.base_url:
             logger.warning(f"未提供 base_url")
+        elif prewarm:
+            threading.Thread(target=self._prewarm, daemon=True).start()
+    
+    def close(self):
+        """关闭提取器自己创建的HTTP客户端连接池 (共享的http_client由创建方负责关闭)"""
+        if self._owns_http:
+            self.http.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def _prewarm_urls(self) -> List[str]:
+        """需要预热连接的端点地址 (去重)"""
+        return list(dict.fromkeys(ep["base_url"] for ep in self._endpoints if ep["base_url"]))
+    
+    def _prewarm(self):
+        """对各端点发送HEAD请求，使keep-alive连接提前进入连接池；失败不影响后续请求"""
+        for url in self._prewarm_urls():
+            try:
+                self.http.head(url, timeout=5)
+            except Exception as e:
+                logger.debug(f"连接预热失败 ({url}): {e}")
+    
+    async def _aprewarm(self, client):
+        """异步客户端的连接预热"""
+        for url in self._prewarm_urls():
+            try:
+                await client.head(url, timeout=5)
+            except Exception as e:
+                logger.debug(f"连接预热失败 ({url}): {e}")
 
+    def _post(self, url: str, headers: Dict[str, str], body: bytes):
+        """发送已序列化的POST请求 (httpx.Client使用content=，requests.Session使用data=)"""
+        if self._http_is_httpx:
+            return self.http.post(url, headers=headers, content=body, timeout=self.config["timeout"])
+        return self.http.post(url, headers=headers, data=body, timeout=self.config["timeout"])
+    
     def _load_api_key(self) -> str:
         # This method is no longer primary, but can be kept as a fallback.
         # For simplicity in this fix, we assume direct passing of keys.
@@ -57,55 +237,153 @@ class LLMExtractor:
             "timeout": 60,
             "retry_times": 3,
             "delay": 2.0,
-            "retry_delay": 5.0
+            "retry_delay": 5.0,
+            # 为system消息加上cache_control标记 (Anthropic等需要显式声明缓存断点的服务)；
+            # OpenAI/DeepSeek会自动缓存相同的前缀，无需开启
+            "cache_control": False,
+            # 调用方传入response_format时是否发送给服务端 (不支持JSON模式的服务关闭即可)
+            "json_mode": True,
+            # 不读取磁盘缓存中已有的结果 (新结果仍写入，刷新缓存)；本次运行内的内存缓存和预加载响应不受影响
+            "refresh_cache": False
         }
     
-    def call_deepseek_api(self, prompt: str) -> Dict[str, Any]:
+    def _build_messages(self, prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """构建消息列表；静态的system提示词放在最前面，便于服务端前缀缓存命中"""
+        messages = []
+        if system_prompt:
+            if self.config.get("cache_control"):
+                messages.append({"role": "system", "content": [
+                    {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+                ]})
+            else:
+                messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    @staticmethod
+    def _make_endpoint(endpoint: Dict[str, Any]) -> Dict[str, Any]:
+        """构建端点状态 (请求头、RPM/TPM限流器、冷却截止时间)"""
+        rpm = endpoint.get("rpm")
+        tpm = endpoint.get("tpm")
+        return {
+            "base_url": endpoint["base_url"],
+            "headers": {
+                "Authorization": f"Bearer {endpoint['api_key']}",
+                "Content-Type": "application/json"
+            },
+            "limiter": TokenBucket(rpm, 60) if rpm else None,
+            "token_limiter": TokenBucket(tpm, 60) if tpm else None,
+            "cold_until": 0.0
+        }
+    
+    @staticmethod
+    def _acquire(endpoint: Dict[str, Any], tokens: float):
+        """按端点的RPM和TPM限流，只在真正触及上限时等待"""
+        if endpoint["limiter"] is not None:
+            endpoint["limiter"].acquire()
+        if endpoint["token_limiter"] is not None:
+            endpoint["token_limiter"].acquire(tokens)
+    
+    @staticmethod
+    async def _aacquire(endpoint: Dict[str, Any], tokens: float):
+        """异步版本的_acquire"""
+        if endpoint["limiter"] is not None:
+            await endpoint["limiter"].acquire_async()
+        if endpoint["token_limiter"] is not None:
+            await endpoint["token_limiter"].acquire_async(tokens)
+    
+    def _next_endpoint(self) -> Dict[str, Any]:
+        """按轮询顺序选择下一个未处于冷却期的端点；全部冷却时选择最早恢复的端点"""
+        with self._endpoint_lock:
+            now = time.monotonic()
+            for _ in range(len(self._endpoints)):
+                endpoint = next(self._endpoint_cycle)
+                if endpoint["cold_until"] <= now:
+                    return endpoint
+            return min(self._endpoints, key=lambda ep: ep["cold_until"])
+    
+    def _cool_down(self, endpoint: Dict[str, Any], seconds: float) -> bool:
+        """将触及限流的端点标记为冷却，返回是否还有其他可立即使用的端点"""
+        with self._endpoint_lock:
+            now = time.monotonic()
+            endpoint["cold_until"] = now + seconds
+            return any(ep["cold_until"] <= now for ep in self._endpoints)
+    
+    def _build_chat_payload(self, prompt: str, system_prompt: Optional[str] = None,
+                            response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建OpenAI兼容的chat/completions请求参数"""
+        payload = {
+            "model": self.model_name, # 直接使用初始化时传入的模型名称
+            "messages": self._build_messages(prompt, system_prompt),
+            "max_tokens": self.config["max_tokens"],
+            "temperature": self.config["temperature"],
+            "top_p": self.config["top_p"],
+            "stream": False
+        }
+        if response_format and self.config.get("json_mode", True):
+            payload["response_format"] = response_format
+        return payload
+    
+    def _build_deepseek_body(self, prompt: str, system_prompt: Optional[str] = None,
+                             response_format: Optional[Dict[str, Any]] = None) -> bytes:
+        """构建DeepSeek (OpenAI兼容) 请求体并序列化为UTF-8字节 (每次调用只序列化一次，重试时复用)"""
+        return _json_dumps(self._build_chat_payload(prompt, system_prompt, response_format))
+    
+    def _deepseek_target(self, endpoint: Dict[str, Any] = None):
+        """返回请求的 (url, headers)"""
+        if endpoint is None:
+            return f"{self.base_url}/chat/completions", self._headers
+        return f"{endpoint['base_url']}/chat/completions", endpoint["headers"]
+    
+    def _next_retry_delay(self, previous: float, response=None) -> float:
+        """计算下一次重试前的等待时间：429/503优先遵循Retry-After，否则使用去相关抖动退避"""
+        if response is not None and response.status_code in (429, 503):
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        return decorrelated_jitter(previous, self.config.get("retry_delay", 5.0))
+    
+    @staticmethod
+    def _is_retryable_status(status_code: int) -> bool:
+        """4xx中只有429(限流)和408(超时)值得重试，其余属于请求本身的问题"""
+        return status_code >= 500 or status_code in (408, 429)
+    
+    def call_deepseek_api(self, prompt: str, system_prompt: Optional[str] = None,
+                          response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """调用DeepSeek API"""
         retry_times = self.config.get("retry_times", 3)
         retry_delay = self.config.get("retry_delay", 5.0)
         
+        body = self._build_deepseek_body(prompt, system_prompt, response_format)
+        est_tokens = len(body) // BYTES_PER_TOKEN
+        delay = retry_delay
         for attempt in range(retry_times):
             try:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                data = {
-                    "model": self.model_name, # 直接使用初始化时传入的模型名称
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ],
-                    "max_tokens": self.config["max_tokens"],
-                    "temperature": self.config["temperature"],
-                    "top_p": self.config["top_p"],
-                    "stream": False
-                }
-                
-                api_url = f"{self.base_url}/chat/completions"
+                endpoint = self._next_endpoint()
+                self._acquire(endpoint, est_tokens)
+                api_url, headers = self._deepseek_target(endpoint)
                 
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=data,
-                    timeout=self.config["timeout"]
-                )
+                response = self._post(api_url, headers, body)
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = _json_loads(response.content)
+                    usage = result.get("usage", {})
+                    logger.debug(f"前缀缓存命中token数: {cached_prompt_tokens(usage)}")
                     return {
                         "success": True,
                         "response": result["choices"][0]["message"]["content"],
-                        "usage": result.get("usage", {}),
+                        "usage": usage,
                         "model": self.model_name # 返回正确的模型名
                     }
                 else:
                     error_msg = f"DeepSeek API调用失败: {response.status_code} - {response.text}"
-                    if attempt < retry_times - 1:
-                        logger.warning(f"第{attempt + 1}次尝试失败: {error_msg}, {retry_delay}秒后重试...")
-                        import time
-                        time.sleep(retry_delay)
+                    if attempt < retry_times - 1 and self._is_retryable_status(response.status_code):
+                        delay = self._next_retry_delay(delay, response)
+                        if response.status_code == 429 and self._cool_down(endpoint, delay):
+                            logger.warning(f"第{attempt + 1}次尝试被限流，切换到其他端点重试...")
+                            continue
+                        logger.warning(f"第{attempt + 1}次尝试失败: {error_msg}, {delay:.1f}秒后重试...")
+                        time.sleep(delay)
                         continue
                     else:
                         return {
@@ -117,9 +395,9 @@ class LLMExtractor:
             except Exception as e:
                 error_msg = str(e)
                 if attempt < retry_times - 1:
-                    logger.warning(f"第{attempt + 1}次尝试异常: {error_msg}, {retry_delay}秒后重试...")
-                    import time
-                    time.sleep(retry_delay)
+                    delay = self._next_retry_delay(delay)
+                    logger.warning(f"第{attempt + 1}次尝试异常: {error_msg}, {delay:.1f}秒后重试...")
+                    time.sleep(delay)
                     continue
                 else:
                     logger.error(f"DeepSeek API调用异常: {error_msg}")
@@ -180,33 +458,21 @@ class LLMExtractor:
                 "response": None
             }
     
-    def call_openai_api(self, prompt: str) -> Dict[str, Any]:
+    def call_openai_api(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
         """调用OpenAI API"""
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             data = {
                 "model": "gpt-3.5-turbo",
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
+                "messages": self._build_messages(prompt, system_prompt),
                 "max_tokens": self.config["max_tokens"],
                 "temperature": self.config["temperature"],
                 "top_p": self.config["top_p"]
             }
             
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=self.config["timeout"]
-            )
+            response = self._post("https://api.openai.com/v1/chat/completions", self._headers, _json_dumps(data))
             
             if response.status_code == 200:
-                result = response.json()
+                result = _json_loads(response.content)
                 return {
                     "success": True,
                     "response": result["choices"][0]["message"]["content"],
@@ -228,12 +494,327 @@ class LLMExtractor:
                 "response": None
             }
     
-    def call_api(self, prompt: str) -> Dict[str, Any]:
-        """主API调用方法"""
+    def call_api(self, prompt: str, system_prompt: Optional[str] = None, use_cache: bool = True,
+                 response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        主API调用方法
+        
+        Args:
+            use_cache: 是否使用响应缓存 (提示词完全相同时直接返回之前成功的响应，不再调用API)
+            response_format: 结构化输出格式，如JSON_OBJECT_FORMAT (服务端保证返回可解析的JSON)
+        """
+        key = self._response_cache_key(prompt, system_prompt, response_format) if use_cache else None
+        if key is not None:
+            cached = self._response_cache_get(key)
+            if cached is not None:
+                return cached
         # 简化: 当前只支持 openai 兼容的接口
-        return self.call_deepseek_api(prompt)
+        result = self.call_deepseek_api(prompt, system_prompt, response_format)
+        if key is not None:
+            self._cache_set(key, result)
+        return result
+    
+    def submit_batch(self, requests_list: List[Tuple[str, str, Optional[str], Optional[Dict[str, Any]]]],
+                     jsonl_path: str = None) -> str:
+        """
+        通过Batch API提交一批请求 (上传JSONL请求文件后创建batch任务)
+        
+        Args:
+            requests_list: [(custom_id, prompt, system_prompt, response_format), ...]
+            jsonl_path: 可选，同时把请求文件保存到该路径
+        
+        Returns:
+            batch任务ID
+        """
+        lines = [
+            _json_dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": self._build_chat_payload(prompt, system_prompt, response_format)
+            })
+            for custom_id, prompt, system_prompt, response_format in requests_list
+        ]
+        content = b"\n".join(lines) + b"\n"
+        if jsonl_path:
+            with open(jsonl_path, "wb") as f:
+                f.write(content)
+        
+        auth = {"Authorization": self._headers["Authorization"]}
+        response = self.http.post(
+            f"{self.base_url}/files", headers=auth, data={"purpose": "batch"},
+            files={"file": ("requests.jsonl", content, "application/jsonl")}, timeout=self.config["timeout"]
+        )
+        response.raise_for_status()
+        file_id = _json_loads(response.content)["id"]
+        
+        response = self._post(f"{self.base_url}/batches", self._headers, _json_dumps({
+            "input_file_id": file_id,
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": BATCH_COMPLETION_WINDOW
+        }))
+        response.raise_for_status()
+        batch_id = _json_loads(response.content)["id"]
+        logger.info(f"已提交Batch任务 {batch_id}: {len(requests_list)} 个请求")
+        return batch_id
+    
+    def wait_for_batch(self, batch_id: str, poll_interval: float = BATCH_POLL_INTERVAL) -> Dict[str, Any]:
+        """轮询batch任务直到进入终止状态，返回任务对象"""
+        while True:
+            response = self.http.get(f"{self.base_url}/batches/{batch_id}", headers=self._headers,
+                                     timeout=self.config["timeout"])
+            response.raise_for_status()
+            batch = _json_loads(response.content)
+            status = batch.get("status")
+            if status in BATCH_TERMINAL_STATUSES:
+                logger.info(f"Batch任务 {batch_id} 结束: {status} | {batch.get('request_counts', {})}")
+                return batch
+            logger.info(f"Batch任务 {batch_id} 状态: {status}，{poll_interval}秒后重新查询")
+            time.sleep(poll_interval)
+    
+    def fetch_batch_results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        下载batch任务的输出文件和错误文件，按custom_id返回与call_api相同格式的结果
+        任何终止状态 (包括expired/cancelled) 都读取已有的部分输出；执行失败的请求返回success为False的结果，
+        批次结束时仍未执行的请求不在结果中
+        """
+        results = {}
+        # 先读错误文件，同一custom_id在输出文件中的结果优先
+        for file_key in ("error_file_id", "output_file_id"):
+            file_id = batch.get(file_key)
+            if not file_id:
+                continue
+            response = self.http.get(f"{self.base_url}/files/{file_id}/content", headers=self._headers,
+                                     timeout=self.config["timeout"])
+            response.raise_for_status()
+            for line in response.content.splitlines():
+                if not line.strip():
+                    continue
+                item = _json_loads(line)
+                results[item["custom_id"]] = self._batch_item_result(item)
+        return results
+    
+    def _batch_item_result(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """把batch输出/错误文件中的一行转换为call_api格式的结果"""
+        reply = item.get("response") or {}
+        body = reply.get("body") or {}
+        if reply.get("status_code") == 200:
+            try:
+                return {
+                    "success": True,
+                    "response": body["choices"][0]["message"]["content"],
+                    "usage": body.get("usage", {}),
+                    "model": self.model_name
+                }
+            except (KeyError, IndexError, TypeError):
+                pass
+        error = item.get("error") or body.get("error") or f"HTTP {reply.get('status_code')}"
+        if isinstance(error, dict):
+            error = error.get("message") or str(error)
+        return {
+            "success": False,
+            "error": f"Batch请求失败: {error}",
+            "response": None
+        }
+    
+    def preload_responses(self, entries: List[Tuple[str, Optional[str], Optional[Dict[str, Any]], Dict[str, Any]]]):
+        """
+        预加载已获得的响应：之后相同提示词和response_format的call_api/acall_api直接返回该结果，不再发送请求
+        
+        Args:
+            entries: [(prompt, system_prompt, response_format, result), ...]，只保留成功的结果
+        """
+        for prompt, system_prompt, response_format, result in entries:
+            if result.get("success"):
+                key = self._response_cache_key(prompt, system_prompt, response_format)
+                self._preloaded_responses[key] = result
+    
+    def clear_preloaded_responses(self):
+        """清空预加载的响应"""
+        self._preloaded_responses.clear()
+    
+    async def acall_api(self, prompt: str, system_prompt: Optional[str] = None, client=None,
+                        use_cache: bool = True, response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        异步API调用方法
+        传入httpx.AsyncClient时直接异步发送请求，否则在线程池中执行同步的call_api
+        """
+        if client is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, functools.partial(self.call_api, prompt, system_prompt, use_cache, response_format)
+            )
+        key = self._response_cache_key(prompt, system_prompt, response_format) if use_cache else None
+        if key is not None:
+            cached = self._response_cache_get(key)
+            if cached is not None:
+                return cached
+        result = await self._acall_deepseek_api(client, prompt, system_prompt, response_format)
+        if key is not None:
+            self._cache_set(key, result)
+        return result
+    
+    async def _acall_deepseek_api(self, client, prompt: str, system_prompt: Optional[str] = None,
+                                  response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """异步调用DeepSeek API (重试逻辑与call_deepseek_api一致)"""
+        retry_times = self.config.get("retry_times", 3)
+        retry_delay = self.config.get("retry_delay", 5.0)
+        
+        body = self._build_deepseek_body(prompt, system_prompt, response_format)
+        est_tokens = len(body) // BYTES_PER_TOKEN
+        delay = retry_delay
+        for attempt in range(retry_times):
+            response = None
+            endpoint = self._next_endpoint()
+            try:
+                await self._aacquire(endpoint, est_tokens)
+                api_url, headers = self._deepseek_target(endpoint)
+                response = await client.post(api_url, headers=headers, content=body, timeout=self.config["timeout"])
+                
+                if response.status_code == 200:
+                    result = _json_loads(response.content)
+                    usage = result.get("usage", {})
+                    logger.debug(f"前缀缓存命中token数: {cached_prompt_tokens(usage)}")
+                    return {
+                        "success": True,
+                        "response": result["choices"][0]["message"]["content"],
+                        "usage": usage,
+                        "model": self.model_name
+                    }
+                error_msg = f"DeepSeek API调用失败: {response.status_code} - {response.text}"
+            except Exception as e:
+                error_msg = str(e)
+            
+            retryable = response is None or self._is_retryable_status(response.status_code)
+            if attempt < retry_times - 1 and retryable:
+                delay = self._next_retry_delay(delay, response)
+                if response is not None and response.status_code == 429 and self._cool_down(endpoint, delay):
+                    logger.warning(f"第{attempt + 1}次尝试被限流，切换到其他端点重试...")
+                    continue
+                logger.warning(f"第{attempt + 1}次尝试失败: {error_msg}, {delay:.1f}秒后重试...")
+                await asyncio.sleep(delay)
+            else:
+                logger.error(f"DeepSeek API调用异常: {error_msg}")
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "response": None
+                }
+        
+        return {
+            "success": False,
+            "error": "所有重试都失败了",
+            "response": None
+        }
+    
+    def _build_extraction_prompt_parts(self, text: str, specialty: str) -> Tuple[str, str]:
+        """构建医学信息提取的 (system, user) 提示词：专科指令作为system，病例文本原样作为user，不再拼接长字符串"""
+        return _specialty_system_prompt(specialty), text
+    
+    def _build_extraction_result(self, result: Dict[str, Any], case_id: str, specialty: str) -> Dict[str, Any]:
+        """将API调用结果转换为提取结果"""
+        if not result["success"]:
+            return {
+                "case_id": case_id,
+                "success": False,
+                "error": result["error"],
+                "extractions": [],
+                "specialty": specialty
+            }
+        
+        # 解析响应
+        extractions = self._parse_response(result["response"])
+        
+        return {
+            "case_id": case_id,
+            "success": True,
+            "extractions": extractions,
+            "specialty": specialty,
+            "usage": result.get("usage", {}),
+            "model": result.get("model", self.model_name)
+        }
     
-    def extract_medical_info(self, text: str, case_id: str = "", specialty: str = "general") -> Dict[str, Any]:
+    def _cache_key(self, text: str, specialty: str) -> bytes:
+        """根据模型、专科和文本计算缓存键 (分段写入哈希，不拼接长字符串；使用16字节原始摘要)"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(PROMPT_VERSION.encode("utf-8"))
+        h.update(b"|")
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"|")
+        h.update(specialty.encode("utf-8"))
+        h.update(b"|")
+        h.update(text.encode("utf-8"))
+        return h.digest()
+    
+    def _response_cache_key(self, prompt: str, system_prompt: Optional[str],
+                            response_format: Optional[Dict[str, Any]] = None) -> bytes:
+        """
+        根据模型、完整提示词和实际发送的response_format计算API响应缓存键
+        (person参数区分命名空间，不与提取结果缓存键冲突；JSON模式与非JSON模式的响应不共用缓存)
+        """
+        h = hashlib.blake2b(digest_size=16, person=b"api_response")
+        h.update(PROMPT_VERSION.encode("utf-8"))
+        h.update(b"|")
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"|")
+        h.update((system_prompt or "").encode("utf-8"))
+        h.update(b"|")
+        h.update(prompt.encode("utf-8"))
+        if response_format and self.config.get("json_mode", True):
+            h.update(b"|")
+            h.update(_json_dumps(response_format))
+        return h.digest()
+    
+    def _cache_lookup(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """依次查询内存LRU和磁盘缓存，返回缓存中的原始对象 (refresh_cache时跳过磁盘缓存)"""
+        with self._cache_lock:
+            cached = self._memory_cache.get(key)
+            if cached is not None:
+                self._memory_cache.move_to_end(key)
+        if cached is None and self._disk_cache is not None and not self.config.get("refresh_cache"):
+            cached = self._disk_cache.get(key)
+            if cached is not None:
+                self._memory_cache_put(key, cached)
+        return cached
+    
+    def _cache_get(self, key: bytes, case_id: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，命中时返回带当前case_id的结果副本"""
+        cached = self._cache_lookup(key)
+        if cached is None:
+            return None
+        result = copy.deepcopy(cached)
+        result["case_id"] = case_id
+        return result
+    
+    def _response_cache_get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """查询预加载的响应和API响应缓存，命中时返回副本"""
+        cached = self._preloaded_responses.get(key)
+        if cached is None:
+            cached = self._cache_lookup(key)
+        return copy.deepcopy(cached) if cached is not None else None
+    
+    def _memory_cache_put(self, key: bytes, result: Dict[str, Any]):
+        """写入内存LRU缓存，超出容量时淘汰最久未使用的条目"""
+        with self._cache_lock:
+            self._memory_cache[key] = result
+            self._memory_cache.move_to_end(key)
+            if len(self._memory_cache) > MEMORY_CACHE_SIZE:
+                self._memory_cache.popitem(last=False)
+    
+    def _cache_set(self, key: bytes, result: Dict[str, Any]):
+        """只缓存成功的结果"""
+        if not result.get("success"):
+            return
+        result = copy.deepcopy(result)
+        self._memory_cache_put(key, result)
+        if self._disk_cache is not None:
+            try:
+                self._disk_cache.set(key, result, expire=DISK_CACHE_EXPIRE)
+            except Exception as e:
+                logger.warning(f"写入磁盘缓存失败: {e}")
+    
+    def extract_medical_info(self, text: str, case_id: str = "", specialty: str = "general",
+                             use_cache: bool = True) -> Dict[str, Any]:
         """
         提取医学信息
         
@@ -241,38 +822,26 @@ class LLMExtractor:
             text: 医学文本
             case_id: 病例ID
             specialty: 专科类型
+            use_cache: 是否使用结果缓存 (相同模型、专科和文本直接返回缓存结果)
             
         Returns:
             提取结果
         """
         try:
-            # 获取对应的提示词
-            prompt = get_prompt_by_specialty(specialty)
-            full_prompt = prompt + f"\n\nMedical Text:\n{text}\n\nPlease extract relevant information:"
+            key = self._cache_key(text, specialty) if use_cache else None
+            if key is not None:
+                cached = self._cache_get(key, case_id)
+                if cached is not None:
+                    return cached
             
-            # 调用API
-            result = self.call_api(full_prompt)
-            
-            if not result["success"]:
-                return {
-                    "case_id": case_id,
-                    "success": False,
-                    "error": result["error"],
-                    "extractions": [],
-                    "specialty": specialty
-                }
-            
-            # 解析响应
-            extractions = self._parse_response(result["response"])
-            
-            return {
-                "case_id": case_id,
-                "success": True,
-                "extractions": extractions,
-                "specialty": specialty,
-                "usage": result.get("usage", {}),
-                "model": result.get("model", self.model_name)
-            }
+            # 调用API (提示词中静态的专科指令在前、病例文本在后，便于服务端前缀缓存命中)
+            system_prompt, prompt = self._build_extraction_prompt_parts(text, specialty)
+            # 提取结果已按病例文本缓存，无需再缓存原始响应
+            result = self.call_api(prompt, system_prompt=system_prompt, use_cache=False)
+            extraction = self._build_extraction_result(result, case_id, specialty)
+            if key is not None:
+                self._cache_set(key, extraction)
+            return extraction
             
         except Exception as e:
             logger.error(f"提取医学信息异常: {str(e)}")
@@ -285,81 +854,70 @@ class LLMExtractor:
             }
     
     def _parse_response(self, response_text: str) -> List[Dict[str, Any]]:
-        """解析API响应"""
+        """解析API响应：先整体解析JSON，失败时截取最外层的[...]再解析，最后才按非JSON格式提取"""
         try:
-            # 清理响应文本，移除多余的空行和注释
             cleaned_text = response_text.strip()
             
-            # 尝试直接解析JSON
-            if cleaned_text.startswith("["):
-                # 找到第一个完整的JSON数组
-                import re
-                json_pattern = r'^\[.*?\]'
-                match = re.search(json_pattern, cleaned_text, re.DOTALL)
-                if match:
-                    json_str = match.group()
-                    return json.loads(json_str)
-                else:
-                    return json.loads(cleaned_text)
-            elif cleaned_text.startswith("{"):
-                # 找到第一个完整的JSON对象
-                import re
-                json_pattern = r'^\{.*?\}'
-                match = re.search(json_pattern, cleaned_text, re.DOTALL)
-                if match:
-                    json_str = match.group()
-                    return [json.loads(json_str)]
-                else:
-                    return [json.loads(cleaned_text)]
-            
-            # 尝试提取JSON部分
-            import re
-            json_pattern = r'\[.*?\]'
-            match = re.search(json_pattern, cleaned_text, re.DOTALL)
+            # 快速路径：响应本身就是JSON
+            try:
+                parsed = _json_loads(cleaned_text)
+                if isinstance(parsed, list):
+                    return parsed
+                if isinstance(parsed, dict):
+                    return [parsed]
+            except json.JSONDecodeError:
+                pass
             
-            if match:
-                json_str = match.group()
-                return json.loads(json_str)
+            # 响应中夹杂了说明文字或代码块标记时，截取第一个"["到最后一个"]"之间的部分
+            start = cleaned_text.find("[")
+            end = cleaned_text.rfind("]")
+            if start != -1 and end > start:
+                try:
+                    return _json_loads(cleaned_text[start:end + 1])
+                except json.JSONDecodeError as e:
+                    logger.warning(f"JSON解析失败: {str(e)}")
             
             # 如果都失败，尝试解析非标准格式
             return self._parse_non_json_response(cleaned_text)
             
-        except json.JSONDecodeError as e:
-            logger.warning(f"JSON解析失败: {str(e)}")
-            return self._parse_non_json_response(cleaned_text)
         except Exception as e:
             logger.error(f"响应解析异常: {str(e)}")
             return []
     
+    @staticmethod
+    def _parse_packed_response(response_text: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """解析多病例合并请求的响应 ({"CASE_1": [...], ...})，格式不符时返回None"""
+        start = response_text.find("{")
+        end = response_text.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            parsed = _json_loads(response_text[start:end + 1])
+        except (json.JSONDecodeError, ValueError):
+            return None
+        if not isinstance(parsed, dict):
+            return None
+        return {
+            label: value if isinstance(value, list) else [value]
+            for label, value in parsed.items()
+        }
+    
     def _parse_non_json_response(self, response_text: str) -> List[Dict[str, Any]]:
         """解析非JSON格式的响应"""
         extractions = []
         
         try:
-            # 简单的文本解析逻辑
-            lines = response_text.split('\n')
             current_extraction = {}
             
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # 尝试提取字段
-                if "disease_symptom" in line.lower() or "症状" in line or "疾病" in line:
-                    current_extraction["disease_symptom"] = line.split(":")[-1].strip()
-                elif "organ" in line.lower() or "器官" in line:
-                    current_extraction["organ"] = line.split(":")[-1].strip()
-                elif "specific_part" in line.lower() or "部位" in line:
-                    current_extraction["specific_part"] = line.split(":")[-1].strip()
-                elif "confidence" in line.lower() or "置信度" in line:
-                    current_extraction["confidence"] = line.split(":")[-1].strip()
-                elif "evidence" in line.lower() or "证据" in line:
-                    current_extraction["evidence"] = line.split(":")[-1].strip()
+            # 单次正则扫描提取 "字段: 值"
+            for match in _FIELD_RE.finditer(response_text):
+                field = match.group("field").lower()
+                field = _FIELD_ALIASES.get(field, field)
+                current_extraction[field] = match.group("val").strip()
                 
                 # 如果收集到足够信息，添加到结果中
                 if len(current_extraction) >= 3:
-                    extractions.append(current_extraction.copy())
+                    extractions.append(current_extraction)
                     current_extraction = {}
             
             # 添加最后一个提取结果
@@ -371,45 +929,323 @@ class LLMExtractor:
         
         return extractions
     
-    def batch_extract(self, texts: List[Dict[str, str]], delay: float = None) -> List[Dict[str, Any]]:
+    async def _aextract_medical_info(self, client, limiter: Optional[TokenBucket], semaphore: asyncio.Semaphore,
+                                     text: str, case_id: str, specialty: str) -> Dict[str, Any]:
         """
-        批量提取医学信息
+        在并发和速率限制内异步提取单个病例
+        每次请求都按端点的RPM/TPM限流；limiter为调用方显式指定的额外速率上限，没有时为None
+        """
+        key = self._cache_key(text, specialty)
+        cached = self._cache_get(key, case_id)
+        if cached is not None:
+            return cached
+        
+        async with semaphore:
+            if limiter is not None:
+                await limiter.acquire_async()
+            try:
+                if client is None:
+                    # 未安装httpx时退回到线程池中的同步调用
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(None, self.extract_medical_info, text, case_id, specialty)
+                system_prompt, prompt = self._build_extraction_prompt_parts(text, specialty)
+                result = await self._acall_deepseek_api(client, prompt, system_prompt)
+                extraction = self._build_extraction_result(result, case_id, specialty)
+                self._cache_set(key, extraction)
+                return extraction
+            except Exception as e:
+                logger.error(f"提取医学信息异常: {str(e)}")
+                return {
+                    "case_id": case_id,
+                    "success": False,
+                    "error": str(e),
+                    "extractions": [],
+                    "specialty": specialty
+                }
+    
+    def _dedupe_batch(self, texts: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[List[int]]]:
+        """
+        批次内去重：专科和文本都相同的病例只请求一次
+        
+        Returns:
+            (去重后的病例列表 (已补全case_id和specialty), 每个去重病例对应的原始序号列表)
+        """
+        groups = {}
+        unique = []
+        for i, item in enumerate(texts):
+            specialty = item.get("specialty", "general")
+            key = self._cache_key(item["text"], specialty)
+            indices = groups.get(key)
+            if indices is None:
+                groups[key] = indices = []
+                unique.append({"text": item["text"], "case_id": item.get("case_id", f"case_{i}"), "specialty": specialty})
+            indices.append(i)
+        if len(unique) < len(texts):
+            logger.info(f"批次内去重: {len(texts)} 个病例中有 {len(texts) - len(unique)} 个重复文本")
+        return unique, list(groups.values())
+    
+    @staticmethod
+    def _fan_out(texts: List[Dict[str, str]], indices: List[int], result: Dict[str, Any]) -> List[tuple]:
+        """将去重病例的结果分发给所有相同文本的原始病例，返回 (原始序号, 结果) 列表"""
+        outputs = [(indices[0], result)]
+        for i in indices[1:]:
+            duplicate = copy.deepcopy(result)
+            duplicate["case_id"] = texts[i].get("case_id", f"case_{i}")
+            outputs.append((i, duplicate))
+        return outputs
+    
+    def _merge_groups(self, texts: List[Dict[str, str]], groups: List[List[int]],
+                      unique_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按原始顺序还原批量结果"""
+        results = [None] * len(texts)
+        for indices, result in zip(groups, unique_results):
+            for i, extraction in self._fan_out(texts, indices, result):
+                results[i] = extraction
+        return results
+    
+    async def abatch_extract(self, texts: List[Dict[str, str]], concurrency: int = 10,
+                             rpm: float = None) -> List[Dict[str, Any]]:
+        """
+        异步并发批量提取医学信息
         
         Args:
             texts: 文本列表，每个元素包含text和case_id
-            delay: 请求间隔
+            concurrency: 最大并发请求数
+            rpm: 额外的每分钟请求数上限 (默认不设置，只按构造时各端点配置的RPM/TPM限流)
             
         Returns:
-            批量提取结果
+            批量提取结果 (与输入顺序一致)
         """
-        if delay is None:
-            delay = self.config["delay"]
+        limiter = TokenBucket(rpm, 60) if rpm else None
+        semaphore = asyncio.Semaphore(concurrency)
+        logger.info(f"并发处理 {len(texts)} 个病例 (并发数: {concurrency}, 额外RPM上限: {rpm or '无'})")
+        unique, groups = self._dedupe_batch(texts)
         
-        results = []
+        async def _run(client):
+            tasks = [
+                self._aextract_medical_info(
+                    client, limiter, semaphore,
+                    text=item["text"],
+                    case_id=item["case_id"],
+                    specialty=item["specialty"]
+                )
+                for item in unique
+            ]
+            return await asyncio.gather(*tasks)
         
-        for i, item in enumerate(texts):
-            logger.info(f"处理第 {i+1}/{len(texts)} 个病例")
+        if httpx is None:
+            return self._merge_groups(texts, groups, await _run(None))
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(http2=_HTTP2, limits=limits) as client:
+            await self._aprewarm(client)
+            return self._merge_groups(texts, groups, await _run(client))
+    
+    async def aiter_extract(self, texts: List[Dict[str, str]], concurrency: int = 10,
+                            rpm: float = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        异步并发提取医学信息，按完成顺序逐个产出结果 (调用方可边处理边写盘，不在内存中累积全部结果)
+        
+        Args:
+            texts: 文本列表，每个元素包含text和case_id
+            concurrency: 最大并发请求数
+            rpm: 额外的每分钟请求数上限 (默认不设置，只按构造时各端点配置的RPM/TPM限流)
             
-            # 提取信息
-            result = self.extract_medical_info(
+        Yields:
+            单个病例的提取结果 (按完成顺序，通过case_id对应输入)
+        """
+        limiter = TokenBucket(rpm, 60) if rpm else None
+        semaphore = asyncio.Semaphore(concurrency)
+        logger.info(f"并发处理 {len(texts)} 个病例 (并发数: {concurrency}, 额外RPM上限: {rpm or '无'})")
+        unique, groups = self._dedupe_batch(texts)
+        
+        async def _run_group(client, indices, item):
+            result = await self._aextract_medical_info(
+                client, limiter, semaphore,
                 text=item["text"],
-                case_id=item.get("case_id", f"case_{i}"),
-                specialty=item.get("specialty", "general")
+                case_id=item["case_id"],
+                specialty=item["specialty"]
             )
+            return indices, result
+        
+        async with contextlib.AsyncExitStack() as stack:
+            client = None
+            if httpx is not None:
+                limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+                client = await stack.enter_async_context(httpx.AsyncClient(http2=_HTTP2, limits=limits))
+                await self._aprewarm(client)
+            tasks = [
+                asyncio.ensure_future(_run_group(client, indices, item))
+                for indices, item in zip(groups, unique)
+            ]
+            try:
+                for future in asyncio.as_completed(tasks):
+                    indices, result = await future
+                    for _, extraction in self._fan_out(texts, indices, result):
+                        yield extraction
+            finally:
+                # 调用方提前停止迭代时取消尚未完成的请求
+                for task in tasks:
+                    task.cancel()
+    
+    def iter_extract(self, texts: List[Dict[str, str]], delay: float = None,
+                     concurrency: int = 10) -> Iterator[Dict[str, Any]]:
+        """
+        批量提取医学信息的生成器版本，按完成顺序逐个产出结果
+        用法: for result in extractor.iter_extract(texts): write(result)
+        
+        Args:
+            texts: 文本列表，每个元素包含text和case_id
+            delay: 请求间隔 (指定时换算为每分钟请求数上限)
+            concurrency: 最大并发请求数
+        """
+        rpm = 60.0 / delay if delay else None
+        loop = asyncio.new_event_loop()
+        agen = self.aiter_extract(texts, concurrency=concurrency, rpm=rpm)
+        try:
+            while True:
+                try:
+                    result = loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield result
+        finally:
+            loop.run_until_complete(agen.aclose())
+            loop.close()
+    
+    def batch_extract(self, texts: List[Dict[str, str]], delay: float = None, concurrency: int = 10) -> List[Dict[str, Any]]:
+        """
+        批量提取医学信息
+        
+        Args:
+            texts: 文本列表，每个元素包含text和case_id
+            delay: 请求间隔 (指定时换算为每分钟请求数上限)
+            concurrency: 最大并发请求数
+            
+        Returns:
+            批量提取结果
+        """
+        rpm = 60.0 / delay if delay else None
+        return asyncio.run(self.abatch_extract(texts, concurrency=concurrency, rpm=rpm))
+    
+    def batch_extract_parallel(self, texts: List[Dict[str, str]], max_workers: int = 8) -> List[Dict[str, Any]]:
+        """
+        使用线程池并行批量提取医学信息 (不依赖asyncio的替代方案)
+        requests在等待网络时释放GIL，多个线程共享同一连接池会话
+        
+        Args:
+            texts: 文本列表，每个元素包含text和case_id
+            max_workers: 最大线程数
             
-            results.append(result)
+        Returns:
+            批量提取结果 (与输入顺序一致)
+        """
+        unique, groups = self._dedupe_batch(texts)
+        unique_results = [None] * len(unique)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.extract_medical_info, item["text"], item["case_id"], item["specialty"]): j
+                for j, item in enumerate(unique)
+            }
+            for future in as_completed(futures):
+                j = futures[future]
+                unique_results[j] = future.result()
+                logger.info(f"完成第 {j+1}/{len(unique)} 个病例")
+        return self._merge_groups(texts, groups, unique_results)
+    
+    @staticmethod
+    def _make_packs(items: List[tuple], pack_size: int, max_pack_chars: int) -> List[List[tuple]]:
+        """将 (序号, 病例) 按专科分组，再按病例数和字符数上限切分为若干组"""
+        groups = {}
+        for index, item in items:
+            groups.setdefault(item.get("specialty", "general"), []).append((index, item))
+        
+        packs = []
+        for group in groups.values():
+            pack, chars = [], 0
+            for index, item in group:
+                size = len(item["text"])
+                if pack and (len(pack) >= pack_size or chars + size > max_pack_chars):
+                    packs.append(pack)
+                    pack, chars = [], 0
+                pack.append((index, item))
+                chars += size
+            if pack:
+                packs.append(pack)
+        return packs
+    
+    def _extract_pack(self, pack: List[tuple]) -> List[tuple]:
+        """用一次API调用提取一组同专科病例，返回 (序号, 提取结果) 列表；解析失败的病例退回单病例请求"""
+        if len(pack) == 1:
+            index, item = pack[0]
+            return [(index, self.extract_medical_info(item["text"], item["case_id"], item["specialty"]))]
+        
+        specialty = pack[0][1]["specialty"]
+        system_prompt = _specialty_system_prompt(specialty) + PACKED_RESPONSE_INSTRUCTION
+        prompt = "\n\n".join(f"CASE_{n}:\n{item['text']}" for n, (_, item) in enumerate(pack, 1))
+        result = self.call_api(prompt, system_prompt=system_prompt, use_cache=False)
+        
+        if not result["success"]:
+            return [(index, self._build_extraction_result(result, item["case_id"], specialty)) for index, item in pack]
+        
+        packed = self._parse_packed_response(result["response"]) or {}
+        if not packed:
+            logger.warning(f"合并请求响应解析失败，{len(pack)} 个病例退回单独请求")
+        
+        outputs = []
+        for n, (index, item) in enumerate(pack, 1):
+            extractions = packed.get(f"CASE_{n}")
+            if extractions is None:
+                outputs.append((index, self.extract_medical_info(item["text"], item["case_id"], specialty)))
+                continue
+            extraction = {
+                "case_id": item["case_id"],
+                "success": True,
+                "extractions": extractions,
+                "specialty": specialty,
+                "usage": result.get("usage", {}),  # 整个合并请求的用量，由pack_size个病例共享
+                "pack_size": len(pack),
+                "model": result.get("model", self.model_name)
+            }
+            self._cache_set(self._cache_key(item["text"], specialty), extraction)
+            outputs.append((index, extraction))
+        return outputs
+    
+    def batch_extract_packed(self, texts: List[Dict[str, str]], pack_size: int = PACK_SIZE,
+                             max_pack_chars: int = MAX_PACK_CHARS, max_workers: int = 4) -> List[Dict[str, Any]]:
+        """
+        将多个同专科的短病例合并到一次API调用中批量提取，摊薄每次请求的专科提示词和连接开销
+        
+        Args:
+            texts: 文本列表，每个元素包含text和case_id
+            pack_size: 每次请求最多合并的病例数
+            max_pack_chars: 每次请求合并的病例文本总字符数上限 (为输出留出上下文窗口余量)
+            max_workers: 并行请求的线程数
             
-            # 添加延迟
-            if i < len(texts) - 1:
-                time.sleep(delay)
+        Returns:
+            批量提取结果 (与输入顺序一致)
+        """
+        unique, groups = self._dedupe_batch(texts)
+        unique_results = [None] * len(unique)
+        pending = []
+        for j, item in enumerate(unique):
+            cached = self._cache_get(self._cache_key(item["text"], item["specialty"]), item["case_id"])
+            if cached is not None:
+                unique_results[j] = cached
+            else:
+                pending.append((j, item))
         
-        return results
+        packs = self._make_packs(pending, pack_size, max_pack_chars)
+        logger.info(f"合并处理 {len(pending)} 个病例，共 {len(packs)} 次请求 (缓存命中 {len(unique) - len(pending)} 个)")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for outputs in executor.map(self._extract_pack, packs):
+                for index, extraction in outputs:
+                    unique_results[index] = extraction
+        return self._merge_groups(texts, groups, unique_results)
     
     def validate_extraction(self, extraction: Dict[str, Any]) -> Dict[str, Any]:
         """验证提取结果"""
         # 基本验证
-        required_fields = ["disease_symptom", "organ", "specific_part"]
-        missing_fields = [field for field in required_fields if not extraction.get(field)]
+        missing_fields = [field for field in _REQUIRED_FIELDS if not extraction.get(field)]
         
         if missing_fields:
             return {
@@ -419,8 +1255,8 @@ class LLMExtractor:
             }
         
         # 器官验证
-        from configs.model_config import is_allowed_organ
-        if not is_allowed_organ(extraction["organ"]):
+        organ = extraction["organ"]
+        if organ not in _ALLOWED_ORGAN_SET and not is_allowed_organ(organ):
             return {
                 "valid": False,
                 "errors": f"不支持的器官: {extraction['organ']}",
@@ -431,6 +1267,39 @@ class LLMExtractor:
             "valid": True,
             "extraction": extraction
         }
+    
+    def validate_extractions(self, extractions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量验证提取结果"""
+        validate = self.validate_extraction
+        return [validate(extraction) for extraction in extractions]
+
+def create_http_client(pool_size: int = 32):
+    """
+    创建可在多个提取器间共享的同步HTTP客户端
+    优先使用httpx.Client (安装h2时启用HTTP/2，并发请求多路复用同一条TCP/TLS连接)，
+    未安装httpx时退回到带连接池的requests.Session
+    
+    Args:
+        pool_size: 最大连接数
+    """
+    if httpx is not None:
+        limits = httpx.Limits(max_keepalive_connections=max(1, pool_size // 2), max_connections=pool_size)
+        return httpx.Client(http2=_HTTP2, limits=limits)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def create_async_http_client(pool_size: int = 32):
+    """
+    创建异步HTTP客户端 (async with使用)
+    未安装httpx时返回一个产出None的空上下文，调用方随之退回到线程池中的同步请求
+    """
+    if httpx is None:
+        return contextlib.nullcontext()
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.AsyncClient(http2=_HTTP2, limits=limits)
 
 def create_extractor(model: str, api_key: str, base_url: str) -> LLMExtractor:
     """
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+令牌桶限流器与重试退避工具
+只有真正触及API的RPM上限时才会等待，替代固定的sleep间隔
+"""
+
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class TokenBucket:
+    """令牌桶限流器 (线程安全，同时支持同步和异步调用)"""
+
+    def __init__(self, rate: float, period: float = 60.0):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每个周期允许的请求数 (e.g., RPM)
+            period: 周期长度(秒)
+        """
+        self.capacity = float(rate)
+        self.fill_rate = float(rate) / period
+        self._tokens = float(rate)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, amount: float) -> float:
+        """尝试取出令牌，成功返回0，否则返回需要等待的秒数"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.fill_rate)
+            self._last = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.fill_rate
+
+    def acquire(self, amount: float = 1.0):
+        """阻塞直到取得令牌"""
+        while True:
+            wait = self._try_acquire(amount)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, amount: float = 1.0):
+        """异步等待直到取得令牌"""
+        while True:
+            wait = self._try_acquire(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+def decorrelated_jitter(previous: float, base: float, cap: float = 60.0) -> float:
+    """
+    去相关抖动退避 (decorrelated jitter)
+    下一次等待时间在 [base, previous*3] 之间随机选取，避免多个客户端同步重试
+    """
+    return min(cap, random.uniform(base, max(base, previous) * 3))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头 (秒数或HTTP日期)，无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -5,6 +5,7 @@
 """
 
 import json
+import time
 import requests
 from typing import Dict, Any, List
 from loguru import logger
@@ -15,6 +16,71 @@ from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentClo
 from tencentcloud.common.profile.client_profile import ClientProfile
 from tencentcloud.common.profile.http_profile import HttpProfile
 
+from Diag_Distillation.extractors.rate_limiter import decorrelated_jitter
+
+try:
+    import orjson
+    _json_loads = orjson.loads  # orjson.JSONDecodeError继承自json.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+
+class _JsonEndDetector:
+    """
+    增量扫描流式输出，检测以JSON数组/对象开头的输出何时闭合 (括号深度合并计算，忽略字符串内的括号)
+    输出开头可以有空白和```json代码块标记；以说明文字等其他内容开头时不提前结束，读取完整的流
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.state = "leading"  # leading: 尚未确定开头; json: 扫描JSON; off: 不检测
+        self.leading = ""
+        self.in_string = False
+        self.escaped = False
+
+    def _start(self, chunk: str):
+        """累积输出开头直到能判断是否以JSON开头，返回JSON部分的文本 (尚无法判断时返回None)"""
+        self.leading += chunk
+        text = self.leading.lstrip()
+        if text.startswith("```"):
+            newline = text.find("\n")
+            if newline == -1:
+                return None
+            text = text[newline + 1:].lstrip()
+        elif "```".startswith(text):
+            # 空白或不完整的代码块标记
+            return None
+        if not text:
+            return None
+        self.leading = ""
+        self.state = "json" if text[0] in "[{" else "off"
+        return text
+
+    def feed(self, chunk: str) -> bool:
+        """输入一段文本，开头的顶层JSON数组/对象已闭合时返回True"""
+        if self.state == "leading":
+            chunk = self._start(chunk)
+            if chunk is None:
+                return False
+        if self.state == "off":
+            return False
+        for ch in chunk:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "[{":
+                self.depth += 1
+            elif ch in "]}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
 class NonStreamResponse(object):
     def __init__(self):
         self.response = ""
@@ -25,16 +91,18 @@ class NonStreamResponse(object):
 class TencentExtractor:
     """腾讯云DeepSeek API提取器"""
     
-    def __init__(self, api_key: str, base_url: str = "https://api.lkeap.cloud.tencent.com/v1"):
+    def __init__(self, api_key: str, base_url: str = "https://api.lkeap.cloud.tencent.com/v1", stream: bool = False):
         """
         初始化腾讯云提取器
         
         Args:
             api_key: 腾讯云API密钥
             base_url: API基础URL
+            stream: 是否使用流式输出 (以JSON开头的输出在顶层数组/对象闭合后即停止接收)
         """
         self.api_key = api_key
         self.base_url = base_url
+        self.stream = stream
         self.config = self._get_default_config()
         
         # 初始化腾讯云客户端
@@ -91,12 +159,13 @@ class TencentExtractor:
         retry_times = self.config.get("retry_times", 3)
         retry_delay = self.config.get("retry_delay", 5.0)
         
+        delay = retry_delay
         for attempt in range(retry_times):
             try:
                 params = {
                     "Model": "deepseek-r1",
                     "Messages": [{"Role": "user", "Content": prompt}],
-                    "Stream": False,
+                    "Stream": self.stream,
                     "MaxTokens": self.config["max_tokens"],
                     "Temperature": self.config["temperature"],
                     "TopP": self.config["top_p"]
@@ -108,7 +177,15 @@ class TencentExtractor:
                     NonStreamResponse
                 )
                 
-                if isinstance(resp, NonStreamResponse):
+                if self.stream and not isinstance(resp, NonStreamResponse):
+                    content, usage = self._consume_stream(resp)
+                    return {
+                        "success": True,
+                        "response": content,
+                        "usage": usage,
+                        "model": "deepseek-r1"
+                    }
+                elif isinstance(resp, NonStreamResponse):
                     result = json.loads(resp.response)
                     return {
                         "success": True,
@@ -119,9 +196,9 @@ class TencentExtractor:
                 else:
                     error_msg = "腾讯云API返回格式异常"
                     if attempt < retry_times - 1:
-                        logger.warning(f"第{attempt + 1}次尝试失败: {error_msg}, {retry_delay}秒后重试...")
-                        import time
-                        time.sleep(retry_delay)
+                        delay = decorrelated_jitter(delay, retry_delay)
+                        logger.warning(f"第{attempt + 1}次尝试失败: {error_msg}, {delay:.1f}秒后重试...")
+                        time.sleep(delay)
                         continue
                     else:
                         return {
@@ -132,10 +209,12 @@ class TencentExtractor:
                         
             except TencentCloudSDKException as e:
                 error_msg = str(e)
-                if attempt < retry_times - 1:
-                    logger.warning(f"第{attempt + 1}次尝试异常: {error_msg}, {retry_delay}秒后重试...")
-                    import time
-                    time.sleep(retry_delay)
+                # 鉴权和参数错误重试也不会成功，直接失败
+                retryable = not str(e.get_code() or "").startswith(("AuthFailure", "InvalidParameter"))
+                if attempt < retry_times - 1 and retryable:
+                    delay = decorrelated_jitter(delay, retry_delay)
+                    logger.warning(f"第{attempt + 1}次尝试异常: {error_msg}, {delay:.1f}秒后重试...")
+                    time.sleep(delay)
                     continue
                 else:
                     logger.error(f"腾讯云API调用异常: {error_msg}")
@@ -147,9 +226,9 @@ class TencentExtractor:
             except Exception as e:
                 error_msg = str(e)
                 if attempt < retry_times - 1:
-                    logger.warning(f"第{attempt + 1}次尝试异常: {error_msg}, {retry_delay}秒后重试...")
-                    import time
-                    time.sleep(retry_delay)
+                    delay = decorrelated_jitter(delay, retry_delay)
+                    logger.warning(f"第{attempt + 1}次尝试异常: {error_msg}, {delay:.1f}秒后重试...")
+                    time.sleep(delay)
                     continue
                 else:
                     logger.error(f"腾讯云API调用异常: {error_msg}")
@@ -165,6 +244,37 @@ class TencentExtractor:
             "response": None
         }
     
+    @staticmethod
+    def _consume_stream(events):
+        """
+        读取SSE流式事件并拼接输出内容，以JSON开头的输出在顶层数组/对象闭合后立即关闭连接
+        
+        Returns:
+            (输出内容, 用量统计)
+        """
+        parts = []
+        usage = {}
+        detector = _JsonEndDetector()
+        try:
+            for event in events:
+                data = event.get("data") if isinstance(event, dict) else event
+                if not data or data == "[DONE]":
+                    continue
+                chunk = _json_loads(data)
+                usage = chunk.get("Usage") or chunk.get("usage") or usage
+                choices = chunk.get("Choices") or chunk.get("choices") or [{}]
+                delta = choices[0].get("Delta") or choices[0].get("delta") or {}
+                content = delta.get("Content") or delta.get("content") or ""
+                if content:
+                    parts.append(content)
+                    if detector.feed(content):
+                        break
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+        return "".join(parts), usage
+    
     def extract_medical_info(self, text: str, case_id: str = "", specialty: str = "general") -> Dict[str, Any]:
         """
         提取医学信息
@@ -221,19 +331,17 @@ class TencentExtractor:
         """解析API响应"""
         try:
             # 尝试直接解析JSON
-            if response_text.strip().startswith("["):
-                return json.loads(response_text)
-            elif response_text.strip().startswith("{"):
-                return [json.loads(response_text)]
-            
-            # 尝试提取JSON部分
-            import re
-            json_pattern = r'\[.*\]'
-            match = re.search(json_pattern, response_text, re.DOTALL)
+            stripped = response_text.strip()
+            if stripped.startswith("["):
+                return _json_loads(stripped)
+            elif stripped.startswith("{"):
+                return [_json_loads(stripped)]
             
-            if match:
-                json_str = match.group()
-                return json.loads(json_str)
+            # 尝试提取JSON部分 (第一个"["到最后一个"]")
+            start = stripped.find("[")
+            end = stripped.rfind("]")
+            if start != -1 and end > start:
+                return _json_loads(stripped[start:end + 1])
             
             # 如果都失败，返回空列表
             logger.warning(f"无法解析响应: {response_text[:100]}...")
@@ -15,43 +15,78 @@ python3 process_worker.py --input_dir dataset/ --output_dir results/ --api_key_n
 import os
 import sys
 import argparse
+import asyncio
+import functools
 import json
+import logging
 import re
 import time
-import traceback
+import heapq
+from bisect import bisect_left
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
 
 # 导入配置
 sys.path.append('/opt/RAG_Evidence4Organ')
 from configs.system_config import MULTI_API_CONFIG
 from configs.model_config import ALLOWED_ORGANS, ORGAN_ANATOMY_STRUCTURE, ELSE_STRUCT, normalize_organ
-from Question_Distillation_v2.extractors.llm_extractor import LLMExtractor
+from Diag_Distillation.extractors.llm_extractor import LLMExtractor, create_async_http_client, JSON_OBJECT_FORMAT
 from Diag_Distillation.prompts.medical_prompts import DiagnosticExtractionPrompts, get_prompt_by_step
-from configs.model_config import ORGAN_ANATOMY_STRUCTURE
+from Diag_Distillation.processors.batch_logger import get_batch_logger, flush_batch_logs
+from Diag_Distillation.processors.result_writer import dumps_json, write_file_atomic
 
-# 导入logger
 try:
-    from loguru import logger
+    import orjson
+    _json_loads = orjson.loads  # orjson.JSONDecodeError继承自json.JSONDecodeError
 except ImportError:
-    # 如果没有loguru，创建一个简单的logger
-    import logging
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
+    _json_loads = json.loads
+
+# 器官白名单集合，用于O(1)成员判断
+_ALLOWED_ORGAN_SET = frozenset(ALLOWED_ORGANS)
+
+# 解析诊断响应：用raw_decode从候选位置解析JSON对象，最多尝试的候选"{"数量
+_JSON_DECODER = json.JSONDecoder()
+MAX_JSON_CANDIDATES = 64
+_JSON_START_RE = re.compile(r'[\[{]')
+_CODE_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL)
+
+# 单个报告内同一API密钥的默认最大并发请求数
+STEP_CONCURRENCY = 8
+
+# 步骤1/步骤2每次请求最多合并的分块数，以及合并分块的总字符数上限
+CHUNKS_PER_CALL = 4
+MAX_CHUNK_BATCH_CHARS = 12000
+
+# 患者陈述块+医生诊断块的估算token数低于该阈值时，步骤1和步骤2融合为一次请求 (约3字符/token)
+FUSION_THRESHOLD = 6000
+CHARS_PER_TOKEN_ESTIMATE = 3
+
+# 报告文件名中的编号 (排序用) 和病例ID
+_REPORT_NUM_RE = re.compile(r'report_(\d+)\.txt')
+_CASE_ID_RE = re.compile(r'(\d+)')
+
+# 并行读取报告文件的线程数
+REPORT_READ_WORKERS = 32
+
+# 日志由后台线程统一格式化输出 (自带时间戳)，并发处理报告时工作线程不再争抢stdout
+logger = get_batch_logger("batch.worker")
 
 def print_header():
     """打印系统启动信息"""
-    print("=" * 80)
-    print("🏥 Diag_Distillation - 三步分离式诊断蒸馏系统")
-    print("=" * 80)
-    print(f"⏰ 启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"📍 工作目录: {os.getcwd()}")
-    print("📋 蒸馏流程:")
-    print("   步骤1: 患者陈述症状提取")
-    print("   步骤2: 医生诊断器官提取") 
-    print("   步骤3: 症状-器官解剖映射")
-    print("-" * 80)
+    logger.info("=" * 80)
+    logger.info("🏥 Diag_Distillation - 三步分离式诊断蒸馏系统")
+    logger.info("=" * 80)
+    logger.info(f"⏰ 启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"📍 工作目录: {os.getcwd()}")
+    logger.info("📋 蒸馏流程:")
+    logger.info("   步骤1: 患者陈述症状提取")
+    logger.info("   步骤2: 医生诊断器官提取") 
+    logger.info("   步骤3: 症状-器官解剖映射")
+    logger.info("-" * 80)
 
 def print_progress(current, total, start_time):
     """打印进度信息"""
@@ -63,27 +98,28 @@ def print_progress(current, total, start_time):
         eta_str = "未知"
     
     percentage = (current / total) * 100 if total > 0 else 0
-    print(f"📊 进度: [{current}/{total}] {percentage:.1f}% | ⏱️ 已用: {int(elapsed//60)}:{int(elapsed%60):02d} | 🔮 预计剩余: {eta_str}")
+    logger.info(f"📊 进度: [{current}/{total}] {percentage:.1f}% | ⏱️ 已用: {int(elapsed//60)}:{int(elapsed%60):02d} | 🔮 预计剩余: {eta_str}")
 
 def print_step_info(step_num, step_name, chunk_count=None):
     """打印步骤信息"""
     step_prefix = f"🔍 步骤{step_num}"
     if chunk_count:
-        print(f"{step_prefix} {step_name} (处理 {chunk_count} 个文本块)")
+        logger.info(f"{step_prefix} {step_name} (处理 {chunk_count} 个文本块)")
     else:
-        print(f"{step_prefix} {step_name}")
+        logger.info(f"{step_prefix} {step_name}")
 
 def print_api_call_info(api_name, report_num, step, chunk_index=None):
     """打印API调用信息"""
-    timestamp = datetime.now().strftime('%H:%M:%S')
     if chunk_index is not None:
-        print(f"🌐 [{timestamp}] API调用: {api_name} | 报告: {report_num} | 步骤: {step} | 块: {chunk_index}")
+        logger.info(f"🌐 API调用: {api_name} | 报告: {report_num} | 步骤: {step} | 块: {chunk_index}")
     else:
-        print(f"🌐 [{timestamp}] API调用: {api_name} | 报告: {report_num} | 步骤: {step}")
+        logger.info(f"🌐 API调用: {api_name} | 报告: {report_num} | 步骤: {step}")
 
 def print_extraction_summary(results):
     """打印提取结果摘要（兼容多种结构）"""
-    print("📋 提取结果摘要:")
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info("📋 提取结果摘要:")
 
     # Handle the {"raw": ..., "normalized": ...} wrapper
     if isinstance(results, dict) and "raw" in results:
@@ -97,8 +133,8 @@ def print_extraction_summary(results):
     if isinstance(results, list) and results and "s_symptom" in results[0]:
         symptom_count = len(results)
         unit_count = sum(len(item.get("U_unit_set", [])) for item in results)
-        print(f"   ✅ 标准化症状条目: {symptom_count}")
-        print(f"   ✅ 标准化诊断单元总数: {unit_count}")
+        logger.info(f"   ✅ 标准化症状条目: {symptom_count}")
+        logger.info(f"   ✅ 标准化诊断单元总数: {unit_count}")
         if symptom_count > 0:
             first = results[0]
             s_symptom = first.get("s_symptom", "-")
@@ -107,141 +143,200 @@ def print_extraction_summary(results):
                 first_unit = first_unit_set[0].get("u_unit", {})
                 d_diagnosis = first_unit.get("d_diagnosis", "-")
                 organName = (first_unit.get("o_organ", {}) or {}).get("organName", "-")
-                print(f"   👉 示例: 症状='{s_symptom}' | 诊断='{d_diagnosis}' | 器官='{organName}'")
+                logger.info(f"   👉 示例: 症状='{s_symptom}' | 诊断='{d_diagnosis}' | 器官='{organName}'")
             else:
-                print(f"   👉 示例: 症状='{s_symptom}' | (无诊断单元)")
+                logger.info(f"   👉 示例: 症状='{s_symptom}' | (无诊断单元)")
         return
 
     if not isinstance(results, dict):
-        print(f"   ❌ 结果格式异常: {type(results)}")
+        logger.info(f"   ❌ 结果格式异常: {type(results)}")
         return
 
     # 优先：step3 样式
     if "symptom_organ_mappings" in results and isinstance(results["symptom_organ_mappings"], list):
         mappings = results.get("symptom_organ_mappings", [])
         count = len(mappings)
-        print(f"   ✅ 症状-器官映射条数: {count}")
+        logger.info(f"   ✅ 症状-器官映射条数: {count}")
         if count > 0:
             first = mappings[0]
             ps = first.get("patient_symptom", "-")
             og = first.get("diagnosed_organ", "-")
             locs = first.get("anatomical_locations", [])
-            print(f"   👉 示例: 症状='{ps}' | 器官='{og}' | 解剖部位={', '.join(locs[:3])}")
+            logger.info(f"   👉 示例: 症状='{ps}' | 器官='{og}' | 解剖部位={', '.join(locs[:3])}")
         return
 
     # 次优：整合提示词完整结构（step1/2/3）
     has_any = False
     if "step1_patient_complaints" in results:
         pcs = (results["step1_patient_complaints"] or {}).get("complaint_sections", [])
-        print(f"   ✅ 患者陈述段落: {len(pcs)}")
+        logger.info(f"   ✅ 患者陈述段落: {len(pcs)}")
         has_any = has_any or bool(pcs)
     if "step2_physician_diagnoses" in results:
         dss = (results["step2_physician_diagnoses"] or {}).get("diagnostic_sections", [])
-        print(f"   ✅ 医生诊断段落: {len(dss)}")
+        logger.info(f"   ✅ 医生诊断段落: {len(dss)}")
         has_any = has_any or bool(dss)
     if "step3_anatomical_mappings" in results:
         maps = (results["step3_anatomical_mappings"] or {}).get("symptom_organ_mappings", [])
-        print(f"   ✅ 症状-器官映射: {len(maps)}")
+        logger.info(f"   ✅ 症状-器官映射: {len(maps)}")
         has_any = has_any or bool(maps)
     if has_any:
         return
 
     # 兼容：旧式扁平字段（不再推荐）
     if results.get('patient_symptom'):
-        print(f"   ✅ 患者症状: {results['patient_symptom'][:50]}...")
+        logger.info(f"   ✅ 患者症状: {results['patient_symptom'][:50]}...")
     else:
-        print("   ❌ 患者症状: 未提取到")
+        logger.info("   ❌ 患者症状: 未提取到")
     
     if results.get('diagnosed_organ'):
-        print(f"   ✅ 诊断器官: {results['diagnosed_organ']}")
+        logger.info(f"   ✅ 诊断器官: {results['diagnosed_organ']}")
     else:
-        print("   ❌ 诊断器官: 未提取到")
+        logger.info("   ❌ 诊断器官: 未提取到")
     
     if results.get('anatomical_locations'):
         locations = ', '.join(results['anatomical_locations'])
-        print(f"   ✅ 解剖部位: {locations}")
+        logger.info(f"   ✅ 解剖部位: {locations}")
     else:
-        print("   ❌ 解剖部位: 未提取到")
+        logger.info("   ❌ 解剖部位: 未提取到")
     
     confidence = results.get('confidence', 'unknown')
-    print(f"   📈 置信度: {confidence}")
+    logger.info(f"   📈 置信度: {confidence}")
+
+_get_unit_set = itemgetter('U_unit_set')
+_get_organ_name = itemgetter('organName')
+_get_organ = itemgetter('o_organ')
+_get_u_unit = itemgetter('u_unit')
+
+def summarize_normalized(normalized: List[Dict[str, Any]]) -> Tuple[int, Set[str]]:
+    """单次遍历标准化结果，返回 (诊断单元总数, 涉及器官集合)"""
+    total_units = 0
+    organs = set()
+    for item in normalized:
+        try:
+            unit_set = _get_unit_set(item) or ()
+        except (KeyError, TypeError):
+            continue
+        total_units += len(unit_set)
+        for unit_wrapper in unit_set:
+            # 正常结构直接取值，结构异常的条目跳过
+            try:
+                organ_name = _get_organ_name(_get_organ(_get_u_unit(unit_wrapper)))
+            except (KeyError, TypeError, IndexError):
+                continue
+            if organ_name:
+                organs.add(organ_name)
+    return total_units, organs
 
 def print_error_info(error, report_num, step=None):
     """打印错误信息"""
-    timestamp = datetime.now().strftime('%H:%M:%S')
     step_info = f" | 步骤: {step}" if step else ""
-    print(f"❌ [{timestamp}] 错误 - 报告: {report_num}{step_info}")
-    print(f"   错误详情: {str(error)}")
+    logger.info(f"❌ 错误 - 报告: {report_num}{step_info}")
+    logger.info(f"   错误详情: {str(error)}")
 
 def print_file_save_info(filepath, success=True):
     """打印文件保存信息"""
-    timestamp = datetime.now().strftime('%H:%M:%S')
     if success:
-        print(f"💾 [{timestamp}] 文件已保存: {filepath}")
+        logger.info(f"💾 文件已保存: {filepath}")
     else:
-        print(f"❌ [{timestamp}] 文件保存失败: {filepath}")
+        logger.info(f"❌ 文件保存失败: {filepath}")
 
 def numeric_sort_key(s: str):
     """为数字排序生成key, e.g., 'report_1.txt' < 'report_2.txt' < 'report_10.txt'"""
-    match = re.search(r'report_(\d+)\.txt', s)
+    match = _REPORT_NUM_RE.search(s)
     if match:
         return int(match.group(1))
     return 0
 
-def load_reports_from_list(file_path: str) -> List[Dict[str, Any]]:
-    """从一个文件列表文件中加载报告"""
-    print(f"正在从任务列表 {file_path} 加载报告...")
-    reports = []
+def _read_report_file(path: str):
+    """读取单个报告文件，失败时返回异常对象而不是抛出"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            filepaths = [line.strip() for line in f if line.strip()]
-        
-        for report_path in filepaths:
-            try:
-                with open(report_path, 'r', encoding='utf-8') as report_file:
-                    text = report_file.read()
-                filename = os.path.basename(report_path)
-                case_id_match = re.search(r'(\d+)', filename)
-                case_id = case_id_match.group(1) if case_id_match else filename.replace('.txt', '')
-                if text.strip():
-                    reports.append({"case_id": case_id, "text": text, "filename": filename})
-            except Exception as e:
-                print(f"❌ 读取报告文件 {report_path} 失败: {e}")
-        
-        print(f"✅ 成功从任务列表加载 {len(reports)} 条报告用于处理。")
-        return reports
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
     except Exception as e:
-        print(f"❌ 加载任务列表文件 {file_path} 时发生未知错误: {e}")
-        return []
+        return e
 
-def load_reports_in_range(directory_path: str, start_index: int, end_index: int) -> List[Dict[str, Any]]:
-    """从目录加载指定范围内的.txt报告 (使用自然排序)"""
-    print(f"正在从目录 {directory_path} 加载索引范围 {start_index}-{end_index} 的报告...")
-    reports = []
-    try:
-        all_files = sorted(
-            [f for f in os.listdir(directory_path) if f.endswith(".txt")],
-            key=numeric_sort_key
+def _iter_report_files(paths: List[str], max_workers: int = REPORT_READ_WORKERS) -> Iterator[Any]:
+    """
+    用线程池并行读取多个报告文件，按输入顺序逐个产出文本或异常
+    最多只有max_workers个文件处于读取中或等待消费，内存占用与报告总数无关
+    """
+    if len(paths) <= 1:
+        for path in paths:
+            yield _read_report_file(path)
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        pending = deque()
+        for path in paths:
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(_read_report_file, path))
+        while pending:
+            yield pending.popleft().result()
+
+def _build_report(filename: str, text: str):
+    """由文件名和文本构造报告记录，空文本返回None"""
+    if not text.strip():
+        return None
+    case_id_match = _CASE_ID_RE.search(filename)
+    case_id = case_id_match.group(1) if case_id_match else filename.replace('.txt', '')
+    return {"case_id": case_id, "text": text, "filename": filename}
+
+def read_task_list(file_path: str) -> List[str]:
+    """读取任务列表文件中的报告路径 (不读取报告内容，可用于预先统计报告数)"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def select_report_files_in_range(directory_path: str, start_index: int, end_index: int) -> List[str]:
+    """按自然排序选出索引范围内的.txt报告路径 (不读取报告内容，可用于预先统计报告数)"""
+    # 只需要排序后的前end_index个文件: nsmallest为O(N log K)，结果与sorted(...)[:end_index]一致
+    with os.scandir(directory_path) as entries:
+        smallest = heapq.nsmallest(
+            end_index,
+            (entry for entry in entries if entry.name.endswith(".txt")),
+            key=lambda entry: numeric_sort_key(entry.name)
         )
-        files_in_range = all_files[start_index:end_index]
+    return [entry.path for entry in smallest[start_index:]]
 
-        for filename in files_in_range:
-            file_path = os.path.join(directory_path, filename)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                case_id_match = re.search(r'(\d+)', filename)
-                case_id = case_id_match.group(1) if case_id_match else filename.replace('.txt', '')
-                if text.strip():
-                    reports.append({"case_id": case_id, "text": text, "filename": filename})
-            except Exception as e:
-                print(f"❌ 读取文件 {filename} 失败: {e}")
-        
-        print(f"✅ 成功加载 {len(reports)} 条报告用于处理。")
-        return reports
+def _iter_reports(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """逐个读取并产出报告记录，生成器的返回值为成功加载的报告数"""
+    loaded = 0
+    for report_path, text in zip(paths, _iter_report_files(paths)):
+        if isinstance(text, Exception):
+            logger.info(f"❌ 读取报告文件 {report_path} 失败: {text}")
+            continue
+        report = _build_report(os.path.basename(report_path), text)
+        if report:
+            loaded += 1
+            yield report
+    return loaded
+
+def load_reports_from_list(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    从一个文件列表文件中逐个加载报告 (生成器，报告在被消费时才读取)
+    需要总数时先用read_task_list获取路径列表
+    """
+    logger.info(f"正在从任务列表 {file_path} 加载报告...")
+    try:
+        filepaths = read_task_list(file_path)
+    except Exception as e:
+        logger.info(f"❌ 加载任务列表文件 {file_path} 时发生未知错误: {e}")
+        return
+    loaded = yield from _iter_reports(filepaths)
+    logger.info(f"✅ 成功从任务列表加载 {loaded} 条报告用于处理。")
+
+def load_reports_in_range(directory_path: str, start_index: int, end_index: int) -> Iterator[Dict[str, Any]]:
+    """
+    从目录逐个加载指定范围内的.txt报告 (使用自然排序；生成器，报告在被消费时才读取)
+    需要总数时先用select_report_files_in_range获取路径列表
+    """
+    logger.info(f"正在从目录 {directory_path} 加载索引范围 {start_index}-{end_index} 的报告...")
+    try:
+        paths = select_report_files_in_range(directory_path, start_index, end_index)
     except Exception as e:
-        print(f"❌ 加载目录 {directory_path} 时发生未知错误: {e}")
-        return []
+        logger.info(f"❌ 加载目录 {directory_path} 时发生未知错误: {e}")
+        return
+    loaded = yield from _iter_reports(paths)
+    logger.info(f"✅ 成功加载 {loaded} 条报告用于处理。")
 
 def validate_diagnostic_extraction(extraction: Dict[str, Any]) -> bool:
     """验证诊断提取结果的完整性"""
@@ -253,202 +348,517 @@ def validate_diagnostic_extraction(extraction: Dict[str, Any]) -> bool:
     
     for step, fields in required_fields.items():
         if step not in extraction:
-            print(f"⚠️ 诊断提取缺少步骤: {step}")
+            logger.info(f"⚠️ 诊断提取缺少步骤: {step}")
             return False
         for field in fields:
             if field not in extraction[step]:
-                print(f"⚠️ 步骤 {step} 缺少字段: {field}")
+                logger.info(f"⚠️ 步骤 {step} 缺少字段: {field}")
                 return False
     
     return True
 
+def _extract_top_level_json(text: str):
+    """
+    线性扫描括号深度，返回第一个最外层 {...} 片段 (忽略字符串内的括号)，未闭合时返回None
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    for i, c in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            if depth:
+                in_string = True
+        elif c == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif c == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
 def parse_diagnostic_response(response_text, step_name):
     """
     解析LLM返回的诊断结果，处理各种可能的格式
     """
     if not response_text:
-        print(f"   ⚠️ {step_name}: API返回空响应")
+        logger.info(f"   ⚠️ {step_name}: API返回空响应")
         return None
     
-    print(f"   📄 {step_name}: 收到响应 ({len(response_text)} 字符)")
+    logger.info(f"   📄 {step_name}: 收到响应 ({len(response_text)} 字符)")
     
     # 如果response_text是字典，提取response字段
     if isinstance(response_text, dict):
         if 'response' in response_text:
             response_text = response_text['response']
-            print(f"   🔧 {step_name}: 从字典中提取response字段")
+            logger.info(f"   🔧 {step_name}: 从字典中提取response字段")
         else:
-            print(f"   ❌ {step_name}: 字典响应中缺少response字段")
+            logger.info(f"   ❌ {step_name}: 字典响应中缺少response字段")
             return None
     
-    # 尝试提取JSON
-    json_patterns = [
-        r'```json\s*(\{.*?\})\s*```',  # ```json {...} ```
-        r'```\s*(\{.*?\})\s*```',      # ``` {...} ```  
-        r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'  # 匹配嵌套的JSON对象
-    ]
+    # JSON模式下响应本身就是一个JSON对象，直接解析
+    if response_text[:1] == '{':
+        try:
+            result = _json_loads(response_text)
+            logger.info(f"   ✅ {step_name}: JSON解析成功")
+            return result
+        except json.JSONDecodeError:
+            pass
     
-    for i, pattern in enumerate(json_patterns, 1):
-        matches = re.findall(pattern, response_text, re.DOTALL)
-        if matches:
-            print(f"   🎯 {step_name}: 使用模式{i}找到JSON")
-            json_str = matches[0] if isinstance(matches[0], str) else matches[0]
-            try:
-                result = json.loads(json_str)
-                print(f"   ✅ {step_name}: JSON解析成功")
-                return result
-            except json.JSONDecodeError as e:
-                print(f"   ⚠️ {step_name}: JSON解析失败 (模式{i}): {e}")
-                continue
+    # 快速路径：去掉```json代码块标记，线性扫描出最外层对象后用orjson解析
+    payload = response_text
+    if '```' in payload:
+        payload = payload.split('```json')[-1].split('```')[0]
+    payload = _extract_top_level_json(payload)
+    if payload is not None:
+        try:
+            result = _json_loads(payload)
+            logger.info(f"   ✅ {step_name}: JSON解析成功")
+            return result
+        except json.JSONDecodeError:
+            pass
+    
+    # 回退：从每个"{"处用raw_decode直接解析一个完整对象 (不使用正则，畸形响应也不会回溯卡死)
+    # 代码块标记和前后的说明文字会被自然跳过
+    pos = response_text.find("{")
+    attempts = 0
+    while pos != -1 and attempts < MAX_JSON_CANDIDATES:
+        attempts += 1
+        try:
+            result, _ = _JSON_DECODER.raw_decode(response_text, pos)
+            logger.info(f"   🎯 {step_name}: 在第{attempts}个候选位置找到JSON")
+            logger.info(f"   ✅ {step_name}: JSON解析成功")
+            return result
+        except json.JSONDecodeError:
+            pos = response_text.find("{", pos + 1)
+    
+    logger.info(f"   ❌ {step_name}: 所有JSON提取模式都失败")
+    logger.info(f"   📝 {step_name}: 原始响应前200字符: {response_text[:200]}...")
+    return None
+
+def parse_batched_diagnostic_response(response_text, step_name, count):
+    """
+    解析多分块合并请求的响应 ([{"chunk_id": 1, ...}, ...])，按chunk_id拆回各分块
+    
+    Returns:
+        长度为count的列表，缺失的分块为None
+    """
+    results = [None] * count
+    if isinstance(response_text, dict):
+        response_text = response_text.get('response')
+    if not response_text:
+        logger.info(f"   ⚠️ {step_name}: API返回空响应")
+        return results
+    
+    logger.info(f"   📄 {step_name}: 收到响应 ({len(response_text)} 字符)")
+    
+    pos = response_text.find("[")
+    attempts = 0
+    while pos != -1 and attempts < MAX_JSON_CANDIDATES:
+        attempts += 1
+        try:
+            parsed, _ = _JSON_DECODER.raw_decode(response_text, pos)
+        except json.JSONDecodeError:
+            parsed = None
+        if (isinstance(parsed, list) and all(isinstance(item, dict) for item in parsed)
+                and any("chunk_id" in item for item in parsed)):
+            for n, item in enumerate(parsed):
+                chunk_id = item.pop("chunk_id", n + 1)
+                try:
+                    index = int(chunk_id) - 1
+                except (TypeError, ValueError):
+                    index = n
+                if 0 <= index < count and results[index] is None:
+                    results[index] = item
+            logger.info(f"   ✅ {step_name}: 解析出 {sum(item is not None for item in results)}/{count} 个分块结果")
+            return results
+        pos = response_text.find("[", pos + 1)
+    
+    logger.info(f"   ❌ {step_name}: 未找到分块结果数组")
+    return results
+
+def _normalize_integrated_result(result):
+    """
+    整合提示词的结果统一为 s -> U 列表：数组原样返回；单个 s 条目放入列表；
+    其他单个对象视为一个u_unit，包装为占位症状
+    """
+    if isinstance(result, list):
+        return result
+    if "s_symptom" in result or "U_unit_set" in result:
+        return [result]
+    return [{
+        "s_symptom": "integrated_extraction",
+        "U_unit_set": [{"u_unit": result}]
+    }]
+
+def parse_integrated_response(response_text, step_name):
+    """
+    解析整合提示词的响应 (JSON数组 [{"s_symptom": ..., "U_unit_set": [...]}, ...])
+    
+    Returns:
+        标准化的 s -> U 结果列表，解析失败时返回None
+    """
+    if isinstance(response_text, dict):
+        response_text = response_text.get('response')
+    if not response_text:
+        logger.info(f"   ⚠️ {step_name}: API返回空响应")
+        return None
+    
+    logger.info(f"   📄 {step_name}: 收到响应 ({len(response_text)} 字符)")
+    
+    # 快速路径：去掉代码块标记后整段就是一个JSON数组或对象
+    fence = _CODE_FENCE_RE.search(response_text)
+    payload = (fence.group(1) if fence else response_text).strip()
+    if payload[:1] in ('[', '{'):
+        try:
+            result = _json_loads(payload)
+        except json.JSONDecodeError:
+            result = None
+        if isinstance(result, dict) or (isinstance(result, list) and all(isinstance(item, dict) for item in result)):
+            logger.info(f"   ✅ {step_name}: JSON解析成功")
+            return _normalize_integrated_result(result)
+    
+    # 回退：从每个"["或"{"处用raw_decode解析一个完整值，跳过说明文字中的 [1] 之类的非结果数组
+    match = _JSON_START_RE.search(response_text)
+    attempts = 0
+    while match is not None and attempts < MAX_JSON_CANDIDATES:
+        attempts += 1
+        try:
+            result, _ = _JSON_DECODER.raw_decode(response_text, match.start())
+        except json.JSONDecodeError:
+            result = None
+        if isinstance(result, dict) or (isinstance(result, list) and all(isinstance(item, dict) for item in result)):
+            logger.info(f"   🎯 {step_name}: 在第{attempts}个候选位置找到JSON")
+            return _normalize_integrated_result(result)
+        match = _JSON_START_RE.search(response_text, match.start() + 1)
     
-    print(f"   ❌ {step_name}: 所有JSON提取模式都失败")
-    print(f"   📝 {step_name}: 原始响应前200字符: {response_text[:200]}...")
+    logger.info(f"   ❌ {step_name}: 未找到整合结果")
+    logger.info(f"   📝 {step_name}: 原始响应前200字符: {response_text[:200]}...")
     return None
 
+# 智能分块的章节模式，分为患者陈述和医生诊断两类 (模块加载时编译)
+PATIENT_SECTION_PATTERNS = [
+    (r'chief complaint:?', 'chief complaint'),
+    (r'history of present illness:?', 'history of present illness'),
+    (r'present illness:?', 'present illness'),
+    (r'complaint:?', 'patient complaint'),
+    (r'patient reports:?', 'patient reports'),
+    (r'patient states:?', 'patient states'),
+    (r'patient complains of:?', 'patient complains'),
+    (r'subjective:?', 'subjective'),
+    (r'symptoms:?', 'symptoms'),
+    (r'clinical symptoms:?', 'clinical symptoms')
+]
+
+PHYSICIAN_SECTION_PATTERNS = [
+    (r'assessment and plan:?', 'assessment and plan'),
+    (r'assessment:?', 'assessment'),
+    (r'impression:?', 'impression'),
+    (r'diagnosis:?', 'diagnosis'),
+    (r'plan:?', 'treatment plan'),
+    (r'discharge diagnosis:?', 'discharge diagnosis'),
+    (r'brief hospital course:?', 'hospital course'),
+    # 新增常见诊断/判断章节别名
+    (r'final diagnosis:?', 'final diagnosis'),
+    (r'clinical impression:?', 'clinical impression'),
+    (r'medical decision making:?', 'medical decision making'),
+    (r'\bmdm\b:?', 'medical decision making'),
+    (r'findings:?', 'findings'),
+    (r'ed course:?', 'ed course'),
+    (r'emergency department course:?', 'ed course'),
+    (r'plan and recommendations:?', 'plan and recommendations'),
+    (r'disposition:?', 'disposition')
+]
+
+# 忽略大小写直接匹配原文，不再为每份报告生成小写副本
+_PATIENT_SECTION_RES = [(re.compile(pattern, re.IGNORECASE), name) for pattern, name in PATIENT_SECTION_PATTERNS]
+_PHYSICIAN_SECTION_RES = [(re.compile(pattern, re.IGNORECASE), name) for pattern, name in PHYSICIAN_SECTION_PATTERNS]
+
+# 可能包含症状叙述的医生诊断章节 (章节名含course/history/narrative)，按完整的分块section名预先计算
+NARRATIVE_SECTION_KEYWORDS = ('course', 'history', 'narrative')
+NARRATIVE_PHYSICIAN_SECTIONS = frozenset(
+    f"physician_{name}" for _, name in PHYSICIAN_SECTION_PATTERNS
+    if any(keyword in f"physician_{name}" for keyword in NARRATIVE_SECTION_KEYWORDS)
+)
+
+def _boundary_regex(patterns) -> "re.Pattern":
+    """零宽前瞻的合并模式：一次扫描即可得到任一章节模式出现的所有起始位置 (包括互相重叠的位置)"""
+    return re.compile("(?=" + "|".join(pattern for pattern, _ in patterns) + ")", re.IGNORECASE)
+
+_ALL_SECTION_BOUNDARY_RE = _boundary_regex(PATIENT_SECTION_PATTERNS + PHYSICIAN_SECTION_PATTERNS)
+_PHYSICIAN_SECTION_BOUNDARY_RE = _boundary_regex(PHYSICIAN_SECTION_PATTERNS)
+
 def smart_chunk_medical_report(text: str) -> List[Dict[str, str]]:
     """
     基于医学报告结构进行智能分块，专门为诊断蒸馏优化
+    章节边界位置只扫描一次，每个章节的结束位置用二分查找确定，不再对每个匹配重新扫描所有模式
     返回: [{"section": "章节名", "content": "内容", "type": "类型"}, ...]
     """
-    import re
-    
-    # 优化的章节模式，分为患者陈述和医生诊断两类
-    patient_section_patterns = [
-        (r'chief complaint:?', 'chief complaint'),
-        (r'history of present illness:?', 'history of present illness'),
-        (r'present illness:?', 'present illness'),
-        (r'complaint:?', 'patient complaint'),
-        (r'patient reports:?', 'patient reports'),
-        (r'patient states:?', 'patient states'),
-        (r'patient complains of:?', 'patient complains'),
-        (r'subjective:?', 'subjective'),
-        (r'symptoms:?', 'symptoms'),
-        (r'clinical symptoms:?', 'clinical symptoms')
-    ]
-    
-    physician_section_patterns = [
-        (r'assessment and plan:?', 'assessment and plan'),
-        (r'assessment:?', 'assessment'),
-        (r'impression:?', 'impression'),
-        (r'diagnosis:?', 'diagnosis'),
-        (r'plan:?', 'treatment plan'),
-        (r'discharge diagnosis:?', 'discharge diagnosis'),
-        (r'brief hospital course:?', 'hospital course'),
-        # 新增常见诊断/判断章节别名
-        (r'final diagnosis:?', 'final diagnosis'),
-        (r'clinical impression:?', 'clinical impression'),
-        (r'medical decision making:?', 'medical decision making'),
-        (r'\bmdm\b:?', 'medical decision making'),
-        (r'findings:?', 'findings'),
-        (r'ed course:?', 'ed course'),
-        (r'emergency department course:?', 'ed course'),
-        (r'plan and recommendations:?', 'plan and recommendations'),
-        (r'disposition:?', 'disposition')
-    ]
-    
     chunks = []
-    text_lower = text.lower()
     processed_ranges = []
     
-    # 处理患者陈述章节
-    for pattern, canonical_name in patient_section_patterns:
-        matches = list(re.finditer(pattern, text_lower))
-        for match in matches:
-            start_pos = match.start()
-            
-            # 检查重叠
-            is_overlapping = any(
-                abs(start_pos - existing_start) < 300
-                for existing_start, _ in processed_ranges
-            )
-            if is_overlapping:
-                continue
-            
-            # 找到章节结束位置
-            end_pos = len(text)
-            for next_pattern, _ in patient_section_patterns + physician_section_patterns:
-                next_matches = list(re.finditer(next_pattern, text_lower[start_pos + len(match.group()):]))
-                if next_matches:
-                    potential_end = start_pos + len(match.group()) + next_matches[0].start()
-                    if potential_end > start_pos and potential_end < end_pos:
-                        end_pos = potential_end
-            
-            section_content = text[start_pos:end_pos].strip()
-            if len(section_content) > 100:  # 最小长度要求
-                chunks.append({
-                    "section": f"patient_{canonical_name}",
-                    "content": section_content,
-                    "type": "patient_complaint"
-                })
-                processed_ranges.append((start_pos, end_pos))
-                print(f"   🔍 识别到患者陈述章节: '{canonical_name}' ({len(section_content)} 字符)")
-                break
-    
-    # 处理医生诊断章节
-    for pattern, canonical_name in physician_section_patterns:
-        matches = list(re.finditer(pattern, text_lower))
-        for match in matches:
-            start_pos = match.start()
-            
-            # 检查重叠
-            is_overlapping = any(
-                abs(start_pos - existing_start) < 300
-                for existing_start, _ in processed_ranges
-            )
-            if is_overlapping:
-                continue
-            
-            # 找到章节结束位置
-            end_pos = len(text)
-            for next_pattern, _ in physician_section_patterns:
-                next_matches = list(re.finditer(next_pattern, text_lower[start_pos + len(match.group()):]))
-                if next_matches:
-                    potential_end = start_pos + len(match.group()) + next_matches[0].start()
-                    if potential_end > start_pos and potential_end < end_pos:
-                        end_pos = potential_end
-            
-            section_content = text[start_pos:end_pos].strip()
-            if len(section_content) > 100:  # 最小长度要求
-                chunks.append({
-                    "section": f"physician_{canonical_name}",
-                    "content": section_content,
-                    "type": "physician_diagnosis"
-                })
-                processed_ranges.append((start_pos, end_pos))
-                print(f"   🔍 识别到医生诊断章节: '{canonical_name}' ({len(section_content)} 字符)")
-                break
+    # 章节结束位置 = 本章节标题之后第一个出现的章节标题
+    # 患者陈述章节以任意章节标题为界，医生诊断章节只以医生诊断章节标题为界
+    all_boundaries = [m.start() for m in _ALL_SECTION_BOUNDARY_RE.finditer(text)]
+    physician_boundaries = [m.start() for m in _PHYSICIAN_SECTION_BOUNDARY_RE.finditer(text)]
+    
+    def _section_end(boundaries, after):
+        idx = bisect_left(boundaries, after)
+        return boundaries[idx] if idx < len(boundaries) else len(text)
+    
+    for section_res, boundaries, prefix, chunk_type, label in (
+        (_PATIENT_SECTION_RES, all_boundaries, "patient", "patient_complaint", "患者陈述"),
+        (_PHYSICIAN_SECTION_RES, physician_boundaries, "physician", "physician_diagnosis", "医生诊断"),
+    ):
+        for pattern, canonical_name in section_res:
+            for match in pattern.finditer(text):
+                start_pos = match.start()
+                
+                # 检查重叠
+                is_overlapping = any(
+                    abs(start_pos - existing_start) < 300
+                    for existing_start, _ in processed_ranges
+                )
+                if is_overlapping:
+                    continue
+                
+                # 找到章节结束位置
+                end_pos = _section_end(boundaries, match.end())
+                
+                section_content = text[start_pos:end_pos].strip()
+                if len(section_content) > 100:  # 最小长度要求
+                    chunks.append({
+                        "section": f"{prefix}_{canonical_name}",
+                        "content": section_content,
+                        "type": chunk_type
+                    })
+                    processed_ranges.append((start_pos, end_pos))
+                    logger.info(f"   🔍 识别到{label}章节: '{canonical_name}' ({len(section_content)} 字符)")
+                    break
     
     if not chunks:
-        print("⚠️ 未找到标准章节，使用整体处理")
+        logger.info("⚠️ 未找到标准章节，使用整体处理")
         return [{
             "section": "full_report",
             "content": text,
             "type": "mixed"
         }]
     
-    print(f"   📊 智能分块完成，共 {len(chunks)} 个有效块")
+    logger.info(f"   📊 智能分块完成，共 {len(chunks)} 个有效块")
     return chunks
 
-def _fallback_extract_organs_on_full_text(extractor, report_text, prompts, report_num, api_key_name):
+async def _acall_step(extractor, prompt_parts, step_name, report_num, semaphore, client=None):
+    """
+    异步执行一次步骤调用并解析结果 (各步骤的单次请求都返回一个JSON对象，使用JSON模式)
+    
+    Args:
+        prompt_parts: (system, user) 提示词
+        semaphore: 限制同一API密钥的并发请求数
+        client: 可选的httpx.AsyncClient
+    
+    Returns:
+        解析后的结果，失败时返回None
+    """
+    try:
+        system_prompt, prompt = prompt_parts
+        async with semaphore:
+            response = await extractor.acall_api(prompt, system_prompt=system_prompt, client=client,
+                                                 response_format=JSON_OBJECT_FORMAT)
+        return parse_diagnostic_response(response, step_name)
+    except Exception as e:
+        print_error_info(e, report_num, step_name)
+        return None
+
+def _batch_chunk_indices(chunks: List[Dict[str, str]]) -> List[List[int]]:
+    """将相邻分块按CHUNKS_PER_CALL和MAX_CHUNK_BATCH_CHARS分组，返回每组的分块下标"""
+    batches = []
+    current, chars = [], 0
+    for i, chunk in enumerate(chunks):
+        size = len(chunk['content'])
+        if current and (len(current) >= CHUNKS_PER_CALL or chars + size > MAX_CHUNK_BATCH_CHARS):
+            batches.append(current)
+            current, chars = [], 0
+        current.append(i)
+        chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _should_fuse_steps(chunks, patient_chunks, physician_chunks) -> bool:
+    """两类分块都存在且估算token数低于FUSION_THRESHOLD时，步骤1和步骤2融合为一次请求"""
+    if not patient_chunks or not physician_chunks:
+        return False
+    return sum(len(chunk['content']) for chunk in chunks) // CHARS_PER_TOKEN_ESTIMATE < FUSION_THRESHOLD
+
+def _chunk_request_parts(chunks, get_parts, get_batch_parts) -> List[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    """
+    按_batch_chunk_indices分组，返回一组分块实际发送的各个 (system, user, response_format)
+    单个分块经_acall_step使用JSON模式，多个分块合并的请求返回数组，不使用JSON模式
+    """
+    return [
+        (*get_parts(chunks[indices[0]]['content']), JSON_OBJECT_FORMAT) if len(indices) == 1
+        else (*get_batch_parts([chunks[i]['content'] for i in indices]), None)
+        for indices in _batch_chunk_indices(chunks)
+    ]
+
+def first_stage_request_parts(report_text: str, prompts) -> List[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    """
+    计算aprocess_report_with_diagnostic_steps第一阶段 (描述性内容提取和器官提取) 会发送的
+    (system, user, response_format)，response_format参与响应缓存键，必须与实际请求一致
+    后续阶段依赖第一阶段的结果，无法预先计算；Batch模式据此预先获取第一阶段的响应
+    """
+    chunks = smart_chunk_medical_report(report_text)
+    patient_chunks = [chunk for chunk in chunks if chunk.get('type') == 'patient_complaint']
+    physician_chunks = [chunk for chunk in chunks if chunk.get('type') == 'physician_diagnosis']
+    if _should_fuse_steps(chunks, patient_chunks, physician_chunks):
+        return [(*prompts.get_step1_plus_step2_combined_prompt_parts(
+            [chunk['content'] for chunk in patient_chunks], [chunk['content'] for chunk in physician_chunks]
+        ), JSON_OBJECT_FORMAT)]
+    return (_chunk_request_parts(patient_chunks, prompts.get_step1_prompt_parts, prompts.get_step1_batch_prompt_parts)
+            + _chunk_request_parts(physician_chunks, prompts.get_step2_prompt_parts,
+                                   prompts.get_step2_batch_prompt_parts))
+
+async def _acall_chunks(extractor, chunks, get_parts, get_batch_parts, step_label, report_num, api_key_name,
+                        semaphore, client=None):
+    """
+    对一组分块执行同一步骤的提取：每次请求合并多个分块，合并响应中缺失的分块再单独请求
+    
+    Args:
+        get_parts: 单个分块的提示词构建函数
+        get_batch_parts: 多个分块合并的提示词构建函数
+        step_label: 步骤名称 (用于日志)
+    
+    Returns:
+        与chunks一一对应的解析结果列表，失败的分块为None
+    """
+    results = [None] * len(chunks)
+    
+    async def _run_single(i):
+        print_api_call_info(api_key_name, report_num, step_label, i+1)
+        results[i] = await _acall_step(extractor, get_parts(chunks[i]['content']),
+                                       f"{step_label}-块{i+1}", report_num, semaphore, client)
+    
+    async def _run_batch(indices):
+        if len(indices) == 1:
+            await _run_single(indices[0])
+            return
+        block = f"{indices[0]+1}~{indices[-1]+1}"
+        batch_name = f"{step_label}-块{block}"
+        print_api_call_info(api_key_name, report_num, step_label, block)
+        try:
+            system_prompt, prompt = get_batch_parts([chunks[i]['content'] for i in indices])
+            async with semaphore:
+                response = await extractor.acall_api(prompt, system_prompt=system_prompt, client=client)
+            parsed = parse_batched_diagnostic_response(response, batch_name, len(indices))
+        except Exception as e:
+            print_error_info(e, report_num, batch_name)
+            parsed = [None] * len(indices)
+        
+        missing = []
+        for i, item in zip(indices, parsed):
+            if item is None:
+                missing.append(i)
+            else:
+                results[i] = item
+        if missing:
+            logger.info(f"   ⚠️ {batch_name}: {len(missing)} 个分块缺少结果，单独重试")
+            await asyncio.gather(*(_run_single(i) for i in missing))
+    
+    await asyncio.gather(*(_run_batch(indices) for indices in _batch_chunk_indices(chunks)))
+    return results
+
+async def _acall_fused_steps(extractor, patient_chunks, physician_chunks, prompts, report_num, api_key_name,
+                             semaphore, client=None):
+    """
+    步骤1和步骤2融合为一次请求，按 "step1"/"step2" 拆回两步结果
+    
+    Returns:
+        (step1_parsed, step2_parsed)，格式与_acall_chunks相同；融合响应无法解析时返回None
+    """
+    print_api_call_info(api_key_name, report_num, "描述性内容+器官提取(融合)")
+    combined = await _acall_step(
+        extractor,
+        prompts.get_step1_plus_step2_combined_prompt_parts(
+            [chunk['content'] for chunk in patient_chunks], [chunk['content'] for chunk in physician_chunks]
+        ),
+        "描述性内容+器官提取(融合)", report_num, semaphore, client
+    )
+    if not isinstance(combined, dict) or not isinstance(combined.get("step1"), dict) \
+            or not isinstance(combined.get("step2"), dict):
+        logger.info("   ⚠️ 融合请求未返回两步结果，回退到分步提取")
+        return None
+    return [combined["step1"]], [combined["step2"]]
+
+async def _afallback_extract_organs_on_full_text(extractor, report_text, prompts, report_num, api_key_name,
+                                                 semaphore, client=None):
     """
     一个回退函数，当智能分块未能识别到任何医生诊断章节时，
     该函数会在整个报告文本上运行一次器官提取。
     """
     results = []
-    try:
-        print_api_call_info(api_key_name, report_num, "器官提取-整篇回退")
-        prompt = prompts.get_step2_diagnosis_organ_extraction_prompt(report_text).replace("{text_content}", report_text)
-        response = extractor.call_api(prompt)
-        parsed = parse_diagnostic_response(response, "器官提取-整篇回退")
-        if parsed:
-            results.append(parsed)
-            print("   ✅ 整篇回退: 成功提取器官")
-        else:
-            print("   ⚠️ 整篇回退: 器官提取失败")
-    except Exception as e:
-        print_error_info(e, report_num, "器官提取-整篇回退")
+    print_api_call_info(api_key_name, report_num, "器官提取-整篇回退")
+    parsed = await _acall_step(extractor, prompts.get_step2_prompt_parts(report_text),
+                               "器官提取-整篇回退", report_num, semaphore, client)
+    if parsed:
+        results.append(parsed)
+        logger.info("   ✅ 整篇回退: 成功提取器官")
+    else:
+        logger.info("   ⚠️ 整篇回退: 器官提取失败")
     return results
 
+# 身体系统 -> 相关器官 (小写形式在模块加载时计算一次)
+BODY_SYSTEM_ORGANS = {
+    "cardiovascular": ["Heart (Cor)", "Artery (Arteria)", "Vein (Vena)"],
+    "respiratory": ["Lung (Pulmo)", "Trachea", "Bronchus"],
+    "gastrointestinal": ["Liver (Hepar)", "Stomach (Gaster)", "Pancreas", "Esophagus"],
+    "neurological": ["Brain", "Cerebellum", "Brainstem"],
+    "genitourinary": ["Kidney (Ren)", "Urinary bladder (Vesica urinaria)"],
+    "endocrine": ["Thyroid gland", "Pancreas", "Adrenal gland (Suprarenal gland)"]
+}
+_BODY_SYSTEM_ORGANS_LOWER = {
+    system: tuple(organ.lower() for organ in organs)
+    for system, organs in BODY_SYSTEM_ORGANS.items()
+}
+
+# 模糊的解剖位置描述 (忽略大小写，一次扫描判断是否包含任一模糊词)
+_VAGUE_LOCATION_RE = re.compile(r"general area|multiple systems|general|unspecified|unknown", re.IGNORECASE)
+
+# 器官 -> 预定义解剖位置的不可变副本，以及去掉模糊描述后的具体位置 (模块加载时计算一次)
+_ORGAN_ANATOMY_TUPLES = {organ: tuple(locations) for organ, locations in ORGAN_ANATOMY_STRUCTURE.items()}
+_CONCRETE_ORGAN_LOCATIONS = {
+    organ: tuple(loc for loc in locations if not _VAGUE_LOCATION_RE.search(loc))
+    for organ, locations in _ORGAN_ANATOMY_TUPLES.items()
+}
+
+# 同一批器官名称会反复出现，缓存标准化结果
+_normalize_organ = functools.lru_cache(maxsize=8192)(normalize_organ)
+
+@functools.lru_cache(maxsize=8192)
+def _get_default_anatomical_locations(organ_name: str) -> Tuple[str, ...]:
+    """为器官获取默认的解剖位置 (按器官名缓存，返回不可变元组)"""
+    normalized_organ = _normalize_organ(organ_name)
+    if normalized_organ in _ORGAN_ANATOMY_TUPLES:
+        return _ORGAN_ANATOMY_TUPLES[normalized_organ][:2]  # 返回前2个位置
+    return ("General area", "Main structure")
+
+@functools.lru_cache(maxsize=4096)
+def _is_body_system_match(body_system: str, organ_name: str) -> bool:
+    """检查身体系统是否与器官匹配 (双向子串匹配，结果按 (系统, 器官名) 缓存)"""
+    organ_lower = organ_name.lower()
+    for organ in _BODY_SYSTEM_ORGANS_LOWER.get(body_system, ()):
+        if organ in organ_lower or organ_lower in organ:
+            return True
+    return False
+
 def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[Dict[str, Any]], mapping_result: Dict[str, Any], original_text: str) -> List[Dict[str, Any]]:
     """
     将三步结果规范化为所需结构：
@@ -460,29 +870,6 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
     3. 无法确定器官的症状直接过滤掉
     """
     # _organ_key_match函数已删除，现在使用configs/model_config.py中的normalize_organ函数
-    
-    def _is_body_system_match(body_system: str, organ_name: str) -> bool:
-        """检查身体系统是否与器官匹配"""
-        system_organ_map = {
-            "cardiovascular": ["Heart (Cor)", "Artery (Arteria)", "Vein (Vena)"],
-            "respiratory": ["Lung (Pulmo)", "Trachea", "Bronchus"],
-            "gastrointestinal": ["Liver (Hepar)", "Stomach (Gaster)", "Pancreas", "Esophagus"],
-            "neurological": ["Brain", "Cerebellum", "Brainstem"],
-            "genitourinary": ["Kidney (Ren)", "Urinary bladder (Vesica urinaria)"],
-            "endocrine": ["Thyroid gland", "Pancreas", "Adrenal gland (Suprarenal gland)"]
-        }
-        
-        for organ in system_organ_map.get(body_system, []):
-            if organ.lower() in organ_name.lower() or organ_name.lower() in organ.lower():
-                return True
-        return False
-    
-    def _get_default_anatomical_locations(organ_name: str) -> list:
-        """为器官获取默认的解剖位置"""
-        normalized_organ = normalize_organ(organ_name)
-        if normalized_organ in ORGAN_ANATOMY_STRUCTURE:
-            return ORGAN_ANATOMY_STRUCTURE[normalized_organ][:2]  # 返回前2个位置
-        return ["General area", "Main structure"]
 
     # （本段保留空行用于可读性）
 
@@ -490,11 +877,11 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
 
     # --- 使用model_config.py中的完整器官列表 ---
     # ALLOWED_ORGANS 现在从 configs/model_config.py 导入，包含55个器官
-    print(f"   🔧 使用完整器官列表: {len(ALLOWED_ORGANS)} 个器官")
+    logger.info(f"   🔧 使用完整器官列表: {len(ALLOWED_ORGANS)} 个器官")
     
     # 器官名称标准化函数现在从 model_config.py 导入
 
-    print("   🔄 开始标准化新的描述性内容结构...")
+    logger.info("   🔄 开始标准化新的描述性内容结构...")
     
     # 收集所有描述性发现 (s_symptom) - 适配新的数据结构
     all_descriptive_findings = []
@@ -530,9 +917,9 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
                             "confidence": "medium"
                         })
             
-            print(f"   📊 从step1提取到 {len(findings)} 个描述性发现")
+            logger.info(f"   📊 从step1提取到 {len(findings)} 个描述性发现")
         except Exception as e:
-            print(f"   ⚠️ 描述性发现解析错误: {e}")
+            logger.info(f"   ⚠️ 描述性发现解析错误: {e}")
             continue
     
     # 收集所有医生诊断
@@ -571,14 +958,14 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
                                 "confidence": "medium"
                             })
             
-            print(f"   📊 从step2提取到 {len(diagnoses)} 个医生诊断")
+            logger.info(f"   📊 从step2提取到 {len(diagnoses)} 个医生诊断")
         except Exception as e:
-            print(f"   ⚠️ 诊断解析错误: {e}")
+            logger.info(f"   ⚠️ 诊断解析错误: {e}")
             continue
 
     # 获取症状-器官映射
     mapping_list = (mapping_result or {}).get("symptom_organ_mappings", []) if isinstance(mapping_result, dict) else []
-    print(f"   📊 获取到 {len(mapping_list)} 个症状-器官映射")
+    logger.info(f"   📊 获取到 {len(mapping_list)} 个症状-器官映射")
 
     # 构建最终标准化输出结构: s → U
     final_output = []
@@ -586,37 +973,36 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
     # 🔧 修复：从映射中提取所有唯一症状，而不仅仅依赖Step1
     all_unique_symptoms = set()
     
-    # 从描述性发现中收集症状
+    # 按症状预建索引，避免对每个症状重复线性扫描映射和描述性发现: O(S·M) -> O(S + M)
+    finding_by_symptom = {}
+    mappings_by_symptom = defaultdict(list)
+    
+    # 从描述性发现中收集症状 (同一症状保留第一条发现)
     for finding in all_descriptive_findings:
         all_unique_symptoms.add(finding["s_symptom"])
+        finding_by_symptom.setdefault(finding["s_symptom"], finding)
     
     # 从映射中收集额外的症状（防止Step1遗漏）
     for mp in mapping_list:
         if isinstance(mp, dict) and mp.get("patient_symptom"):
             all_unique_symptoms.add(mp.get("patient_symptom"))
+            mappings_by_symptom[mp.get("patient_symptom")].append(mp)
     
-    print(f"   📊 发现 {len(all_unique_symptoms)} 个唯一症状需要处理")
+    logger.info(f"   📊 发现 {len(all_unique_symptoms)} 个唯一症状需要处理")
     
     for s_symptom in all_unique_symptoms:
-        print(f"   🔍 处理症状: {s_symptom}")
+        logger.info(f"   🔍 处理症状: {s_symptom}")
         
         # 为每个症状构建U_unit_set
         U_unit_set = []
         
-        # 找到与该症状相关的所有映射
-        symptom_mappings = []
-        for mp in mapping_list:
-            if isinstance(mp, dict) and mp.get("patient_symptom") == s_symptom:
-                symptom_mappings.append(mp)
+        # 找到与该症状相关的所有映射 (复制一份，下面可能追加合成映射)
+        symptom_mappings = list(mappings_by_symptom.get(s_symptom, ()))
         
         # 如果没有直接映射，尝试通过诊断信息创建映射
         if not symptom_mappings:
             # 查找对应的描述性发现信息（如果存在）
-            finding_info = None
-            for finding in all_descriptive_findings:
-                if finding["s_symptom"] == s_symptom:
-                    finding_info = finding
-                    break
+            finding_info = finding_by_symptom.get(s_symptom)
             
             # 根据描述性发现的body_system尝试匹配相关诊断
             finding_body_system = finding_info.get("body_system", "other") if finding_info else "other"
@@ -629,7 +1015,7 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
                         synthetic_mapping = {
                             "patient_symptom": s_symptom,
                             "diagnosed_organ": organ_name,
-                            "anatomical_locations": _get_default_anatomical_locations(organ_name),
+                            "anatomical_locations": list(_get_default_anatomical_locations(organ_name)),
                             "text_evidence": {
                                 "symptom_source": finding_info.get("source_quote", "") if finding_info else "",
                                 "diagnosis_source": diagnosis.get("source_quote", ""),
@@ -637,51 +1023,45 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
                             }
                         }
                         symptom_mappings.append(synthetic_mapping)
-                        print(f"   🔗 创建合成映射: {s_symptom} -> {organ_name}")
+                        logger.info(f"   🔗 创建合成映射: {s_symptom} -> {organ_name}")
                         break
         
         # 处理找到的映射
         for mp in symptom_mappings:
             organ_name_raw = mp.get("diagnosed_organ", "")
-            normalized_organ = normalize_organ(organ_name_raw)
+            normalized_organ = _normalize_organ(organ_name_raw)
             locations = mp.get("anatomical_locations", []) or []
             
             # 器官验证：使用normalize_organ函数和完整的ALLOWED_ORGANS列表
-            if normalized_organ == "unknown" or normalized_organ not in ALLOWED_ORGANS:
-                print(f"   🗑️ 过滤掉非预定义器官: {organ_name_raw} -> {normalized_organ}")
+            if normalized_organ == "unknown" or normalized_organ not in _ALLOWED_ORGAN_SET:
+                logger.info(f"   🗑️ 过滤掉非预定义器官: {organ_name_raw} -> {normalized_organ}")
                 continue
             
             # 严格解剖位置验证：必须有具体位置，不能是模糊描述
             if not locations:
-                print(f"   🗑️ 过滤掉无解剖位置的症状: {s_symptom}")
+                logger.info(f"   🗑️ 过滤掉无解剖位置的症状: {s_symptom}")
                 continue
             
             # 过滤掉模糊的解剖位置描述
-            vague_locations = ["general area", "multiple systems", "general", "unspecified", "unknown"]
-            filtered_locations = []
-            for loc in locations:
-                loc_lower = loc.lower()
-                if not any(vague in loc_lower for vague in vague_locations):
-                    filtered_locations.append(loc)
+            filtered_locations = [loc for loc in locations if not _VAGUE_LOCATION_RE.search(loc)]
             
             # 如果过滤后没有具体位置，跳过这个症状
             if not filtered_locations:
-                print(f"   🗑️ 过滤掉只有模糊解剖位置的症状: {s_symptom} -> {normalized_organ}")
+                logger.info(f"   🗑️ 过滤掉只有模糊解剖位置的症状: {s_symptom} -> {normalized_organ}")
                 continue
             
             # 确保至少有2个具体的解剖位置
             if len(filtered_locations) < 2:
                 # 从预定义结构中补充具体位置
-                if normalized_organ in ORGAN_ANATOMY_STRUCTURE:
-                    available = [loc for loc in ORGAN_ANATOMY_STRUCTURE[normalized_organ] 
-                               if loc not in filtered_locations and 
-                               not any(vague in loc.lower() for vague in vague_locations)]
-                    while len(filtered_locations) < 2 and available:
-                        filtered_locations.append(available.pop(0))
+                for loc in _CONCRETE_ORGAN_LOCATIONS.get(normalized_organ, ()):
+                    if len(filtered_locations) >= 2:
+                        break
+                    if loc not in filtered_locations:
+                        filtered_locations.append(loc)
                 
                 # 如果仍然少于2个，跳过这个症状
                 if len(filtered_locations) < 2:
-                    print(f"   🗑️ 过滤掉解剖位置不足的症状: {s_symptom} -> {normalized_organ} (只有{len(filtered_locations)}个位置)")
+                    logger.info(f"   🗑️ 过滤掉解剖位置不足的症状: {s_symptom} -> {normalized_organ} (只有{len(filtered_locations)}个位置)")
                     continue
             
             # 构建u_unit
@@ -690,7 +1070,7 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
             # 验证诊断信息 - 适配新结构
             diagnosis = text_evidence.get("diagnosis_source", "") or text_evidence.get("organ_source", "")
             if not diagnosis or diagnosis.lower() in ["unknown", "unknown diagnosis", "n/a"]:
-                print(f"   🗑️ 过滤掉诊断信息不明的症状: {s_symptom}")
+                logger.info(f"   🗑️ 过滤掉诊断信息不明的症状: {s_symptom}")
                 continue
             
             u_unit = {
@@ -705,11 +1085,11 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
                 }
             }
             U_unit_set.append({"u_unit": u_unit})
-            print(f"   ✅ 成功创建诊断单元: {s_symptom} -> {normalized_organ} -> {filtered_locations}")
+            logger.info(f"   ✅ 成功创建诊断单元: {s_symptom} -> {normalized_organ} -> {filtered_locations}")
         
         # 关键约束：如果U_unit_set为空，直接跳过这个描述性发现，不记录在JSON中
         if not U_unit_set:
-            print(f"   🗑️ 描述性发现 '{s_symptom}' 无法确定器官或解剖位置，已过滤掉")
+            logger.info(f"   🗑️ 描述性发现 '{s_symptom}' 无法确定器官或解剖位置，已过滤掉")
             continue
         
         # 构建最终的s_symptom条目 - 标准化格式 s → U（恢复无条件加入）
@@ -718,23 +1098,97 @@ def _normalize_outputs(step1_results: List[Dict[str, Any]], step2_results: List[
             "U_unit_set": U_unit_set
         })
     
-    print(f"   📊 最终输出: {len(final_output)} 个有效症状（已过滤掉无法确定器官的症状）")
+    logger.info(f"   📊 最终输出: {len(final_output)} 个有效症状（已过滤掉无法确定器官的症状）")
     return final_output
 
+async def _acall_integrated(extractor, report_text, prompts, report_num, api_key_name, semaphore, client=None):
+    """
+    使用整合提示词一次请求直接得到最终格式的结果
+    
+    Returns:
+        标准化的 s -> U 结果列表，解析失败时返回None (请求异常向上抛出)
+    """
+    print_api_call_info(api_key_name, report_num, "整合提示词")
+    system_prompt, prompt = prompts.get_integrated_prompt_parts(report_text)
+    async with semaphore:
+        response = await extractor.acall_api(prompt, system_prompt=system_prompt, client=client)
+    # 整合提示词直接返回最终格式 (JSON数组)
+    integrated_result = parse_integrated_response(response, "整合提示词")
+    if not integrated_result:
+        return None
+    
+    logger.info("   ✅ 整合提示词成功")
+    # 整合提示词的结果就是标准化的结果
+    print_extraction_summary(integrated_result)
+    return integrated_result
+
+def process_report_with_integrated_prompt(extractor, report_data, report_num, prompts, api_key_name):
+    """
+    使用整合提示词处理单个报告 (同步入口)：一次请求完成三步法的全部工作，
+    请求数和重复发送的报告文本都只有三步法的几分之一；三步法保留用于调试和对比
+    """
+    return asyncio.run(aprocess_report_with_integrated_prompt(extractor, report_data, report_num, prompts, api_key_name))
+
+async def aprocess_report_with_integrated_prompt(extractor, report_data, report_num, prompts, api_key_name,
+                                                 semaphore=None, client=None):
+    """
+    使用整合提示词处理单个报告 (异步版本)，返回格式与三步法相同
+    
+    Returns:
+        {"raw": ..., "normalized": [...]}，缺少报告内容、请求或解析失败时返回None
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(STEP_CONCURRENCY)
+    
+    logger.info(f"\n🏥 开始处理报告 {report_num} (整合提示词)")
+    logger.info("-" * 60)
+    
+    report_text = report_data.get('text', '') or report_data.get('medical_record_content', '')
+    if not report_text:
+        logger.info(f"❌ 报告 {report_num}: 缺少医疗记录内容")
+        return None
+    
+    try:
+        integrated_result = await _acall_integrated(extractor, report_text, prompts, report_num, api_key_name,
+                                                    semaphore, client)
+    except Exception as e:
+        print_error_info(e, report_num, "整合提示词")
+        return None
+    if not integrated_result:
+        logger.info("   ❌ 整合提示词失败")
+        return None
+    return {"raw": {"source": "integrated_prompt"}, "normalized": integrated_result}
+
 def process_report_with_diagnostic_steps(extractor, report_data, report_num, prompts, api_key_name):
     """
-    使用三步诊断法处理单个报告
+    使用三步诊断法处理单个报告 (同步入口，在独立的事件循环中运行异步版本)
+    """
+    return asyncio.run(aprocess_report_with_diagnostic_steps(extractor, report_data, report_num, prompts, api_key_name))
+
+async def aprocess_report_with_diagnostic_steps(extractor, report_data, report_num, prompts, api_key_name,
+                                                semaphore=None, client=None):
+    """
+    使用三步诊断法处理单个报告 (异步版本)
+    各患者陈述块的描述性内容提取与各医生诊断块的器官提取互不依赖，同时并发发出；
+    回退、解剖映射和整合提示词依赖前面的结果，按顺序执行
+    
+    Args:
+        semaphore: 限制同一API密钥并发请求数的asyncio.Semaphore (默认STEP_CONCURRENCY)
+        client: 可选的httpx.AsyncClient，未提供时在线程池中执行同步请求
     """
-    print(f"\n🏥 开始处理报告 {report_num}")
-    print("-" * 60)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(STEP_CONCURRENCY)
+    
+    logger.info(f"\n🏥 开始处理报告 {report_num}")
+    logger.info("-" * 60)
     
     # 获取报告文本 (兼容txt和json格式)
     report_text = report_data.get('text', '') or report_data.get('medical_record_content', '')
     if not report_text:
-        print(f"❌ 报告 {report_num}: 缺少医疗记录内容")
+        logger.info(f"❌ 报告 {report_num}: 缺少医疗记录内容")
         return None
     
-    print(f"📄 报告内容长度: {len(report_text)} 字符")
+    logger.info(f"📄 报告内容长度: {len(report_text)} 字符")
     
     # 第一步：智能分块和分类
     print_step_info(1, "智能分块和症状提取")
@@ -742,93 +1196,110 @@ def process_report_with_diagnostic_steps(extractor, report_data, report_num, pro
     patient_chunks = [chunk for chunk in chunks if chunk.get('type') == 'patient_complaint']
     physician_chunks = [chunk for chunk in chunks if chunk.get('type') == 'physician_diagnosis']
     
-    print(f"   📊 总块数: {len(chunks)} | 患者陈述块: {len(patient_chunks)} | 医生诊断块: {len(physician_chunks)}")
+    logger.info(f"   📊 总块数: {len(chunks)} | 患者陈述块: {len(patient_chunks)} | 医生诊断块: {len(physician_chunks)}")
     
-    # 第二步：从患者陈述和其他章节中提取描述性内容（症状、检查、体征）
+    # 第二步和第三步的分块调用互不依赖：患者陈述块的描述性内容提取与医生诊断块的器官提取一起并发发出
     print_step_info(2, "综合描述性内容提取", len(patient_chunks))
+    print_step_info(3, "医生诊断器官提取", len(physician_chunks))
+    
+    # 两类分块都存在且总量较小时，两步融合为一次请求，省去一次完整的请求往返
+    fused = None
+    if _should_fuse_steps(chunks, patient_chunks, physician_chunks):
+        fused = await _acall_fused_steps(extractor, patient_chunks, physician_chunks, prompts,
+                                         report_num, api_key_name, semaphore, client)
+    if fused is not None:
+        step1_parsed, step2_parsed = fused
+    else:
+        # 相邻的短分块合并到一次请求中，减少请求数
+        step1_parsed, step2_parsed = await asyncio.gather(
+            _acall_chunks(extractor, patient_chunks, prompts.get_step1_prompt_parts, prompts.get_step1_batch_prompt_parts,
+                          "描述性内容提取", report_num, api_key_name, semaphore, client),
+            _acall_chunks(extractor, physician_chunks, prompts.get_step2_prompt_parts, prompts.get_step2_batch_prompt_parts,
+                          "器官提取", report_num, api_key_name, semaphore, client)
+        )
+    
     patient_symptoms = []
+    for i, parsed in enumerate(step1_parsed):
+        if parsed and parsed.get("descriptive_findings"):
+            patient_symptoms.append(parsed)
+            findings_count = len(parsed.get('descriptive_findings', []))
+            excluded_count = len(parsed.get('excluded_content', []))
+            logger.info(f"   ✅ 块{i+1}: 提取{findings_count}个描述性发现，排除{excluded_count}个诊断判断")
+        else:
+            logger.info(f"   ⚠️ 块{i+1}: 未发现有效描述性内容")
     
-    # 优先处理患者陈述块 - 提取描述性内容
-    for i, chunk in enumerate(patient_chunks):
-        print_api_call_info(api_key_name, report_num, "描述性内容提取", i+1)
-        try:
-            prompt = prompts.get_step1_comprehensive_descriptive_extraction_prompt(chunk['content'])
-            response = extractor.call_api(prompt)
-            parsed = parse_diagnostic_response(response, f"描述性内容提取-块{i+1}")
-            if parsed and parsed.get("descriptive_findings"):
-                patient_symptoms.append(parsed)
-                findings_count = len(parsed.get('descriptive_findings', []))
-                excluded_count = len(parsed.get('excluded_content', []))
-                print(f"   ✅ 块{i+1}: 提取{findings_count}个描述性发现，排除{excluded_count}个诊断判断")
-            else:
-                print(f"   ⚠️ 块{i+1}: 未发现有效描述性内容")
-        except Exception as e:
-            print_error_info(e, report_num, f"描述性内容提取-块{i+1}")
+    diagnosed_organs = []
     
-    # 如果患者陈述块中没有提取到足够症状，尝试从其他章节提取
-    if not patient_symptoms or len(patient_symptoms) < 2:
-        print("   🔍 患者陈述块症状不足，尝试从医生诊断的叙事章节提取症状")
+    # 症状侧的补充提取只依赖步骤1结果，器官侧的汇总只依赖步骤3结果，两条链并发执行；
+    # 器官侧的整篇回退请求要等症状侧结束：没有任何描述性发现时解剖映射会被跳过，回退请求没有意义
+    async def _complete_symptoms():
+        full_text_task = None
+        # 如果患者陈述块中没有提取到足够症状，尝试从其他章节提取
+        if not patient_symptoms or len(patient_symptoms) < 2:
+            logger.info("   🔍 患者陈述块症状不足，尝试从医生诊断的叙事章节提取症状")
+            
+            # 患者陈述块完全没有结果时，整篇提取大概率也会用到：与叙事块请求同时推测性发出，
+            # 叙事块有结果时取消，否则直接使用其结果，省去一次串行的请求往返
+            if not patient_symptoms:
+                full_text_task = asyncio.ensure_future(_acall_step(
+                    extractor, prompts.get_step1_prompt_parts(report_text),
+                    "整篇描述性内容提取", report_num, semaphore, client
+                ))
         
-        # 智能选择可能包含症状的医生诊断块（偏向叙事性）
-        narrative_physician_chunks = [
-            chunk for chunk in physician_chunks 
-            if any(keyword in chunk['section'] for keyword in ['course', 'history', 'narrative'])
-        ]
-
-        # 从筛选出的医生诊断块中寻找描述性内容
-        for i, chunk in enumerate(narrative_physician_chunks):
-            print_api_call_info(api_key_name, report_num, f"描述性内容提取-医生叙事块{i+1}")
-            try:
-                prompt = prompts.get_step1_comprehensive_descriptive_extraction_prompt(chunk['content'])
-                response = extractor.call_api(prompt)
-                parsed = parse_diagnostic_response(response, f"描述性内容提取-医生叙事块{i+1}")
+            # 智能选择可能包含症状的医生诊断块（偏向叙事性）
+            narrative_physician_chunks = [
+                chunk for chunk in physician_chunks if chunk['section'] in NARRATIVE_PHYSICIAN_SECTIONS
+            ]
+
+            # 从筛选出的医生诊断块中寻找描述性内容 (合并请求，各组并发)
+            narrative_parsed = await _acall_chunks(
+                extractor, narrative_physician_chunks, prompts.get_step1_prompt_parts,
+                prompts.get_step1_batch_prompt_parts, "描述性内容提取-医生叙事", report_num, api_key_name,
+                semaphore, client
+            )
+            for i, parsed in enumerate(narrative_parsed):
                 if parsed and parsed.get("descriptive_findings"):
                     patient_symptoms.append(parsed)
                     findings_count = len(parsed.get('descriptive_findings', []))
-                    print(f"   ✅ 医生叙事块{i+1}: 提取{findings_count}个描述性发现")
-            except Exception as e:
-                print_error_info(e, report_num, f"描述性内容提取-医生叙事块{i+1}")
+                    logger.info(f"   ✅ 医生叙事块{i+1}: 提取{findings_count}个描述性发现")
     
-    # 如果仍然没有描述性内容，尝试从整篇文本提取
-    if not patient_symptoms:
-        print("   🔍 分块描述性内容提取失败，尝试从整篇文本提取")
-        try:
-            prompt = prompts.get_step1_comprehensive_descriptive_extraction_prompt(report_text)
-            response = extractor.call_api(prompt)
-            parsed = parse_diagnostic_response(response, "整篇描述性内容提取")
+        # 如果仍然没有描述性内容，使用整篇文本的提取结果 (此时推测性请求一定已经发出)
+        if not patient_symptoms:
+            logger.info("   🔍 分块描述性内容提取失败，尝试从整篇文本提取")
+            parsed = await full_text_task
             if parsed and parsed.get("descriptive_findings"):
                 patient_symptoms.append(parsed)
                 findings_count = len(parsed.get('descriptive_findings', []))
                 excluded_count = len(parsed.get('excluded_content', []))
-                print(f"   ✅ 整篇文本: 提取{findings_count}个描述性发现，排除{excluded_count}个诊断判断")
+                logger.info(f"   ✅ 整篇文本: 提取{findings_count}个描述性发现，排除{excluded_count}个诊断判断")
             else:
-                print("   ⚠️ 整篇文本: 未发现有效描述性内容")
-        except Exception as e:
-            print_error_info(e, report_num, "整篇描述性内容提取")
+                logger.info("   ⚠️ 整篇文本: 未发现有效描述性内容")
+        elif full_text_task is not None:
+            full_text_task.cancel()
     
-    # 第三步：从医生诊断中提取器官
-    print_step_info(3, "医生诊断器官提取", len(physician_chunks))
-    diagnosed_organs = []
-    
-    for i, chunk in enumerate(physician_chunks):
-        print_api_call_info(api_key_name, report_num, "器官提取", i+1)
-        try:
-            prompt = prompts.get_step2_diagnosis_organ_extraction_prompt(chunk['content']).replace("{text_content}", chunk['content'])
-            response = extractor.call_api(prompt)
-            parsed = parse_diagnostic_response(response, f"器官提取-块{i+1}")
+    async def _complete_organs():
+        # 第三步：汇总医生诊断块的器官提取结果
+        for i, parsed in enumerate(step2_parsed):
             if parsed:
                 diagnosed_organs.append(parsed)
-                print(f"   ✅ 块{i+1}: 成功提取器官")
+                logger.info(f"   ✅ 块{i+1}: 成功提取器官")
             else:
-                print(f"   ⚠️ 块{i+1}: 器官提取失败")
-        except Exception as e:
-            print_error_info(e, report_num, f"器官提取-块{i+1}")
+                logger.info(f"   ⚠️ 块{i+1}: 器官提取失败")
 
-    # 回退：若未识别到医生诊断块或未能提取出器官，则对整篇文本执行一次器官提取
-    if not physician_chunks or not diagnosed_organs:
-        print("   ⚠️ 未识别到有效医生诊断块或器官，触发整篇器官提取回退")
-        fallback_results = _fallback_extract_organs_on_full_text(extractor, report_text, prompts, report_num, api_key_name)
-        diagnosed_organs.extend([res for res in fallback_results if res])
+        # 回退：若未识别到医生诊断块或未能提取出器官，则对整篇文本执行一次器官提取
+        if not physician_chunks or not diagnosed_organs:
+            await symptoms_task
+            if not patient_symptoms:
+                logger.info("   ⚠️ 未提取到描述性发现，跳过整篇器官提取回退")
+                return
+            logger.info("   ⚠️ 未识别到有效医生诊断块或器官，触发整篇器官提取回退")
+            fallback_results = await _afallback_extract_organs_on_full_text(
+                extractor, report_text, prompts, report_num, api_key_name, semaphore, client
+            )
+            diagnosed_organs.extend([res for res in fallback_results if res])
+    
+    symptoms_task = asyncio.ensure_future(_complete_symptoms())
+    await asyncio.gather(symptoms_task, _complete_organs())
     
     # 第四步：整合结果并进行解剖映射
     print_step_info(4, "症状-器官解剖映射")
@@ -836,25 +1307,27 @@ def process_report_with_diagnostic_steps(extractor, report_data, report_num, pro
     if patient_symptoms and diagnosed_organs:
         print_api_call_info(api_key_name, report_num, "解剖映射")
         try:
-            prompt = prompts.get_step3_anatomical_mapping_prompt(
+            system_prompt, prompt = prompts.get_step3_prompt_parts(
                 patient_symptoms, diagnosed_organs, report_text
             )
-            response = extractor.call_api(prompt)
+            async with semaphore:
+                response = await extractor.acall_api(prompt, system_prompt=system_prompt, client=client,
+                                                     response_format=JSON_OBJECT_FORMAT)
             final_step3_result = parse_diagnostic_response(response, "解剖映射")
             
             if final_step3_result:
-                print("   ✅ 解剖映射成功")
+                logger.info("   ✅ 解剖映射成功")
                 print_extraction_summary(final_step3_result)
             else:
-                print("   ⚠️ 解剖映射失败")
+                logger.info("   ⚠️ 解剖映射失败")
         except Exception as e:
             print_error_info(e, report_num, "解剖映射")
     else:
-        print("   ⚠️ 缺少症状或器官信息，跳过解剖映射")
+        logger.info("   ⚠️ 缺少症状或器官信息，跳过解剖映射")
     
     # 如果三步法成功，进行标准化
     if final_step3_result:
-        print("   ✅ 三步法提取成功，进行标准化...")
+        logger.info("   ✅ 三步法提取成功，进行标准化...")
         try:
             normalized_output = _normalize_outputs(patient_symptoms, diagnosed_organs, final_step3_result, report_text)
             return {"raw": final_step3_result, "normalized": normalized_output}
@@ -865,35 +1338,19 @@ def process_report_with_diagnostic_steps(extractor, report_data, report_num, pro
     # 如果三步法失败或标准化失败，尝试使用整合提示词作为最终结果
     print_step_info("备选", "使用整合提示词重试")
     try:
-        print_api_call_info(api_key_name, report_num, "整合提示词")
-        prompt = prompts.get_integrated_diagnostic_prompt(report_text)
-        response = extractor.call_api(prompt)
-        # 整合提示词直接返回最终格式
-        integrated_result = parse_diagnostic_response(response, "整合提示词")
+        integrated_result = await _acall_integrated(extractor, report_text, prompts, report_num, api_key_name,
+                                                    semaphore, client)
         
         if integrated_result:
-            print("   ✅ 整合提示词成功")
-            # 整合提示词的结果就是标准化的结果
-            print_extraction_summary(integrated_result)
-            
             # 创建一个模拟的 "raw" 用于日志记录和兼容性
             raw_dummy = {
                 "source": "integrated_prompt",
                 "step1_patient_complaints": patient_symptoms,
                 "step2_physician_diagnoses": diagnosed_organs
             }
-            # 确保整合提示词的结果是列表格式
-            if isinstance(integrated_result, dict):
-                # 如果是单个字典，包装成标准的 s -> U 格式（恢复为占位症状）
-                wrapped_result = [{
-                    "s_symptom": "integrated_extraction", 
-                    "U_unit_set": [{"u_unit": integrated_result}]
-                }]
-                return {"raw": raw_dummy, "normalized": wrapped_result}
-            else:
-                return {"raw": raw_dummy, "normalized": integrated_result}
+            return {"raw": raw_dummy, "normalized": integrated_result}
         else:
-            print("   ❌ 整合提示词也失败")
+            logger.info("   ❌ 整合提示词也失败")
             # 返回部分数据以供调试
             return {
                 "raw": {"step1": patient_symptoms, "step2": diagnosed_organs, "step3": None}, 
@@ -907,6 +1364,231 @@ def process_report_with_diagnostic_steps(extractor, report_data, report_num, pro
             "normalized": []
         }
 
+def _find_report_file(input_dir: str, i: int):
+    """返回编号为i的报告文件路径 (优先txt，其次json)，都不存在时返回None"""
+    for ext in ('txt', 'json'):
+        path = os.path.join(input_dir, f'report_{i}.{ext}')
+        if os.path.exists(path):
+            return path
+    return None
+
+def _read_report_data(input_file: str, i: int) -> Dict[str, Any]:
+    """读取报告文件 (txt或json格式) 为报告记录"""
+    if input_file.endswith('.txt'):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            text_content = f.read()
+        logger.info(f"📄 读取txt文件: {input_file}")
+        return {
+            'text': text_content,
+            'case_id': str(i),
+            'filename': f'report_{i}.txt'
+        }
+    with open(input_file, 'r', encoding='utf-8') as f:
+        report_data = json.load(f)
+    logger.info(f"📄 读取json文件: {input_file}")
+    return report_data
+
+def _result_file(output_dir: str, i: int) -> str:
+    """单个报告结果文件的路径"""
+    return os.path.join(output_dir, 'diagnostic_results', f'diagnostic_{i}.json')
+
+def _save_report_result(output_dir: str, i: int, result: Dict[str, Any]):
+    """保存单个报告的结果；若包含标准化结果，另存一份更易用的JSON (均为原子写入)"""
+    output_file = _result_file(output_dir, i)
+    write_file_atomic(output_file, dumps_json(result))
+    print_file_save_info(output_file, True)
+    
+    try:
+        normalized_payload = result.get('normalized') if isinstance(result, dict) else None
+        if normalized_payload:
+            normalized_file = os.path.join(output_dir, 'diagnostic_results_normalized', f'diagnostic_{i}.json')
+            write_file_atomic(normalized_file, dumps_json(normalized_payload))
+            print_file_save_info(normalized_file, True)
+    except Exception as e:
+        print_error_info(e, i, "写入标准化JSON")
+
+async def _aprocess_report_file(i, args, extractor, prompts, api_semaphore, client=None):
+    """
+    读取并处理单个报告文件，保存结果
+    
+    Returns:
+        True表示成功，False表示失败，None表示输入文件不存在或结果已存在被跳过
+    """
+    if not args.force and os.path.exists(_result_file(args.output_dir, i)):
+        logger.info(f"⏭️ 跳过: report_{i} (结果已存在，使用 --force 重新处理)")
+        return None
+    input_file = _find_report_file(args.input_dir, i)
+    if not input_file:
+        logger.info(f"⚠️ 跳过: report_{i} (txt和json文件都不存在)")
+        return None
+    
+    loop = asyncio.get_running_loop()
+    try:
+        # 文件读写放到线程池中执行，不阻塞事件循环上其他报告的请求
+        report_data = await loop.run_in_executor(None, _read_report_data, input_file, i)
+        
+        # 处理报告
+        result = await aprocess_report_with_diagnostic_steps(
+            extractor, report_data, i, prompts, args.api_key_name, semaphore=api_semaphore, client=client
+        )
+        
+        if result:
+            await loop.run_in_executor(None, _save_report_result, args.output_dir, i, result)
+            return True
+        logger.info(f"❌ 报告 {i}: 处理失败")
+        return False
+        
+    except Exception as e:
+        print_error_info(e, i)
+        # 完整堆栈只在DEBUG级别下格式化输出 (--log_level DEBUG)
+        logger.debug("   详细错误:", exc_info=True)
+        return False
+
+async def _arun_reports(args, extractor, prompts, indices=None):
+    """
+    并发处理索引范围内的所有报告
+    外层信号量限制同时处理的报告数，内层信号量限制同一API密钥的并发请求数
+    
+    Args:
+        indices: 要处理的报告编号，默认为 start_index..end_index
+    
+    Returns:
+        (处理数, 成功数, 失败数)
+    """
+    if indices is None:
+        indices = range(args.start_index, args.end_index + 1)
+    start_time = time.time()
+    total_files = len(indices)
+    report_semaphore = asyncio.Semaphore(args.concurrency)
+    api_semaphore = asyncio.Semaphore(args.api_concurrency)
+    counts = {"processed": 0, "success": 0, "error": 0}
+    
+    async def _run_one(i, client):
+        async with report_semaphore:
+            print_progress(counts["processed"], total_files, start_time)
+            status = await _aprocess_report_file(i, args, extractor, prompts, api_semaphore, client)
+        if status is True:
+            counts["success"] += 1
+        elif status is False:
+            counts["error"] += 1
+        counts["processed"] += 1
+        logger.info("─" * 60)
+    
+    async with create_async_http_client(args.api_concurrency) as client:
+        await asyncio.gather(*(_run_one(i, client) for i in indices))
+    return counts["processed"], counts["success"], counts["error"]
+
+def _prefetch_first_stage_with_batch(args, extractor, prompts) -> int:
+    """
+    Batch模式：把所有报告第一阶段的请求写成一个JSONL文件，通过Batch API一次提交并等待完成，
+    结果预加载到提取器中。随后的正常处理流程中这些请求直接命中，只有依赖前一阶段结果的
+    解剖映射和各类回退请求实时发送
+    
+    Returns:
+        预加载的响应数
+    """
+    requests_list = []
+    parts_by_id = {}
+    seen = set()
+    for i in range(args.start_index, args.end_index + 1):
+        if not args.force and os.path.exists(_result_file(args.output_dir, i)):
+            continue
+        input_file = _find_report_file(args.input_dir, i)
+        if not input_file:
+            continue
+        try:
+            report_data = _read_report_data(input_file, i)
+        except Exception as e:
+            print_error_info(e, i, "Batch请求构建")
+            continue
+        report_text = report_data.get('text', '') or report_data.get('medical_record_content', '')
+        if not report_text:
+            continue
+        for j, (system_prompt, prompt, response_format) in enumerate(first_stage_request_parts(report_text, prompts)):
+            # 相同的提示词只提交一次
+            if (system_prompt, prompt) in seen:
+                continue
+            seen.add((system_prompt, prompt))
+            custom_id = f"rep{i}_req{j}"
+            requests_list.append((custom_id, prompt, system_prompt, response_format))
+            parts_by_id[custom_id] = (prompt, system_prompt, response_format)
+    
+    if not requests_list:
+        logger.info("⚠️ Batch模式: 没有需要提交的请求")
+        return 0
+    
+    batch_dir = os.path.join(args.output_dir, 'batch')
+    os.makedirs(batch_dir, exist_ok=True)
+    logger.info(f"📦 Batch模式: 提交 {len(requests_list)} 个第一阶段请求")
+    batch_id = extractor.submit_batch(requests_list, jsonl_path=os.path.join(batch_dir, 'requests.jsonl'))
+    batch = extractor.wait_for_batch(batch_id, poll_interval=args.batch_poll_interval)
+    results = extractor.fetch_batch_results(batch)
+    extractor.preload_responses([(*parts_by_id[custom_id], result) for custom_id, result in results.items()])
+    succeeded = sum(1 for result in results.values() if result["success"])
+    logger.info(f"📦 Batch模式: 获得 {succeeded}/{len(requests_list)} 个响应，失败或未完成的请求将实时发送")
+    return succeeded
+
+def _create_extractor(api_key_name: str, refresh_cache: bool = False) -> LLMExtractor:
+    """
+    按API密钥名称创建提取器
+    API配置中可设置cache_control: True，为静态system提示词加上显式缓存断点 (Anthropic等服务需要)
+    refresh_cache (--force) 时不读取磁盘上之前运行缓存的API响应，重新请求并覆盖缓存
+    """
+    api_config = MULTI_API_CONFIG[api_key_name]
+    return LLMExtractor(
+        model=api_config['model'],
+        api_key=api_config['api_key'],
+        base_url=api_config['base_url'],
+        config={
+            "cache_control": api_config.get('cache_control', False),
+            "json_mode": api_config.get('json_mode', True),
+            "refresh_cache": refresh_cache,
+        },
+        rpm=api_config.get('rpm'),
+        tpm=api_config.get('tpm')
+    )
+
+def _apply_log_level(log_level: str):
+    """将 --log_level 应用到批处理日志器 (无法识别的级别按INFO处理)"""
+    logging.getLogger("batch").setLevel(getattr(logging, log_level.upper(), logging.INFO))
+
+def _run_report_slice(args, api_key_name: str, indices: List[int]) -> Tuple[int, int, int]:
+    """
+    子进程入口：在本进程内创建提取器 (不跨进程传递)，用独立的事件循环处理分到的报告
+    
+    Returns:
+        (处理数, 成功数, 失败数)
+    """
+    get_batch_logger("batch.worker")  # fork出的子进程需要重新启动日志输出线程
+    _apply_log_level(args.log_level)
+    logger.info(f"🧵 进程 {os.getpid()}: API密钥 {api_key_name} | {len(indices)} 个报告")
+    extractor = _create_extractor(api_key_name, refresh_cache=args.force)
+    try:
+        return asyncio.run(_arun_reports(args, extractor, DiagnosticExtractionPrompts(), indices))
+    finally:
+        extractor.close()
+        # 进程池的工作进程退出时不执行atexit，主动输出队列中剩余的日志
+        flush_batch_logs()
+
+def _run_reports_in_processes(args, api_key_names: List[str]) -> Tuple[int, int, int]:
+    """
+    用进程池并行处理报告：索引范围交错切分给各进程 (负载均衡)，每个进程轮流使用不同的API密钥分摊限速
+    分块、标准化和响应解析等CPU部分不再受同一个GIL限制
+    
+    Returns:
+        (处理数, 成功数, 失败数)
+    """
+    indices = list(range(args.start_index, args.end_index + 1))
+    processes = max(1, min(args.processes, len(indices)))
+    slices = [indices[k::processes] for k in range(processes)]
+    keys = [api_key_names[k % len(api_key_names)] for k in range(processes)]
+    totals = [0, 0, 0]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for counts in executor.map(_run_report_slice, [args] * processes, keys, slices):
+            for k, value in enumerate(counts):
+                totals[k] += value
+    return tuple(totals)
+
 def main():
     parser = argparse.ArgumentParser(description='Diag_Distillation 三步分离式诊断蒸馏系统')
     parser.add_argument('--input_dir', type=str, required=True, help='输入目录路径')
@@ -915,133 +1597,83 @@ def main():
     parser.add_argument('--start_index', type=int, required=True, help='开始索引')
     parser.add_argument('--end_index', type=int, required=True, help='结束索引')
     parser.add_argument('--log_level', type=str, default='INFO', help='日志级别')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时处理的报告数')
+    parser.add_argument('--api_concurrency', type=int, default=STEP_CONCURRENCY, help='同一API密钥的最大并发请求数')
+    parser.add_argument('--mode', choices=['sync', 'batch'], default='sync',
+                        help='sync: 实时调用API; batch: 第一阶段请求通过Batch API提交 (费用更低，可能需要等待数小时)')
+    parser.add_argument('--batch_poll_interval', type=float, default=60, help='Batch模式下查询任务状态的间隔(秒)')
+    parser.add_argument('--force', action='store_true', help='重新处理已有结果文件的报告 (默认跳过)，同时不使用之前运行缓存在磁盘上的API响应')
+    parser.add_argument('--processes', type=int, default=1, help='并行处理报告的进程数 (每个进程独立运行并发处理)')
+    parser.add_argument('--extra_api_key_names', type=str, default='',
+                        help='多进程时额外轮流使用的API密钥名称，逗号分隔')
     
     args = parser.parse_args()
+    _apply_log_level(args.log_level)
     
     # 打印系统启动信息
     print_header()
     
     # 打印配置信息
-    print("⚙️ 运行配置:")
-    print(f"   📁 输入目录: {args.input_dir}")
-    print(f"   📁 输出目录: {args.output_dir}")
-    print(f"   🔑 API密钥: {args.api_key_name}")
-    print(f"   📊 处理范围: {args.start_index} - {args.end_index}")
-    print(f"   📋 日志级别: {args.log_level}")
-    print("-" * 80)
+    logger.info("⚙️ 运行配置:")
+    logger.info(f"   📁 输入目录: {args.input_dir}")
+    logger.info(f"   📁 输出目录: {args.output_dir}")
+    logger.info(f"   🔑 API密钥: {args.api_key_name}")
+    logger.info(f"   📊 处理范围: {args.start_index} - {args.end_index}")
+    logger.info(f"   📋 日志级别: {args.log_level}")
+    logger.info(f"   📦 运行模式: {args.mode}")
+    logger.info(f"   🔀 并发: {args.concurrency} 个报告 / {args.api_concurrency} 个请求 | 进程数: {args.processes}")
+    logger.info("-" * 80)
     
     # 创建输出目录
     os.makedirs(args.output_dir, exist_ok=True)
     os.makedirs(os.path.join(args.output_dir, 'diagnostic_results'), exist_ok=True)
+    os.makedirs(os.path.join(args.output_dir, 'diagnostic_results_normalized'), exist_ok=True)
     os.makedirs(os.path.join(args.output_dir, 'logs'), exist_ok=True)
     
     # 初始化API配置
-    if args.api_key_name not in MULTI_API_CONFIG:
-        print(f"❌ API密钥 '{args.api_key_name}' 不存在于配置中")
-        sys.exit(1)
+    api_key_names = [args.api_key_name] + [
+        name.strip() for name in args.extra_api_key_names.split(',') if name.strip()
+    ]
+    for api_key_name in api_key_names:
+        if api_key_name not in MULTI_API_CONFIG:
+            logger.info(f"❌ API密钥 '{api_key_name}' 不存在于配置中")
+            sys.exit(1)
     
     api_config = MULTI_API_CONFIG[args.api_key_name]
-    print(f"🔧 API配置: {api_config['model']} @ {api_config['base_url']}")
-    
-    # 初始化提取器和提示词
-    extractor = LLMExtractor(
-        model=api_config['model'],
-        api_key=api_config['api_key'],
-        base_url=api_config['base_url']
-    )
-    prompts = DiagnosticExtractionPrompts()
-    
-    print("✅ 系统初始化完成")
-    print("=" * 80)
+    logger.info(f"🔧 API配置: {api_config['model']} @ {api_config['base_url']}")
     
     # 开始处理
     start_time = time.time()
-    total_files = args.end_index - args.start_index + 1
-    processed_count = 0
-    success_count = 0
-    error_count = 0
-    
-    for i in range(args.start_index, args.end_index + 1):
-        print_progress(processed_count, total_files, start_time)
-        
-        # 尝试txt文件，如果不存在则尝试json文件
-        txt_file = os.path.join(args.input_dir, f'report_{i}.txt')
-        json_file = os.path.join(args.input_dir, f'report_{i}.json')
-        output_file = os.path.join(args.output_dir, 'diagnostic_results', f'diagnostic_{i}.json')
-        
-        input_file = None
-        if os.path.exists(txt_file):
-            input_file = txt_file
-        elif os.path.exists(json_file):
-            input_file = json_file
-        
-        if not input_file:
-            print(f"⚠️ 跳过: report_{i} (txt和json文件都不存在)")
-            processed_count += 1
-            continue
-        
-        try:
-            # 读取输入文件
-            if input_file.endswith('.txt'):
-                with open(input_file, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
-                report_data = {
-                    'text': text_content,
-                    'case_id': str(i),
-                    'filename': f'report_{i}.txt'
-                }
-                print(f"📄 读取txt文件: {input_file}")
-            else:
-                with open(input_file, 'r', encoding='utf-8') as f:
-                    report_data = json.load(f)
-                print(f"📄 读取json文件: {input_file}")
-            
-            # 处理报告
-            result = process_report_with_diagnostic_steps(extractor, report_data, i, prompts, args.api_key_name)
-            
-            if result:
-                # 保存结果
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
-                print_file_save_info(output_file, True)
-                
-                # 若包含标准化结果，另存一份更易用的JSON
-                try:
-                    normalized_dir = os.path.join(args.output_dir, 'diagnostic_results_normalized')
-                    os.makedirs(normalized_dir, exist_ok=True)
-                    normalized_file = os.path.join(normalized_dir, f'diagnostic_{i}.json')
-                    normalized_payload = result.get('normalized') if isinstance(result, dict) else None
-                    if normalized_payload:
-                        with open(normalized_file, 'w', encoding='utf-8') as f2:
-                            json.dump(normalized_payload, f2, ensure_ascii=False, indent=2)
-                        print_file_save_info(normalized_file, True)
-                except Exception as e:
-                    print_error_info(e, i, "写入标准化JSON")
-                
-                success_count += 1
-            else:
-                print(f"❌ 报告 {i}: 处理失败")
-                error_count += 1
-            
-        except Exception as e:
-            print_error_info(e, i)
-            print(f"   详细错误: {traceback.format_exc()}")
-            error_count += 1
+    if args.mode == 'batch' and args.processes > 1:
+        logger.info("❌ Batch模式不支持多进程 (--processes)")
+        sys.exit(1)
+    if args.processes > 1:
+        logger.info(f"✅ 系统初始化完成，启动 {args.processes} 个进程 (API密钥: {', '.join(api_key_names)})")
+        logger.info("=" * 80)
+        processed_count, success_count, error_count = _run_reports_in_processes(args, api_key_names)
+    else:
+        # 初始化提取器和提示词
+        extractor = _create_extractor(args.api_key_name, refresh_cache=args.force)
+        prompts = DiagnosticExtractionPrompts()
         
-        processed_count += 1
-        print("─" * 60)
+        logger.info("✅ 系统初始化完成")
+        logger.info("=" * 80)
+        with extractor:
+            if args.mode == 'batch':
+                _prefetch_first_stage_with_batch(args, extractor, prompts)
+            processed_count, success_count, error_count = asyncio.run(_arun_reports(args, extractor, prompts))
     
     # 打印最终统计
     total_time = time.time() - start_time
-    print("=" * 80)
-    print("🎉 处理完成!")
-    print(f"📊 最终统计:")
-    print(f"   ✅ 成功: {success_count}")
-    print(f"   ❌ 失败: {error_count}")
-    print(f"   📁 总计: {processed_count}")
-    print(f"   ⏰ 总用时: {int(total_time//60)}:{int(total_time%60):02d}")
-    print(f"   📈 成功率: {(success_count/processed_count*100):.1f}%" if processed_count > 0 else "   📈 成功率: 0%")
-    print("=" * 80)
+    logger.info("=" * 80)
+    logger.info("🎉 处理完成!")
+    logger.info(f"📊 最终统计:")
+    logger.info(f"   ✅ 成功: {success_count}")
+    logger.info(f"   ❌ 失败: {error_count}")
+    logger.info(f"   📁 总计: {processed_count}")
+    logger.info(f"   ⏰ 总用时: {int(total_time//60)}:{int(total_time%60):02d}")
+    logger.info(f"   📈 成功率: {(success_count/processed_count*100):.1f}%" if processed_count > 0 else "   📈 成功率: 0%")
+    logger.info("=" * 80)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
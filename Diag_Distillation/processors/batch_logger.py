@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批处理日志工具
+工作线程只把日志记录放入队列，由后台QueueListener线程统一格式化并输出，
+多个线程不再争抢stdout
+"""
+
+import os
+import sys
+import atexit
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "[%(asctime)s] [%(levelname)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_listener = None
+_listener_pid = None
+
+
+def get_batch_logger(name: str = "batch") -> logging.Logger:
+    """
+    获取批处理日志器 (名称应为batch或batch.*；首次调用时启动后台输出线程)
+    fork出的子进程没有父进程的输出线程，在子进程中调用时会重新建立队列和输出线程
+    """
+    global _listener, _listener_pid
+    if _listener is None or _listener_pid != os.getpid():
+        log_queue = queue.Queue(-1)
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+        _listener = QueueListener(log_queue, console)
+        _listener_pid = os.getpid()
+        _listener.start()
+        atexit.register(_listener.stop)
+        
+        root = logging.getLogger("batch")
+        for handler in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+            root.removeHandler(handler)
+        root.addHandler(QueueHandler(log_queue))
+        root.setLevel(logging.INFO)
+        root.propagate = False
+    return logging.getLogger(name)
+
+
+def flush_batch_logs():
+    """等待队列中的日志全部输出 (在打印汇总信息前调用，保证输出顺序)"""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
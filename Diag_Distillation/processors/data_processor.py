@@ -7,15 +7,45 @@
 
 import json
 import os
+import re
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from sys import intern
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 from loguru import logger
 
+try:
+    import orjson
+    _json_loads = orjson.loads  # 直接解析bytes
+except ImportError:
+    _json_loads = json.loads
+
 # 导入配置
 import sys
 project_root = "/opt/RAG_Evidence4Organ"
 sys.path.insert(0, project_root)
-from configs.model_config import normalize_organ, is_allowed_organ, detect_specialty, is_allowed_specific_part
+from configs.model_config import ALLOWED_ORGANS, normalize_organ, is_allowed_organ, detect_specialty, is_allowed_specific_part
+
+# 器官白名单集合，O(1)成员判断；不在集合中的名称再交给is_allowed_organ判断 (可能包含别名等规则)
+_ALLOWED_ORGAN_SET = frozenset(ALLOWED_ORGANS)
+_REQUIRED_FIELDS = ("disease_symptom", "organ", "specific_part")
+
+# 置信度等级 (合并时取最高)
+_CONFIDENCE_LEVELS = {"高": 3, "中": 2, "低": 1}
+_CONF_VALID = frozenset(_CONFIDENCE_LEVELS)
+
+# 病例数超过该值时用多进程并行处理提取结果 (数量少时进程启动和序列化的开销大于收益)
+PARALLEL_CASE_THRESHOLD = 2000
+
+# 同一批器官/部位名称在数据集中反复出现，缓存标准化和白名单判断的结果
+_normalize_organ = functools.lru_cache(maxsize=4096)(normalize_organ)
+_is_allowed_organ = functools.lru_cache(maxsize=1024)(is_allowed_organ)
+_is_allowed_specific_part = functools.lru_cache(maxsize=4096)(is_allowed_specific_part)
+
+# 有效医学文本必须包含的关键词 (合并为一个正则，一次扫描文本)
+MEDICAL_TEXT_KEYWORDS = ("症状", "疾病", "检查", "诊断", "治疗")
+_MEDICAL_KEYWORD_RE = re.compile("|".join(map(re.escape, MEDICAL_TEXT_KEYWORDS)))
 
 class DataProcessor:
     """数据处理器类"""
@@ -28,6 +58,7 @@ class DataProcessor:
             config: 配置参数
         """
         self.config = config or self._get_default_config()
+        self._min_text_length = self.config["min_text_length"]
         
     def _get_default_config(self) -> Dict[str, Any]:
         """获取默认配置"""
@@ -50,23 +81,21 @@ class DataProcessor:
             医学文本列表
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(file_path, 'rb') as f:
+                data = _json_loads(f.read())
             
             texts = []
+            append = texts.append
+            validate = self._validate_text
             for item in data:
                 text = item.get("text", "")
-                case_id = item.get("case_id", "")
                 
                 # 验证文本质量
-                if self._validate_text(text):
-                    # 检测专科类型
-                    specialty = detect_specialty(text)
-                    
-                    texts.append({
+                if validate(text):
+                    append({
                         "text": text,
-                        "case_id": case_id,
-                        "specialty": specialty
+                        "case_id": item.get("case_id", ""),
+                        "specialty": detect_specialty(text)  # 检测专科类型
                     })
             
             logger.info(f"成功加载 {len(texts)} 条医学文本")
@@ -81,16 +110,12 @@ class DataProcessor:
         if not text or not isinstance(text, str):
             return False
         
-        # 长度检查
-        if len(text) < self.config["min_text_length"]:
+        # 长度检查 (过长的文本不拒绝，由调用方决定是否截断)
+        if len(text) < self._min_text_length:
             return False
         
-        if len(text) > self.config["max_text_length"]:
-            # 截断过长的文本
-            text = text[:self.config["max_text_length"]]
-        
         # 基本内容检查
-        if not any(keyword in text for keyword in ["症状", "疾病", "检查", "诊断", "治疗"]):
+        if _MEDICAL_KEYWORD_RE.search(text) is None:
             return False
         
         return True
@@ -105,62 +130,77 @@ class DataProcessor:
         Returns:
             处理后的结果
         """
-        processed_results = []
-        
-        for result in results:
-            if not result.get("success", False):
-                continue
-            
-            case_id = result.get("case_id", "")
-            extractions = result.get("extractions", [])
-            specialty = result.get("specialty", "general")
-            
-            # 处理每个提取结果
-            processed_extractions = []
-            for extraction in extractions:
-                processed = self._process_single_extraction(extraction)
-                if processed:
-                    processed_extractions.append(processed)
-            
-            if processed_extractions:
-                processed_results.append({
-                    "case_id": case_id,
-                    "specialty": specialty,
-                    "extractions": processed_extractions,
-                    "success": True
-                })
+        if len(results) > PARALLEL_CASE_THRESHOLD:
+            # 各病例相互独立且为纯CPU计算，分块交给进程池以绕开GIL
+            workers = os.cpu_count() or 1
+            chunksize = max(1, len(results) // (4 * workers))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                processed = executor.map(functools.partial(_process_case, processor=self), results, chunksize=chunksize)
+                processed_results = [r for r in processed if r]
+        else:
+            processed_results = [r for r in map(functools.partial(_process_case, processor=self), results) if r]
         
         logger.info(f"处理完成，有效结果: {len(processed_results)}")
         return processed_results
     
+    def _process_extractions(self, extractions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量处理一组提取结果 (结果与逐条调用_process_single_extraction相同)
+        先按列完成必填字段过滤、器官标准化和白名单判断，只对通过的条目构建结果
+        """
+        try:
+            candidates = [e for e in extractions if all(e.get(field) for field in _REQUIRED_FIELDS)]
+            normalized_organs = list(map(_normalize_organ, [e["organ"] for e in candidates]))
+            allowed = [organ in _ALLOWED_ORGAN_SET or _is_allowed_organ(organ) for organ in normalized_organs]
+        except Exception:
+            # 存在结构异常的条目时逐条处理，由_process_single_extraction记录并跳过异常条目
+            return [p for p in map(self._process_single_extraction, extractions) if p]
+        
+        processed_extractions = []
+        for extraction, normalized_organ, is_allowed in zip(candidates, normalized_organs, allowed):
+            if not is_allowed:
+                continue
+            processed = self._build_processed_extraction(extraction, normalized_organ)
+            if processed:
+                processed_extractions.append(processed)
+        return processed_extractions
+    
     def _process_single_extraction(self, extraction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """处理单个提取结果"""
         try:
             # 基本字段验证
-            required_fields = ["disease_symptom", "organ", "specific_part"]
-            for field in required_fields:
+            for field in _REQUIRED_FIELDS:
                 if not extraction.get(field):
                     return None
             
             # 标准化器官名称
-            original_organ = extraction["organ"]
-            normalized_organ = normalize_organ(original_organ)
+            normalized_organ = _normalize_organ(extraction["organ"])
             
             # 检查是否为允许的器官
-            if not is_allowed_organ(normalized_organ):
+            if normalized_organ not in _ALLOWED_ORGAN_SET and not _is_allowed_organ(normalized_organ):
                 return None
+        except Exception as e:
+            logger.error(f"处理单个提取结果异常: {str(e)}")
+            return None
+        return self._build_processed_extraction(extraction, normalized_organ)
+    
+    def _build_processed_extraction(self, extraction: Dict[str, Any], normalized_organ: str) -> Optional[Dict[str, Any]]:
+        """对已通过器官白名单的提取结果检查解剖部位和质量，构建处理后的结果"""
+        try:
+            original_organ = extraction["organ"]
             
             # 检查解剖部位是否属于该器官
             specific_part = extraction["specific_part"]
-            if not is_allowed_specific_part(normalized_organ, specific_part):
+            if not _is_allowed_specific_part(normalized_organ, specific_part):
                 logger.warning(f"过滤掉不合规的解剖部位: Organ='{normalized_organ}', Part='{specific_part}'")
                 return None
             
             # 构建处理后的结果
+            # 器官/部位名称取值有限且大量重复，驻留后各结果共享同一字符串对象，后续集合/字典操作只需比较指针
             processed = {
                 "disease_symptom": extraction["disease_symptom"].strip(),
-                "organ": normalized_organ,
-                "specific_part": extraction["specific_part"].strip(),
+                "organ": intern(normalized_organ),
+                "specific_part": intern(specific_part.strip()),
                 "confidence": extraction.get("confidence", "中"),
                 "evidence": extraction.get("evidence", "").strip(),
                 "original_organ": original_organ
@@ -191,7 +231,7 @@ class DataProcessor:
         
         # 置信度检查
         confidence = extraction["confidence"]
-        if confidence not in ["高", "中", "低"]:
+        if confidence not in _CONF_VALID:
             return False
         
         return True
@@ -206,62 +246,47 @@ class DataProcessor:
         Returns:
             合并后的结果
         """
-        from collections import defaultdict
-        
-        # 按症状和器官分组
-        grouped = defaultdict(list)
+        # 按症状和器官分组 (dict保持首次出现的顺序)
+        grouped = {}
         for extraction in extractions:
-            key = f"{extraction['disease_symptom']}|{extraction['organ']}"
-            grouped[key].append(extraction)
+            grouped.setdefault((extraction['disease_symptom'], extraction['organ']), []).append(extraction)
         
         # 合并每组结果
-        merged = []
-        for group in grouped.values():
-            if len(group) == 1:
-                merged.append(group[0])
-            else:
-                merged_item = self._merge_extraction_group(group)
-                merged.append(merged_item)
-        
-        return merged
+        return [group[0] if len(group) == 1 else self._merge_extraction_group(group) for group in grouped.values()]
     
     def _merge_extraction_group(self, group: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """合并提取结果组"""
+        """合并提取结果组 (单次遍历；部位按首次出现顺序去重，证据取最长，置信度取最高)"""
         # 使用第一个作为基础
         base = group[0].copy()
         
-        # 收集所有部位
-        parts = []
-        evidences = []
-        confidences = []
-        
+        parts = {}
+        best_evidence = ""
+        best_confidence = None
+        best_level = -1
         for item in group:
             part = item.get("specific_part", "")
-            if part and part not in parts:
-                parts.append(part)
+            if part:
+                parts[part] = None
             
             evidence = item.get("evidence", "")
-            if evidence and evidence not in evidences:
-                evidences.append(evidence)
+            if len(evidence) > len(best_evidence):
+                best_evidence = evidence
             
             confidence = item.get("confidence", "中")
-            if confidence not in confidences:
-                confidences.append(confidence)
+            level = _CONFIDENCE_LEVELS.get(confidence, 0)
+            if level > best_level:
+                best_confidence, best_level = confidence, level
         
         # 合并部位
-        if len(parts) > 1:
+        if parts:
             base["specific_part"] = "、".join(parts)
-        elif len(parts) == 1:
-            base["specific_part"] = parts[0]
         
         # 合并证据（取最长的）
-        if evidences:
-            base["evidence"] = max(evidences, key=len)
+        if best_evidence:
+            base["evidence"] = best_evidence
         
         # 取最高置信度
-        if confidences:
-            confidence_levels = {"高": 3, "中": 2, "低": 1}
-            best_confidence = max(confidences, key=lambda x: confidence_levels.get(x, 0))
+        if best_confidence is not None:
             base["confidence"] = best_confidence
         
         return base
@@ -277,52 +302,44 @@ class DataProcessor:
             RAG格式的语料
         """
         rag_corpus = []
+        append = rag_corpus.append
+        generate_query = self._generate_query_text
+        generate_document = self._generate_document_text
         
         for result in processed_results:
             case_id = result["case_id"]
-            extractions = result["extractions"]
+            specialty = result["specialty"]
             
-            for extraction in extractions:
-                rag_item = {
+            for extraction in result["extractions"]:
+                append({
                     "case_id": case_id,
                     "disease_symptom": extraction["disease_symptom"],
                     "organ": extraction["organ"],
                     "specific_part": extraction["specific_part"],
                     "confidence": extraction["confidence"],
                     "evidence": extraction["evidence"],
-                    "specialty": result["specialty"]
-                }
-                
-                # 生成查询文本
-                rag_item["query"] = self._generate_query_text(extraction)
-                
-                # 生成文档文本
-                rag_item["document"] = self._generate_document_text(extraction)
-                
-                rag_corpus.append(rag_item)
+                    "specialty": specialty,
+                    # 查询文本与文档文本
+                    "query": generate_query(extraction),
+                    "document": generate_document(extraction)
+                })
         
         logger.info(f"转换为RAG格式完成，共 {len(rag_corpus)} 条记录")
         return rag_corpus
     
     def _generate_query_text(self, extraction: Dict[str, Any]) -> str:
         """生成查询文本"""
-        symptom = extraction["disease_symptom"]
-        organ = extraction["organ"]
-        part = extraction["specific_part"]
-        
-        return f"{symptom} {organ} {part}"
+        return " ".join((extraction["disease_symptom"], extraction["organ"], extraction["specific_part"]))
     
     def _generate_document_text(self, extraction: Dict[str, Any]) -> str:
         """生成文档文本"""
-        symptom = extraction["disease_symptom"]
-        organ = extraction["organ"]
-        part = extraction["specific_part"]
         evidence = extraction["evidence"]
-        
-        if evidence:
-            return f"症状：{symptom}，涉及器官：{organ}，具体部位：{part}。证据：{evidence}"
-        else:
-            return f"症状：{symptom}，涉及器官：{organ}，具体部位：{part}。"
+        return "".join((
+            "症状：", extraction["disease_symptom"],
+            "，涉及器官：", extraction["organ"],
+            "，具体部位：", extraction["specific_part"],
+            "。证据：" if evidence else "。", evidence
+        ))
     
     def save_results(self, results: List[Dict[str, Any]], output_file: str) -> None:
         """保存结果到文件"""
@@ -373,6 +390,23 @@ class DataProcessor:
         
         return stats
 
+def _process_case(result: Dict[str, Any], processor: DataProcessor) -> Optional[Dict[str, Any]]:
+    """处理单个病例的提取结果 (模块级函数，可被pickle后在子进程中执行)"""
+    if not result.get("success", False):
+        return None
+    
+    # 按列批量处理该病例的提取结果
+    processed_extractions = processor._process_extractions(result.get("extractions", []))
+    if not processed_extractions:
+        return None
+    
+    return {
+        "case_id": result.get("case_id", ""),
+        "specialty": result.get("specialty", "general"),
+        "extractions": processed_extractions,
+        "success": True
+    }
+
 def create_processor(config: Dict[str, Any] = None) -> DataProcessor:
     """创建数据处理器实例"""
     return DataProcessor(config=config)
@@ -406,4 +440,4 @@ if __name__ == "__main__":
     }
     
     processed = processor._process_single_extraction(test_extraction)
-    print(f"\n处理结果: {processed}") 
\ No newline at end of file
+    print(f"\n处理结果: {processed}") 
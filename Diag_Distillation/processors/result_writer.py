@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结果文件写入工具
+优先使用orjson (C实现，直接输出UTF-8字节)，未安装时回退到标准库json
+"""
+
+import os
+import json
+from typing import Any, List, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(obj: Any, indent: bool = True) -> bytes:
+    """
+    将对象序列化为UTF-8 JSON字节
+    
+    Args:
+        obj: 要序列化的对象
+        indent: 是否缩进 (面向人工查看的文件缩进，机器读取的中间结果用紧凑格式)
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    if indent:
+        return (json.dumps(obj, ensure_ascii=False, indent=2) + "\n").encode("utf-8")
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def write_files(files: List[Tuple[str, bytes]]) -> None:
+    """
+    一次性写入一组文件 (路径, 字节内容)
+    直接使用os.open/os.write，每个文件只有open+write+close三次系统调用，
+    避免Python文件对象的缓冲层和额外的fstat/lseek调用
+    """
+    for path, data in files:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
+
+
+def write_file_atomic(path: str, data: bytes) -> None:
+    """
+    原子写入单个文件：先写入同目录下的临时文件，再用os.replace替换目标文件，
+    进程中途被终止时不会留下截断的结果文件 (断点续跑时可以放心跳过已存在的结果)
+    """
+    tmp_path = f"{path}.tmp"
+    write_files([(tmp_path, data)])
+    os.replace(tmp_path, path)
+
+
+def write_json(path: str, obj: Any) -> None:
+    """将对象写入JSON文件"""
+    write_files([(path, dumps_json(obj))])
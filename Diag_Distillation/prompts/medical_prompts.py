@@ -6,21 +6,31 @@
 """
 
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 # Import the definitive source of truth for organ structures
-from configs.model_config import ORGAN_ANATOMY_STRUCTURE
-
-class DiagnosticExtractionPrompts:
-    """诊断蒸馏提示词系统"""
-    
-    @staticmethod
-    def get_step1_comprehensive_descriptive_extraction_prompt(text_content: str) -> str:
-        """
-        Step 1: Comprehensive descriptive content extraction (symptoms, exam findings, clinical signs) — English only
-        """
-        return f"""
-You are a medical text analysis expert. Your task is to extract ALL DESCRIPTIVE CONTENT from medical reports, including patient symptoms, examination findings, laboratory/test measurements, and clinical signs, while STRICTLY EXCLUDING diagnostic judgments.
+from configs.model_config import ORGAN_ANATOMY_STRUCTURE, ELSE_STRUCT
+
+# 标准器官名称白名单 (按系统分组，提示词中每组占一行)；STANDARD_ORGANS供校验LLM输出时O(1)判断
+STANDARD_ORGAN_GROUPS = (
+    ("Brain", "Cerebellum", "Brainstem", "Diencephalon", "Spinal cord (Medulla spinalis)"),
+    ("Heart (Cor)", "Artery (Arteria)", "Vena (Vena)", "Capillary (Vas capillare)"),
+    ("Nose (Nasus)", "Pharynx", "Larynx", "Trachea", "Bronchus", "Lung (Pulmo)"),
+    ("Mouth (Oral cavity)", "Tongue (Lingua)", "Teeth (Dentes)", "Salivary glands"),
+    ("Esophagus", "Stomach (Gaster)", "Small intestine (Intestinum tenue)", "Large intestine (Intestinum crassum)"),
+    ("Liver (Hepar)", "Gallbladder (Vesica biliaris)", "Pancreas", "Mesentery"),
+    ("Kidney (Ren)", "Ureter", "Urinary bladder (Vesica urinaria)", "Urethra"),
+    ("Testis", "Epididymis", "Prostate", "Penis"),
+    ("Ovary (Ovarium)", "Uterine tube (Tuba uterina)", "Uterus", "Vagina", "Vulva", "Placenta"),
+    ("Pituitary gland (Hypophysis)", "Pineal gland", "Thyroid gland", "Parathyroid gland", "Adrenal gland (Suprarenal gland)"),
+    ("Thymus", "Lymph node", "Spleen (Lien)", "Tonsil (Tonsilla)", "Bone marrow (Medulla ossium)"),
+    ("Eye (Oculus)", "Ear (Auris)", "Skin (Cutis)", "Mammary gland"),
+)
+STANDARD_ORGANS = frozenset(organ for group in STANDARD_ORGAN_GROUPS for organ in group)
+_STANDARD_ORGAN_LIST = "\n".join("- " + ", ".join(group) for group in STANDARD_ORGAN_GROUPS)
+
+# Step 1 静态指令部分 (不随报告变化)，作为system消息发送以命中服务端前缀缓存
+STEP1_SYSTEM_PROMPT = """You are a medical text analysis expert. Your task is to extract ALL DESCRIPTIVE CONTENT from medical reports, including patient symptoms, examination findings, laboratory/test measurements, and clinical signs, while STRICTLY EXCLUDING diagnostic judgments.
 
 EXPANDED DEFINITION AND FULL-DOCUMENT SWEEP:
 1) Expanded definition of a valid symptom/sign:
@@ -77,40 +87,36 @@ EXTRACTION PRINCIPLES:
    - Use exact language from the source
    - Include measurements, locations, qualifiers when present
 
-TASK: Extract all descriptive content from the following medical text:
-
-{text_content}
-
 OUTPUT FORMAT:
 Return a JSON object exactly like this:
-{{
+{
     "descriptive_findings": [
-        {{
+        {
             "finding_text": "exact descriptive text from original",
             "finding_type": "patient_symptom|examination_finding|lab_result|clinical_sign",
             "source_quote": "exact sentence/phrase from text",
             "body_system": "cardiovascular|respiratory|gastrointestinal|neurological|genitourinary|musculoskeletal|endocrine|neonatal|other",
             "extraction_confidence": "high|medium|low"
-        }}
+        }
     ],
     "excluded_content": [
-        {{
+        {
             "excluded_text": "diagnostic/judgmental content that was excluded",
             "exclusion_reason": "disease_name|diagnostic_conclusion|medical_judgment|treatment_plan",
             "source_quote": "exact sentence where this was found"
-        }}
+        }
     ],
-    "extraction_summary": {{
+    "extraction_summary": {
         "total_findings": "number of descriptive findings extracted",
-        "findings_by_type": {{
+        "findings_by_type": {
             "patient_symptoms": "count",
             "examination_findings": "count",
             "lab_results": "count",
             "clinical_signs": "count"
-        }},
+        },
         "excluded_items": "number of diagnostic items excluded"
-    }}
-}}
+    }
+}
 
 ENHANCED EXAMPLES (including neonatal/pediatric):
 - "grunting, flaring and retracting noted in the delivery room"
@@ -123,13 +129,10 @@ ENHANCED EXAMPLES (including neonatal/pediatric):
 PRIORITY: Comprehensive extraction of descriptive content while strictly excluding diagnostic judgments.
 """
 
-    @staticmethod 
-    def get_step2_diagnosis_organ_extraction_prompt(text_content: str) -> str:
-        """
-        第二步：从医生建议或诊断中提取器官信息
-        """
-        return """
-You are a medical text analysis expert. Your task is to extract ORGAN information from physician diagnoses, recommendations, or medical assessments.
+STEP1_USER_TEMPLATE = "TASK: Extract all descriptive content from the following medical text:\n\n{text_content}\n"
+
+# Step 2 静态指令部分
+STEP2_SYSTEM_PROMPT = """You are a medical text analysis expert. Your task is to extract ORGAN information from physician diagnoses, recommendations, or medical assessments.
 
 **STEP 2: ORGAN EXTRACTION FROM MEDICAL DIAGNOSES**
 
@@ -162,37 +165,26 @@ You are a medical text analysis expert. Your task is to extract ORGAN informatio
 
 **IMPORTANT: Use Standard Medical Terminology**
 You MUST use ONLY the following standard organ names in your output:
-- Brain, Cerebellum, Brainstem, Diencephalon, Spinal cord (Medulla spinalis)
-- Heart (Cor), Artery (Arteria), Vena (Vena), Capillary (Vas capillare)
-- Nose (Nasus), Pharynx, Larynx, Trachea, Bronchus, Lung (Pulmo)
-- Mouth (Oral cavity), Tongue (Lingua), Teeth (Dentes), Salivary glands
-- Esophagus, Stomach (Gaster), Small intestine (Intestinum tenue), Large intestine (Intestinum crassum)
-- Liver (Hepar), Gallbladder (Vesica biliaris), Pancreas, Mesentery
-- Kidney (Ren), Ureter, Urinary bladder (Vesica urinaria), Urethra
-- Testis, Epididymis, Prostate, Penis
-- Ovary (Ovarium), Uterine tube (Tuba uterina), Uterus, Vagina, Vulva, Placenta
-- Pituitary gland (Hypophysis), Pineal gland, Thyroid gland, Parathyroid gland, Adrenal gland (Suprarenal gland)
-- Thymus, Lymph node, Spleen (Lien), Tonsil (Tonsilla), Bone marrow (Medulla ossium)
-- Eye (Oculus), Ear (Auris), Skin (Cutis), Mammary gland
+ORGAN_LIST_PLACEHOLDER
 
 **Output Format**:
 Return a JSON object with the following structure:
-{{
+{
     "diagnostic_sections": [
-        {{
+        {
             "section_type": "type of diagnostic section",
             "original_text": "exact text from the diagnostic section",
             "mentioned_organs": [
-                {{
+                {
                     "organ_name": "standard organ name from the list above",
                     "context": "how the organ was mentioned in diagnosis",
                     "supporting_text": "exact phrase mentioning the organ"
-                }}
+                }
             ]
-        }}
+        }
     ],
     "all_organs_identified": ["list of all unique standard organ names found in diagnoses"]
-}}
+}
 
 **Organ Extraction Rules**:
 - Extract organs ONLY from physician diagnoses/assessments, not patient complaints
@@ -212,33 +204,49 @@ Return a JSON object with the following structure:
 If diagnostic text contains: "Assessment: Acute myocardial infarction. Plan: Cardiac catheterization to evaluate coronary arteries..."
 
 Extract:
-- mentioned_organs: [{{"organ_name": "Heart (Cor)", "context": "myocardial infarction", "supporting_text": "Acute myocardial infarction"}}]
+- mentioned_organs: [{"organ_name": "Heart (Cor)", "context": "myocardial infarction", "supporting_text": "Acute myocardial infarction"}]
 
-Extract organ information from physician diagnoses in the following medical report:
+""".replace("ORGAN_LIST_PLACEHOLDER", _STANDARD_ORGAN_LIST)
 
-{text_content}
+STEP2_USER_TEMPLATE = "Extract organ information from physician diagnoses in the following medical report:\n\n{text_content}\n"
+
+# 多分块合并请求：追加在system提示词之后的输出格式说明，user消息中各分块以"### CHUNK n"分隔
+MULTI_CHUNK_INSTRUCTION = """
+
+MULTIPLE CHUNKS: The user message may contain several numbered chunks, each starting with a "### CHUNK <n>" header.
+Process every chunk independently, exactly as described above, and return ONLY a JSON array with one object per chunk in the same order.
+Each object must contain "chunk_id" (the chunk number) plus the JSON fields described above, e.g. [{"chunk_id": 1, ...}, {"chunk_id": 2, ...}].
 """
 
-    @staticmethod
-    def get_step3_anatomical_mapping_prompt(patient_symptoms, diagnosed_organs, original_text) -> str:
-        """
-        第三步：基于症状和器官确定具体解剖部位
-        """
-        # Import ELSE_STRUCT for additional organs
-        from configs.model_config import ORGAN_ANATOMY_STRUCTURE, ELSE_STRUCT
-        
-        structure_string = ""
-        # Add main organs from ORGAN_ANATOMY_STRUCTURE
-        for organ, parts in ORGAN_ANATOMY_STRUCTURE.items():
-            structure_string += f"\n- {organ}:\n"
-            structure_string += "  " + ", ".join(f'"{part}"' for part in parts) + "\n"
-        
-        # Add other organs from ELSE_STRUCT
-        for organ, parts in ELSE_STRUCT.items():
-            structure_string += f"\n- {organ}:\n"
-            structure_string += "  " + ", ".join(f'"{part}"' for part in parts) + "\n"
-
-        prompt = """
+STEP1_BATCH_SYSTEM_PROMPT = STEP1_SYSTEM_PROMPT + MULTI_CHUNK_INSTRUCTION
+STEP2_BATCH_SYSTEM_PROMPT = STEP2_SYSTEM_PROMPT + MULTI_CHUNK_INSTRUCTION
+STEP1_BATCH_USER_HEADER = "TASK: Extract all descriptive content from each of the following medical text chunks:\n\n"
+STEP2_BATCH_USER_HEADER = "Extract organ information from physician diagnoses in each of the following medical report chunks:\n\n"
+
+# 步骤1+步骤2融合请求：两段静态指令合并为一个system提示词，响应同时包含两步的JSON结构
+COMBINED_STEP1_STEP2_SYSTEM_PROMPT = (
+    "You will perform TWO independent tasks on one medical report and return both results in a single JSON object.\n\n"
+    "=== TASK A (applies to the PATIENT SECTIONS of the user message) ===\n"
+    + STEP1_SYSTEM_PROMPT
+    + "\n=== TASK B (applies to the PHYSICIAN SECTIONS of the user message) ===\n"
+    + STEP2_SYSTEM_PROMPT
+    + """
+COMBINED OUTPUT: Return ONLY one JSON object of the form {"step1": <TASK A JSON object>, "step2": <TASK B JSON object>}.
+Each value must follow the output format of its task exactly. Use the empty structure of a task if it has no findings.
+"""
+)
+COMBINED_STEP1_STEP2_USER_TEMPLATE = (
+    "TASK A: Extract all descriptive content from the PATIENT SECTIONS.\n"
+    "TASK B: Extract organ information from physician diagnoses in the PHYSICIAN SECTIONS.\n\n"
+    "### PATIENT SECTIONS\n{patient_content}\n\n### PHYSICIAN SECTIONS\n{physician_content}\n"
+)
+
+def _marshal_chunks(chunk_texts: List[str]) -> str:
+    """将多个分块拼接为带编号分隔符的文本"""
+    return "\n\n".join(f"### CHUNK {n}\n{text}" for n, text in enumerate(chunk_texts, 1)) + "\n"
+
+# Step 3 静态指令部分 (导入时填入标准器官列表和器官结构参考)
+STEP3_PROMPT_TEMPLATE = """
 You are a medical anatomy expert. Your task is to map identified symptoms and diagnosed organs to specific anatomical locations.
 
 **STEP 3: ANATOMICAL LOCATION MAPPING**
@@ -258,18 +266,7 @@ You are a medical anatomy expert. Your task is to map identified symptoms and di
 
 **IMPORTANT: Use Standard Medical Terminology**
 All organ names must be from the standard list:
-- Brain, Cerebellum, Brainstem, Diencephalon, Spinal cord (Medulla spinalis)
-- Heart (Cor), Artery (Arteria), Vena (Vena), Capillary (Vas capillare)
-- Nose (Nasus), Pharynx, Larynx, Trachea, Bronchus, Lung (Pulmo)
-- Mouth (Oral cavity), Tongue (Lingua), Teeth (Dentes), Salivary glands
-- Esophagus, Stomach (Gaster), Small intestine (Intestinum tenue), Large intestine (Intestinum crassum)
-- Liver (Hepar), Gallbladder (Vesica biliaris), Pancreas, Mesentery
-- Kidney (Ren), Ureter, Urinary bladder (Vesica urinaria), Urethra
-- Testis, Epididymis, Prostate, Penis
-- Ovary (Ovarium), Uterine tube (Tuba uterina), Uterus, Vagina, Vulva, Placenta
-- Pituitary gland (Hypophysis), Pineal gland, Thyroid gland, Parathyroid gland, Adrenal gland (Suprarenal gland)
-- Thymus, Lymph node, Spleen (Lien), Tonsil (Tonsilla), Bone marrow (Medulla ossium)
-- Eye (Oculus), Ear (Auris), Skin (Cutis), Mammary gland
+ORGAN_LIST_PLACEHOLDER
 
 **Anatomical Structure Reference**:
 For the following organs, you MUST choose from these exact anatomical structures:
@@ -321,38 +318,25 @@ Anatomical Locations: ["Left Ventricle (LV)", "Aortic Valve", "Left Ventricular
 
 Map symptoms to anatomical locations using the following information:
 
-**Patient Symptoms**: PATIENT_SYMPTOMS_PLACEHOLDER
-**Diagnosed Organs**: DIAGNOSED_ORGANS_PLACEHOLDER
-**Original Medical Text**: ORIGINAL_TEXT_PLACEHOLDER
-
 """
-        
-        # 替换占位符
-        prompt = prompt.replace("STRUCTURE_PLACEHOLDER", structure_string)
-        prompt = prompt.replace("PATIENT_SYMPTOMS_PLACEHOLDER", str(patient_symptoms))
-        prompt = prompt.replace("DIAGNOSED_ORGANS_PLACEHOLDER", str(diagnosed_organs))
-        prompt = prompt.replace("ORIGINAL_TEXT_PLACEHOLDER", original_text[:2000] + "..." if len(original_text) > 2000 else original_text)
-        
-        return prompt
 
-    @staticmethod
-    def get_integrated_diagnostic_prompt(text_content: str) -> str:
-        """
-        Integrated diagnostic distillation prompt — English only, with chief symptom inference
-        """
-        # Import ELSE_STRUCT for additional organs
-        from configs.model_config import ORGAN_ANATOMY_STRUCTURE, ELSE_STRUCT
-        
-        structure_string = ""
-        for organ, parts in ORGAN_ANATOMY_STRUCTURE.items():
-            structure_string += f"\n- {organ}:\n"
-            structure_string += "  " + ", ".join(f'"{part}"' for part in parts) + "\n"
-        for organ, parts in ELSE_STRUCT.items():
-            structure_string += f"\n- {organ}:\n"
-            structure_string += "  " + ", ".join(f'"{part}"' for part in parts) + "\n"
-        
-        prompt = f"""
-You are a medical text analysis expert specializing in diagnostic information extraction. Perform a comprehensive, single-pass analysis and output results in a strict JSON format.
+# Step 3 只附带报告开头的一段原文作为参考 (按字符截断，同一报告的截断结果始终相同，不影响前缀缓存)
+STEP3_MAX_TEXT_CHARS = 2000
+
+# 器官 -> 解剖结构参考列表 (ORGAN_ANATOMY_STRUCTURE + ELSE_STRUCT)，导入时构建一次
+_STRUCTURE_STRING = "".join(
+    f"\n- {organ}:\n  " + ", ".join(f'"{part}"' for part in parts) + "\n"
+    for structure in (ORGAN_ANATOMY_STRUCTURE, ELSE_STRUCT)
+    for organ, parts in structure.items()
+)
+
+# Step 3 提示词中与报告无关的部分
+STEP3_SYSTEM_PROMPT = STEP3_PROMPT_TEMPLATE.replace("ORGAN_LIST_PLACEHOLDER", _STANDARD_ORGAN_LIST).replace(
+    "STRUCTURE_PLACEHOLDER", _STRUCTURE_STRING
+)
+
+# 整合提示词的静态部分 (不含报告文本)
+INTEGRATED_SYSTEM_PROMPT = f"""You are a medical text analysis expert specializing in diagnostic information extraction. Perform a comprehensive, single-pass analysis and output results in a strict JSON format.
 
 CHIEF SYMPTOM INFERENCE (TOP PRIORITY):
 1) Before mapping anything, infer the dominant clinical problem of this report.
@@ -365,21 +349,10 @@ CRITICAL DISTINCTION: Symptom vs. Diagnosis for s_symptom
 - Diagnosis (for d_diagnosis): the medical label explaining the symptom (e.g., "myocardial infarction", "pneumonia", "hyaline membrane disease").
 
 STANDARD ORGAN TERMINOLOGY (whitelist only):
-- Brain, Cerebellum, Brainstem, Diencephalon, Spinal cord (Medulla spinalis)
-- Heart (Cor), Artery (Arteria), Vena (Vena), Capillary (Vas capillare)
-- Nose (Nasus), Pharynx, Larynx, Trachea, Bronchus, Lung (Pulmo)
-- Mouth (Oral cavity), Tongue (Lingua), Teeth (Dentes), Salivary glands
-- Esophagus, Stomach (Gaster), Small intestine (Intestinum tenue), Large intestine (Intestinum crassum)
-- Liver (Hepar), Gallbladder (Vesica biliaris), Pancreas, Mesentery
-- Kidney (Ren), Ureter, Urinary bladder (Vesica urinaria), Urethra
-- Testis, Epididymis, Prostate, Penis
-- Ovary (Ovarium), Uterine tube (Tuba uterina), Uterus, Vagina, Vulva, Placenta
-- Pituitary gland (Hypophysis), Pineal gland, Thyroid gland, Parathyroid gland, Adrenal gland (Suprarenal gland)
-- Thymus, Lymph node, Spleen (Lien), Tonsil (Tonsilla), Bone marrow (Medulla ossium)
-- Eye (Oculus), Ear (Auris), Skin (Cutis), Mammary gland
+{_STANDARD_ORGAN_LIST}
 
 ANATOMICAL STRUCTURE REFERENCE (use only these exact structures for organs):
-{structure_string}
+{_STRUCTURE_STRING}
 
 OUTPUT FORMAT REQUIREMENTS:
 Return a JSON array of objects in the form:
@@ -414,34 +387,131 @@ RULES:
 4) Anatomical Locations: At least 2 locations; use predefined structures for the selected organ.
 5) Dominant Symptom Inference: If the report is disorganized and explicit symptoms are sparse, infer a dominant symptom/sign that best captures the clinical picture (e.g., "respiratory distress in newborn"), grounded in the provided text.
 
-Analyze the following medical text and produce the output:
-
-{text_content}
 """
-        
-        return prompt
 
-def get_prompt_by_step(step: int) -> str:
-    """根据步骤获取对应的提示词"""
-    prompts = {
-        1: DiagnosticExtractionPrompts.get_step1_comprehensive_descriptive_extraction_prompt,
-        2: DiagnosticExtractionPrompts.get_step2_diagnosis_organ_extraction_prompt, 
-        3: DiagnosticExtractionPrompts.get_step3_anatomical_mapping_prompt,
-        "integrated": DiagnosticExtractionPrompts.get_integrated_diagnostic_prompt
-    }
+class DiagnosticExtractionPrompts:
+    """诊断蒸馏提示词系统"""
     
-    if step in prompts:
-        return prompts[step]()
-    else:
-        return DiagnosticExtractionPrompts.get_integrated_diagnostic_prompt()
+    @staticmethod
+    def get_step1_prompt_parts(text_content: str) -> Tuple[str, str]:
+        """
+        Step 1: 拆分为 (静态system提示词, 报告相关的user提示词)
+        """
+        return STEP1_SYSTEM_PROMPT, STEP1_USER_TEMPLATE.format(text_content=text_content)
+
+    @staticmethod
+    def get_step1_batch_prompt_parts(chunk_texts: List[str]) -> Tuple[str, str]:
+        """
+        Step 1: 多个分块合并为一次请求的 (system, user) 提示词，响应为按chunk_id编号的JSON数组
+        """
+        return STEP1_BATCH_SYSTEM_PROMPT, STEP1_BATCH_USER_HEADER + _marshal_chunks(chunk_texts)
+
+    @staticmethod
+    def get_step1_comprehensive_descriptive_extraction_prompt(text_content: str) -> str:
+        """
+        Step 1: Comprehensive descriptive content extraction (symptoms, exam findings, clinical signs) — English only
+        """
+        system_prompt, user_prompt = DiagnosticExtractionPrompts.get_step1_prompt_parts(text_content)
+        return system_prompt + "\n" + user_prompt
+
+    @staticmethod
+    def get_step2_prompt_parts(text_content: str) -> Tuple[str, str]:
+        """
+        第二步：拆分为 (静态system提示词, 报告相关的user提示词)
+        """
+        return STEP2_SYSTEM_PROMPT, STEP2_USER_TEMPLATE.format(text_content=text_content)
+
+    @staticmethod
+    def get_step2_batch_prompt_parts(chunk_texts: List[str]) -> Tuple[str, str]:
+        """
+        第二步：多个分块合并为一次请求的 (system, user) 提示词，响应为按chunk_id编号的JSON数组
+        """
+        return STEP2_BATCH_SYSTEM_PROMPT, STEP2_BATCH_USER_HEADER + _marshal_chunks(chunk_texts)
+
+    @staticmethod
+    def get_step1_plus_step2_combined_prompt_parts(patient_texts: List[str], physician_texts: List[str]) -> Tuple[str, str]:
+        """
+        步骤1+步骤2融合：患者陈述块和医生诊断块放入一次请求，响应为 {"step1": {...}, "step2": {...}}
+        """
+        return COMBINED_STEP1_STEP2_SYSTEM_PROMPT, COMBINED_STEP1_STEP2_USER_TEMPLATE.format(
+            patient_content="\n\n".join(patient_texts),
+            physician_content="\n\n".join(physician_texts)
+        )
+
+    @staticmethod 
+    def get_step2_diagnosis_organ_extraction_prompt(text_content: str) -> str:
+        """
+        第二步：从医生建议或诊断中提取器官信息
+        """
+        system_prompt, user_prompt = DiagnosticExtractionPrompts.get_step2_prompt_parts(text_content)
+        return system_prompt + user_prompt
+
+    @staticmethod
+    def get_step3_prompt_parts(patient_symptoms, diagnosed_organs, original_text) -> Tuple[str, str]:
+        """
+        第三步：拆分为 (静态system提示词, 报告相关的user提示词)
+        静态指令只构建一次，报告相关内容一次拼接
+        """
+        if len(original_text) > STEP3_MAX_TEXT_CHARS:
+            original_text = original_text[:STEP3_MAX_TEXT_CHARS] + "..."
+        return STEP3_SYSTEM_PROMPT, (
+            f"**Patient Symptoms**: {patient_symptoms}\n"
+            f"**Diagnosed Organs**: {diagnosed_organs}\n"
+            f"**Original Medical Text**: {original_text}\n\n"
+        )
+
+    @staticmethod
+    def get_step3_anatomical_mapping_prompt(patient_symptoms, diagnosed_organs, original_text) -> str:
+        """
+        第三步：基于症状和器官确定具体解剖部位
+        """
+        system_prompt, user_prompt = DiagnosticExtractionPrompts.get_step3_prompt_parts(
+            patient_symptoms, diagnosed_organs, original_text
+        )
+        return system_prompt + user_prompt
+
+    @staticmethod
+    def get_integrated_system_prompt() -> str:
+        """
+        整合提示词的静态部分 (不含报告文本)
+        """
+        return INTEGRATED_SYSTEM_PROMPT
+
+    @staticmethod
+    def get_integrated_prompt_parts(text_content: str) -> Tuple[str, str]:
+        """
+        整合提示词：拆分为 (静态system提示词, 报告相关的user提示词)
+        """
+        user_prompt = f"Analyze the following medical text and produce the output:\n\n{text_content}\n"
+        return DiagnosticExtractionPrompts.get_integrated_system_prompt(), user_prompt
+
+    @staticmethod
+    def get_integrated_diagnostic_prompt(text_content: str) -> str:
+        """
+        Integrated diagnostic distillation prompt — English only, with chief symptom inference
+        """
+        system_prompt, user_prompt = DiagnosticExtractionPrompts.get_integrated_prompt_parts(text_content)
+        return system_prompt + user_prompt
+
+# 各步骤的静态提示词 (模块级常量，按需取用时不再重新构建)
+_STEP_SYSTEM_PROMPTS = {
+    1: STEP1_SYSTEM_PROMPT,
+    2: STEP2_SYSTEM_PROMPT,
+    3: STEP3_SYSTEM_PROMPT,
+    "integrated": INTEGRATED_SYSTEM_PROMPT
+}
+
+def get_prompt_by_step(step: int) -> str:
+    """根据步骤获取对应的静态提示词 (不含报告文本)；未知步骤返回整合提示词"""
+    return _STEP_SYSTEM_PROMPTS.get(step, INTEGRATED_SYSTEM_PROMPT)
 
 def create_diagnostic_pipeline() -> Dict[str, str]:
-    """创建完整的诊断提取流程提示词"""
+    """创建完整的诊断提取流程提示词 (直接引用已构建的静态提示词)"""
     return {
-        "step1_complaints": DiagnosticExtractionPrompts.get_step1_comprehensive_descriptive_extraction_prompt(),
-        "step2_diagnoses": DiagnosticExtractionPrompts.get_step2_diagnosis_organ_extraction_prompt(),
-        "step3_anatomical": DiagnosticExtractionPrompts.get_step3_anatomical_mapping_prompt(),
-        "integrated": DiagnosticExtractionPrompts.get_integrated_diagnostic_prompt()
+        "step1_complaints": STEP1_SYSTEM_PROMPT,
+        "step2_diagnoses": STEP2_SYSTEM_PROMPT,
+        "step3_anatomical": STEP3_SYSTEM_PROMPT,
+        "integrated": INTEGRATED_SYSTEM_PROMPT
     }
 
 # 保留原有类以维持兼容性，但标记为废弃
@@ -9,19 +9,43 @@ import os
 import sys
 import json
 import time
+import functools
 from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+try:
+    import orjson
+    _json_loads = orjson.loads  # 直接解析bytes
+except ImportError:
+    _json_loads = json.loads
 
 # 添加项目根目录到Python路径
 project_root = "/opt/RAG_Evidence4Organ"
 sys.path.insert(0, project_root)
 
-from Question_Distillation_v2.extractors.llm_extractor import LLMExtractor
+from Diag_Distillation.extractors.llm_extractor import LLMExtractor
 from Diag_Distillation.prompts.medical_prompts import DiagnosticExtractionPrompts
-from Diag_Distillation.process_worker import process_report_with_diagnostic_steps
+from Diag_Distillation.process_worker import process_report_with_diagnostic_steps, process_report_with_integrated_prompt
+from Diag_Distillation.processors.result_writer import dumps_json
 from configs.system_config import MULTI_API_CONFIG
 
-def test_single_report(report_num: int, api_key: str = "api_16"):
-    """测试单个报告处理"""
+DATASET_DIR = "/opt/RAG_Evidence4Organ/dataset"
+TEST_OUTPUT_DIR = Path("/opt/RAG_Evidence4Organ/Diag_Distillation/test_single")
+
+@functools.lru_cache(maxsize=1)
+def _dataset_index(dataset_dir: str) -> Dict[str, str]:
+    """数据集目录中的文件名 -> 路径 (每个进程只扫描一次目录，查找报告文件不再逐个stat)"""
+    with os.scandir(dataset_dir) as entries:
+        return {entry.name: entry.path for entry in entries if entry.is_file()}
+
+def test_single_report(report_num: int, api_key: str = "api_16", pipeline: str = "integrated"):
+    """
+    测试单个报告处理
+    
+    Args:
+        pipeline: integrated (整合提示词，一次请求) 或 steps (三步法，用于调试各步骤)
+    """
     
     print(f"🏥 测试报告 {report_num}")
     print("=" * 60)
@@ -35,22 +59,27 @@ def test_single_report(report_num: int, api_key: str = "api_16"):
         extractor = LLMExtractor(
             model=api_config["model"],
             api_key=api_config["api_key"],
-            base_url=api_config["base_url"]
+            base_url=api_config["base_url"],
+            # 静态system提示词在前、报告文本在后；需要显式缓存断点的服务在API配置中开启cache_control
+            config={
+                "cache_control": api_config.get("cache_control", False),
+                "json_mode": api_config.get("json_mode", True),
+            }
         )
         print(f"✅ API初始化成功: {api_key}")
         
         # 加载报告
-        dataset_dir = "/opt/RAG_Evidence4Organ/dataset"
-        txt_file = os.path.join(dataset_dir, f"report_{report_num}.txt")
-        json_file = os.path.join(dataset_dir, f"report_{report_num}.json")
+        dataset_index = _dataset_index(DATASET_DIR)
+        txt_file = dataset_index.get(f"report_{report_num}.txt")
+        json_file = dataset_index.get(f"report_{report_num}.json")
         
-        if os.path.exists(txt_file):
+        if txt_file:
             with open(txt_file, 'r', encoding='utf-8') as f:
                 report_text = f.read()
             print(f"✅ 加载txt文件: {txt_file}")
-        elif os.path.exists(json_file):
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        elif json_file:
+            with open(json_file, 'rb') as f:
+                data = _json_loads(f.read())
                 report_text = data.get('text', '') or data.get('medical_record_content', '')
             print(f"✅ 加载json文件: {json_file}")
         else:
@@ -72,9 +101,8 @@ def test_single_report(report_num: int, api_key: str = "api_16"):
         start_time = time.time()
         print("\n🚀 开始处理...")
         
-        result = process_report_with_diagnostic_steps(
-            extractor, report_data, report_num, prompts, api_key
-        )
+        process = process_report_with_integrated_prompt if pipeline == "integrated" else process_report_with_diagnostic_steps
+        result = process(extractor, report_data, report_num, prompts, api_key)
         
         processing_time = time.time() - start_time
         
@@ -93,16 +121,18 @@ def test_single_report(report_num: int, api_key: str = "api_16"):
             
             if normalized:
                 total_units = sum(len(item.get('U_unit_set', [])) for item in normalized if isinstance(item, dict))
+                u_units = (
+                    unit_wrapper.get('u_unit', {})
+                    for item in normalized if isinstance(item, dict)
+                    for unit_wrapper in item.get('U_unit_set', []) if isinstance(unit_wrapper, dict)
+                )
+                # 统计所有非空的器官名称 (不按提示词中的标准器官列表过滤)，set.update一次完成去重
                 unique_organs = set()
-                for item in normalized:
-                    if isinstance(item, dict):
-                        for unit_wrapper in item.get('U_unit_set', []):
-                            if isinstance(unit_wrapper, dict):
-                                u_unit = unit_wrapper.get('u_unit', {})
-                                if isinstance(u_unit, dict):
-                                    organ_name = u_unit.get('o_organ', {}).get('organName')
-                                    if organ_name:
-                                        unique_organs.add(organ_name)
+                unique_organs.update(
+                    organ_name
+                    for u_unit in u_units if isinstance(u_unit, dict)
+                    for organ_name in (u_unit.get('o_organ', {}).get('organName'),) if organ_name
+                )
                 
                 print(f"   🧬 诊断单元总数: {total_units}")
                 print(f"   🫀 涉及器官数: {len(unique_organs)}")
@@ -123,16 +153,13 @@ def test_single_report(report_num: int, api_key: str = "api_16"):
             print(f"   📄 内容: {normalized}")
         
         # 保存结果到测试目录
-        test_dir = "/opt/RAG_Evidence4Organ/Diag_Distillation/test_single"
-        os.makedirs(test_dir, exist_ok=True)
+        TEST_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
         
-        raw_file = f"{test_dir}/report_{report_num}_raw.json"
-        with open(raw_file, 'w', encoding='utf-8') as f:
-            json.dump(raw, f, ensure_ascii=False, indent=2)
+        raw_file = TEST_OUTPUT_DIR / f"report_{report_num}_raw.json"
+        raw_file.write_bytes(dumps_json(raw))
         
-        normalized_file = f"{test_dir}/report_{report_num}_normalized.json"
-        with open(normalized_file, 'w', encoding='utf-8') as f:
-            json.dump(normalized, f, ensure_ascii=False, indent=2)
+        normalized_file = TEST_OUTPUT_DIR / f"report_{report_num}_normalized.json"
+        normalized_file.write_bytes(dumps_json(normalized))
         
         print(f"\n💾 结果已保存:")
         print(f"   Raw: {raw_file}")
@@ -153,10 +180,12 @@ def main():
     parser = argparse.ArgumentParser(description='单报告测试')
     parser.add_argument('--report', type=int, default=10061, help='报告编号')
     parser.add_argument('--api', type=str, default='api_16', help='API密钥')
+    parser.add_argument('--pipeline', choices=['integrated', 'steps'], default='integrated',
+                        help='提取流程：integrated为整合提示词单次请求，steps为三步法 (调试用)')
     
     args = parser.parse_args()
     
-    success = test_single_report(args.report, args.api)
+    success = test_single_report(args.report, args.api, args.pipeline)
     
     if success:
         print("\n✅ 测试成功完成！")
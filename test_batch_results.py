@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试Batch API结果文件的读取
+"""
+
+import sys
+import json
+sys.path.append('/opt/RAG_Evidence4Organ')
+
+from Diag_Distillation.extractors.llm_extractor import LLMExtractor
+
+class _FakeResponse:
+    def __init__(self, content: bytes):
+        self.content = content
+    
+    def raise_for_status(self):
+        pass
+
+class _FakeHTTP:
+    """按文件ID返回JSONL内容的HTTP客户端替身"""
+    def __init__(self, files):
+        self.files = files
+    
+    def get(self, url, headers=None, timeout=None):
+        file_id = url.split("/files/")[1].split("/")[0]
+        return _FakeResponse(b"\n".join(json.dumps(line).encode("utf-8") for line in self.files[file_id]))
+
+def _reply(custom_id, content):
+    return {"custom_id": custom_id, "response": {"status_code": 200, "body": {
+        "choices": [{"message": {"content": content}}], "usage": {"total_tokens": 10}}}}
+
+def test_batch_results_cover_errors_and_partial_output():
+    """过期批次的部分输出照常读取，错误文件中的请求返回失败结果，未执行的请求不在结果中"""
+    extractor = LLMExtractor(model="test-model", api_key="sk-test", base_url="http://localhost")
+    extractor.http = _FakeHTTP({
+        "out": [_reply("report_1", "[]"),
+                {"custom_id": "report_2", "response": {"status_code": 500, "body": {"error": {"message": "server"}}}}],
+        "err": [{"custom_id": "report_3", "response": None, "error": {"code": "invalid", "message": "bad request"}}],
+    })
+    results = extractor.fetch_batch_results({"status": "expired", "output_file_id": "out", "error_file_id": "err"})
+    assert results["report_1"]["success"] and results["report_1"]["response"] == "[]"
+    assert not results["report_2"]["success"] and "server" in results["report_2"]["error"]
+    assert not results["report_3"]["success"] and "bad request" in results["report_3"]["error"]
+    assert "report_4" not in results
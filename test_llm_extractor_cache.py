@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试LLMExtractor的结果缓存和API响应缓存
+"""
+
+import sys
+sys.path.append('/opt/RAG_Evidence4Organ')
+
+from Diag_Distillation.extractors.llm_extractor import LLMExtractor
+
+def _make_extractor(**config):
+    """创建不连接磁盘缓存的提取器 (测试之间互不影响)"""
+    extractor = LLMExtractor(model="test-model", api_key="sk-test", base_url="http://localhost",
+                             config=config or None)
+    extractor._disk_cache = None
+    return extractor
+
+def _fake_call_api(calls, success=True):
+    """记录调用次数的call_api替身"""
+    def call_api(*args, **kwargs):
+        calls.append(args)
+        if not success:
+            return {"success": False, "error": "timeout", "response": None}
+        return {"success": True, "response": '{"extractions": []}', "usage": {}, "model": "test-model"}
+    return call_api
+
+def test_extraction_cache_hits_same_text():
+    """相同模型、专科和文本只请求一次，命中时返回带当前case_id的副本"""
+    extractor = _make_extractor()
+    calls = []
+    extractor.call_api = _fake_call_api(calls)
+    
+    first = extractor.extract_medical_info("胸痛三天", case_id="case_1")
+    second = extractor.extract_medical_info("胸痛三天", case_id="case_2")
+    assert len(calls) == 1
+    assert first["case_id"] == "case_1" and second["case_id"] == "case_2"
+    
+    second["extractions"].append("modified")
+    assert extractor.extract_medical_info("胸痛三天", case_id="case_3")["extractions"] == first["extractions"]
+
+def test_extraction_cache_key_and_bypass():
+    """不同专科重新请求；use_cache=False绕过缓存"""
+    extractor = _make_extractor()
+    calls = []
+    extractor.call_api = _fake_call_api(calls)
+    
+    extractor.extract_medical_info("胸痛三天", specialty="general")
+    extractor.extract_medical_info("胸痛三天", specialty="cardiology")
+    extractor.extract_medical_info("胸痛三天", specialty="general", use_cache=False)
+    assert len(calls) == 3
+
+def test_extraction_cache_skips_failures():
+    """失败的结果不写入缓存"""
+    extractor = _make_extractor()
+    calls = []
+    extractor.call_api = _fake_call_api(calls, success=False)
+    
+    assert not extractor.extract_medical_info("胸痛三天")["success"]
+    extractor.extract_medical_info("胸痛三天")
+    assert len(calls) == 2
+
+def test_refresh_cache_skips_disk_tier():
+    """refresh_cache (--force) 时不读取磁盘缓存，新结果仍写入"""
+    extractor = _make_extractor(refresh_cache=True)
+    disk = {}
+    extractor._disk_cache = type("Disk", (), {
+        "get": lambda self, key: disk.get(key),
+        "set": lambda self, key, value, expire=None: disk.__setitem__(key, value),
+    })()
+    key = extractor._response_cache_key("p", "s")
+    disk[key] = {"success": True, "response": "stale"}
+    assert extractor._response_cache_get(key) is None
+    extractor._cache_set(key, {"success": True, "response": "fresh"})
+    assert disk[key]["response"] == "fresh"
+    assert extractor._response_cache_get(key)["response"] == "fresh"
+
+def test_response_cache_key_depends_on_json_mode():
+    """JSON模式与非JSON模式的响应不共用缓存键；关闭json_mode时不发送response_format，与不传相同"""
+    from Diag_Distillation.extractors.llm_extractor import JSON_OBJECT_FORMAT
+    
+    extractor = _make_extractor()
+    assert (extractor._response_cache_key("p", "s", JSON_OBJECT_FORMAT)
+            != extractor._response_cache_key("p", "s"))
+    plain = _make_extractor(json_mode=False)
+    assert plain._response_cache_key("p", "s", JSON_OBJECT_FORMAT) == plain._response_cache_key("p", "s")
+
+def test_disk_cache_is_opt_in(monkeypatch):
+    """未设置LLM_CACHE=1时不启用跨运行的磁盘缓存"""
+    monkeypatch.delenv("LLM_CACHE", raising=False)
+    extractor = LLMExtractor(model="test-model", api_key="sk-test", base_url="http://localhost")
+    assert extractor._disk_cache is None
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试LLM响应解析逻辑
+"""
+
+import sys
+sys.path.append('/opt/RAG_Evidence4Organ')
+
+from Diag_Distillation.process_worker import parse_integrated_response
+
+TWO_SYMPTOM_ARRAY = """[
+  {"s_symptom": "chest pain", "U_unit_set": [{"u_unit": {"d_diagnosis": "myocardial infarction",
+    "o_organ": {"organName": "Heart (Cor)", "anatomicalLocations": ["Left Ventricle", "Aorta"]}}}]},
+  {"s_symptom": "shortness of breath", "U_unit_set": [{"u_unit": {"d_diagnosis": "pneumonia",
+    "o_organ": {"organName": "Lung (Pulmo)", "anatomicalLocations": ["Upper lobe", "Bronchus"]}}}]}
+]"""
+
+def test_integrated_response_keeps_every_symptom():
+    """整合提示词返回多症状数组时原样保留全部条目"""
+    result = parse_integrated_response({"response": TWO_SYMPTOM_ARRAY}, "整合提示词")
+    assert [item["s_symptom"] for item in result] == ["chest pain", "shortness of breath"]
+    assert result[1]["U_unit_set"][0]["u_unit"]["o_organ"]["organName"] == "Lung (Pulmo)"
+
+def test_integrated_response_in_code_fence_with_prose():
+    """代码块和说明文字 (含 [1] 之类的非结果数组) 不影响数组解析"""
+    text = "Based on the report [1], the result is:\n```json\n" + TWO_SYMPTOM_ARRAY + "\n```\nDone."
+    assert len(parse_integrated_response(text, "整合提示词")) == 2
+    
+    text = "Based on the report [1], the result is:\n" + TWO_SYMPTOM_ARRAY
+    assert len(parse_integrated_response(text, "整合提示词")) == 2
+
+def test_integrated_response_single_object():
+    """单个 s 条目放入列表；其他单个对象包装为占位症状"""
+    entry = '{"s_symptom": "cough", "U_unit_set": []}'
+    assert parse_integrated_response(entry, "整合提示词") == [{"s_symptom": "cough", "U_unit_set": []}]
+    
+    unit = '{"d_diagnosis": "asthma"}'
+    assert parse_integrated_response(unit, "整合提示词") == [{
+        "s_symptom": "integrated_extraction",
+        "U_unit_set": [{"u_unit": {"d_diagnosis": "asthma"}}]
+    }]
+
+def test_integrated_response_invalid():
+    """没有JSON结果时返回None"""
+    assert parse_integrated_response("no json here [1]", "整合提示词") is None
+    assert parse_integrated_response("", "整合提示词") is None
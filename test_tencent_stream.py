@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试TencentExtractor流式响应的提前结束判断
+"""
+
+import sys
+import json
+sys.path.append('/opt/RAG_Evidence4Organ')
+
+from Diag_Distillation.extractors.tencent_extractor import TencentExtractor
+
+def _stream_events(parts, tail=""):
+    """把文本片段构造成SSE事件 (tail为闭合后服务端继续输出的内容，提前结束时不应被读取)"""
+    for part in list(parts) + ([tail] if tail else []):
+        yield {"data": json.dumps({"choices": [{"delta": {"content": part}}]})}
+    yield {"data": "[DONE]"}
+
+def test_stream_keeps_json_after_prose():
+    """说明文字中的 [1] 不触发提前结束，后面的JSON完整保留"""
+    parts = ["Based on the report [1], findings:\n", '[{"organ": "heart"}]']
+    content, _ = TencentExtractor._consume_stream(_stream_events(parts))
+    assert content == "".join(parts)
+
+def test_stream_object_response_not_truncated():
+    """对象响应读取到最外层 } 为止，不在内部数组闭合时截断"""
+    parts = ['{"extractions": [{"organ": "heart"}', '], "summary": "a ] b"}']
+    content, _ = TencentExtractor._consume_stream(_stream_events(parts, tail="\ntrailing text"))
+    assert content == "".join(parts)
+
+def test_stream_stops_after_fenced_array():
+    """代码块中的顶层数组闭合后立即停止接收"""
+    parts = ["``", "`json\n[", '{"organ": "lung"}]']
+    content, _ = TencentExtractor._consume_stream(_stream_events(parts, tail="\n```\nextra"))
+    assert content == "".join(parts)